@@ -1,16 +1,20 @@
 import streamlit as st
-import json
+from concurrent.futures import TimeoutError as FuturesTimeoutError, as_completed
 from pathlib import Path
 import sys
-from PIL import Image
 # add project root (one level up from this file) to sys.path so `utils` imports resolve
 ROOT = Path(__file__).resolve().parents[1]
 if str(ROOT) not in sys.path:
     sys.path.insert(0, str(ROOT))
 
 
-from utils.matching import load_breeds, top_k_matches
-from utils.normalize import normalize_for_folder
+from utils.match_cache import cached_top_k_matches
+from utils.incremental import IncrementalScorer
+from utils.snapshot import current_snapshot
+from utils.thumbnails import serving_path
+from utils.image_pack import PackCache, pack_stat
+from utils.image_loader import ImageLoader
+from utils import instrument
 
 # Import social post generator with fallback
 try:
@@ -24,72 +28,116 @@ except ImportError:
 # CONFIG: match this to where your images are stored
 # Use absolute paths based on ROOT to ensure they work on Streamlit Cloud
 IMAGES_DIR = ROOT / "data" / "images"
-MAPPING_FILE = ROOT / "data" / "breed_to_folder.json"
+# results: the top matches first, then pages of PAGE_SIZE behind "Show more"
+TOP_MATCHES = 3
+PAGE_SIZE = 12
+IMAGE_TIMEOUT = 10
 
 st.set_page_config(page_title="Dog Matchmaker", layout="wide")
 st.title("🐕 Dog Matchmaker — find your perfect pup")
 
-# load mapping
-if MAPPING_FILE.exists():
-    mapping = json.load(open(MAPPING_FILE, encoding="utf8"))
-else:
-    mapping = {}
+# compiled catalog (traits, mapping, resolved images); one read-only copy per process,
+# shared by all sessions. It is swapped for a rebuilt one in the background when
+# breed_traits.csv / breed_to_folder.json / images change; this run keeps the one it got.
+# Matching scores it directly (its precomputed trait matrix), so no dataframe is built.
+catalog = current_snapshot()
+# the images this run serves: the catalog version plus the image pack file's stat, so a
+# rebuilt pack (or a catalog reload) moves every image cache on to fresh bytes
+image_version = (catalog.version, pack_stat())
 
-# load breeds dataframe
-df = load_breeds(str(ROOT / 'data' / 'breed_traits.csv'))
+@st.cache_resource
+def get_pack_cache():
+    """Memory-mapped data/images.pack, shared by all sessions; reopened when rebuilt."""
+    return PackCache()
 
-def is_valid_image(img_path):
+@st.cache_resource(max_entries=2)  # current and previous image version
+def get_breed_images(_catalog, version):
     """
-    Check if a file is a valid image that can be opened by PIL.
-    Returns True if valid, False otherwise.
+    breed -> image of the breed (or None) for an image_version. Images come from
+    the packed image file when it has one for the folder (a memoryview into the pack),
+    otherwise from the image tree, using the pre-rendered card-width thumbnail when it
+    has been built.
     """
-    if not img_path or not img_path.exists():
-        return False
-    try:
-        # Try to open and verify the image
-        with Image.open(img_path) as img:
-            img.verify()  # Verify it's a valid image (this closes the file)
-        # Reopen for actual use (verify() closes the file)
-        with Image.open(img_path) as img:
-            img.load()  # Load the image data to ensure it's readable
-        return True
-    except Exception:
-        return False
+    pack = get_pack_cache().get(version[1])
+    images = {}
+    for breed in _catalog.breeds:
+        folder_name = _catalog.folders.get(breed)
+        packed = pack.folder_image(folder_name) if pack and folder_name else None
+        images[breed] = packed if packed is not None else serving_path(_catalog.image_path(breed, IMAGES_DIR))
+    return images
+
+@st.cache_resource
+def get_image_loader():
+    """Bounded thread pool reading card images, shared by all sessions."""
+    return ImageLoader()
 
 def get_first_image_for_breed(breed):
     """
-    Returns Path object of the first image for the given breed or None.
-    Uses data/breed_to_folder.json mapping, then normalization fallback.
+    Returns the first image for the given breed (Path, or memoryview of packed bytes) or None.
+    Folders are resolved when the snapshot is built: data/breed_to_folder.json mapping,
+    then normalization fallback.
     """
-    folder_name = mapping.get(breed)
-    if not folder_name:
-        folder_name = normalize_for_folder(breed)
-
-    folder_path = IMAGES_DIR / folder_name
-    if not folder_path.exists():
-        # try without ' dog'
-        alt = folder_name.replace(' dog','')
-        folder_path = IMAGES_DIR / alt
-        if not folder_path.exists():
-            return None
-
-    # Check for images with case-insensitive matching (Linux is case-sensitive)
-    # Try all case variations of common image extensions
-    extensions = ['*.jpg', '*.jpeg', '*.png', '*.JPG', '*.JPEG', '*.PNG', 
-                  '*.Jpg', '*.Jpeg', '*.Png', '*.JpG', '*.JpEg', '*.PnG']
-    for ext in extensions:
-        files = sorted(folder_path.glob(ext))
-        for file in files:
-            if is_valid_image(file):
-                return file
-    # Fallback: try to find any image file if exact patterns don't match
-    all_files = list(folder_path.iterdir())
-    image_files = [f for f in all_files if f.is_file() and 
-                   f.suffix.lower() in ['.jpg', '.jpeg', '.png']]
-    for file in sorted(image_files):
-        if is_valid_image(file):
-            return file
-    return None
+    with instrument.span('get_first_image_for_breed'):
+        image = get_breed_images(catalog, image_version).get(breed)
+    instrument.count('images_found' if image is not None else 'images_missing')
+    return image
+
+def show_more():
+    st.session_state['shown'] = st.session_state.get('shown', TOP_MATCHES) + PAGE_SIZE
+
+def render_card(col, row):
+    """Score and trait text of one match; returns the placeholder its image goes into."""
+    col.markdown(f"### {row['breed']}  — score {row['score']:.2f}")
+    slot = col.empty()
+    slot.caption("Loading image…")
+    # short bullets - show more characteristics
+    reasons = []
+    reasons.append(f"Energy: {row['energy']}/5")
+    reasons.append(f"Trainability: {row['trainability']}/5")
+    reasons.append(f"Good with kids: {row.get('good_with_kids',3)}/5")
+    if 'shedding' in row:
+        reasons.append(f"Shedding: {row['shedding']}/5")
+    if 'barking' in row:
+        reasons.append(f"Barking: {row['barking']}/5")
+    if 'playfulness' in row:
+        reasons.append(f"Playfulness: {row['playfulness']}/5")
+    col.write('\n'.join(f"- {r}" for r in reasons))
+    similar = catalog.similar(row['breed'], 3)
+    if similar:
+        col.caption("Similar breeds: " + ", ".join(similar))
+    return slot
+
+def fill_image(slot, future):
+    try:
+        image = future.result()
+    except Exception:
+        # If image fails to load, show placeholder instead of crashing
+        slot.write("_Image unavailable for this breed._")
+        return
+    if image is None:
+        slot.write("_No image found — check mapping for this breed._")
+    else:
+        # st.image needs bytes; for a packed image this is its only copy
+        slot.image(bytes(image) if isinstance(image, memoryview) else image, use_column_width=True)
+
+def fill_images(slots, futures):
+    """Put each card's image in as soon as it has loaded, whatever the order."""
+    waiting = {}
+    for slot, future in zip(slots, futures):
+        waiting.setdefault(future, []).append(slot)
+    try:
+        for future in as_completed(list(waiting), timeout=IMAGE_TIMEOUT):
+            for slot in waiting.pop(future):
+                fill_image(slot, future)
+    except FuturesTimeoutError:  # not the builtin TimeoutError before Python 3.11
+        for slots_left in waiting.values():
+            for slot in slots_left:
+                slot.write("_Image unavailable for this breed._")
+
+def load_images(matches):
+    loader = get_image_loader()
+    return [loader.load((image_version, m.breed), get_first_image_for_breed(m.breed))
+            for m in matches]
 
 # Simple UI: form for preferences (keep your previous form or replace with this)
 with st.form("pref_form"):
@@ -138,7 +186,7 @@ with st.form("pref_form"):
     submitted = st.form_submit_button("Find my matches")
 
 if submitted:
-    prefs = {
+    st.session_state['prefs'] = {
         'activity_level': activity,
         'home': home,
         'children': children,
@@ -155,44 +203,64 @@ if submitted:
         'openness_pref': openness_pref,
         'mental_stimulation': mental_stimulation
     }
-    results = top_k_matches(df, prefs, k=3)
-    st.subheader("Top matches for you")
+    st.session_state['shown'] = TOP_MATCHES
+
+prefs = st.session_state.get('prefs')
+if prefs is not None:
+    shown = st.session_state.get('shown', TOP_MATCHES)
+    with instrument.request('match_request'):
+        with instrument.span('match_request.score'):
+            # per-session component scores: a resubmit with one slider moved only rescores that
+            # component; the state lives in session_state, so it goes away with the session
+            scorer = st.session_state.get('scorer')
+            if scorer is None or scorer.df is not catalog or scorer.version != catalog.version:
+                scorer = st.session_state['scorer'] = IncrementalScorer(catalog, version=catalog.version)
+            # the top matches plus the first page behind "Show more", cached: a repeat of
+            # known prefs does no scoring at all
+            head = cached_top_k_matches(catalog, prefs, k=TOP_MATCHES + PAGE_SIZE,
+                                        version=catalog.version, compute=scorer.top_k_matches)
+            results = head.page(0, TOP_MATCHES)
+            if shown > TOP_MATCHES:
+                # further pages continue the session's ranking rather than rescoring
+                ranking = scorer.ranking(prefs)
+                more = ranking.page(TOP_MATCHES, shown)
+                upcoming = lambda: ranking.page(shown, shown + PAGE_SIZE)
+            else:
+                more = []
+                upcoming = lambda: head.page(TOP_MATCHES, TOP_MATCHES + PAGE_SIZE)
+        # images load on the pool while the text below is rendered
+        futures = load_images(list(results) + list(more))
+        st.subheader("Top matches for you")
     
-    # Generate social media post for top match
-    if len(results) > 0 and SOCIAL_POST_AVAILABLE:
-        top_match = results.iloc[0]
-        st.markdown("---")
-        st.subheader("📱 Share Your Match")
-        with st.expander("📝 Generate Social Media Post", expanded=False):
-            social_post = generate_social_post(top_match, prefs)
-            # Use a unique key based on breed name and score to avoid caching issues
-            unique_key = f"social_post_{top_match['breed']}_{top_match['score']:.2f}"
-            st.text_area("Copy this post:", social_post, height=200, key=unique_key)
-            st.info("💡 Copy the text above and share it on your favorite social media platform!")
+        # Generate social media post for top match
+        if len(results) > 0 and SOCIAL_POST_AVAILABLE:
+            top_match = results[0]
+            st.markdown("---")
+            st.subheader("📱 Share Your Match")
+            with st.expander("📝 Generate Social Media Post", expanded=False):
+                social_post = generate_social_post(top_match, prefs)
+                # Use a unique key based on breed name and score to avoid caching issues
+                unique_key = f"social_post_{top_match['breed']}_{top_match['score']:.2f}"
+                st.text_area("Copy this post:", social_post, height=200, key=unique_key)
+                st.info("💡 Copy the text above and share it on your favorite social media platform!")
     
-    cols = st.columns(3)
-    for i, (_, row) in enumerate(results.iterrows()):
-        col = cols[i]
-        col.markdown(f"### {row['breed']}  — score {row['score']:.2f}")
-        img_path = get_first_image_for_breed(row['breed'])
-        if img_path and img_path.exists():
-            try:
-                # Use absolute path string for Streamlit
-                col.image(str(img_path.resolve()), use_column_width=True)
-            except Exception as e:
-                # If image fails to load, show placeholder instead of crashing
-                col.write("_Image unavailable for this breed._")
-        else:
-            col.write("_No image found — check mapping for this breed._")
-        # short bullets - show more characteristics
-        reasons = []
-        reasons.append(f"Energy: {row['energy']}/5")
-        reasons.append(f"Trainability: {row['trainability']}/5")
-        reasons.append(f"Good with kids: {row.get('good_with_kids',3)}/5")
-        if 'shedding' in row:
-            reasons.append(f"Shedding: {row['shedding']}/5")
-        if 'barking' in row:
-            reasons.append(f"Barking: {row['barking']}/5")
-        if 'playfulness' in row:
-            reasons.append(f"Playfulness: {row['playfulness']}/5")
-        col.write('\n'.join(f"- {r}" for r in reasons))
+        with instrument.span('match_request.render'):
+            slots = []
+            for i, row in enumerate(results):
+                if i % 3 == 0:
+                    cols = st.columns(3)
+                slots.append(render_card(cols[i % 3], row))
+            if len(more):
+                st.markdown("---")
+                st.subheader("More matches")
+            for i, row in enumerate(more):
+                if i % 3 == 0:
+                    cols = st.columns(3)
+                slots.append(render_card(cols[i % 3], row))
+            if shown < len(catalog):
+                st.button(f"Show {PAGE_SIZE} more", on_click=show_more)
+                # the next page's images load while this one is being read
+                get_image_loader().prefetch(((image_version, m.breed), get_first_image_for_breed(m.breed))
+                                            for m in upcoming())
+        with instrument.span('match_request.images'):
+            fill_images(slots, futures)
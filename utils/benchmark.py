@@ -0,0 +1,295 @@
+"""
+Benchmarks for matching, image resolution and post generation.
+
+Stages run against synthetic data generated from a fixed seed: a catalog of any size
+(sampled from the real breeds in breed_traits.csv with per-trait jitter, so 195 rows up to
+10M), an image tree (breed folders with small JPEG/PNG files plus some non-image files,
+like the git-LFS pointers in data/images) and random preference profiles. Each stage
+reports latency percentiles, throughput and peak traced memory; results are written as
+JSON and compared against a baseline, failing when a stage regresses by more than the
+threshold.
+
+    python -m utils.benchmark [--sizes 195,10000,100000] [--repeat 10] [--out results.json]
+                              [--baseline data/benchmark_baseline.json] [--threshold 0.2]
+                              [--save-baseline]
+"""
+import argparse
+import io
+import json
+import os
+import platform
+import random
+import sys
+import tempfile
+import time
+import tracemalloc
+from pathlib import Path
+
+import numpy as np
+import pandas as pd
+
+from utils.matching import (COMPONENTS, batch_top_k, load_breeds, score_breeds,
+                            top_k_matches)
+from utils.normalize import normalize_for_folder
+
+ROOT = Path(__file__).resolve().parents[1]
+TRAITS_FILE = ROOT / "data" / "breed_traits.csv"
+BASELINE_FILE = ROOT / "data" / "benchmark_baseline.json"
+RESULTS_VERSION = 1
+DEFAULT_SIZES = (195, 10_000, 100_000)
+DEFAULT_THRESHOLD = 0.2
+# compared against the baseline; lower is better for both
+COMPARED_METRICS = (('latency_ms', 'p50'), ('peak_mb', None))
+
+_LEVELS = ['energy', 'good_with_kids', 'trainability', 'shedding', 'grooming', 'drooling',
+           'barking', 'playfulness', 'affection', 'good_with_dogs', 'openness', 'mental_needs',
+           'adaptability', 'watchdog']
+
+def synthetic_catalog(rows, seed=0, base=None):
+    """
+    A load_breeds()-shaped dataframe with `rows` rows. The first rows are the real breeds;
+    the rest copy a random real breed with each 1-5 level moved by one step 30% of the time
+    (the breed column is categorical, so names repeat).
+    """
+    base = load_breeds(str(TRAITS_FILE)) if base is None else base
+    if rows <= len(base):
+        return base.iloc[:rows].reset_index(drop=True)
+    rng = np.random.default_rng(seed)
+    src = np.concatenate([np.arange(len(base)), rng.integers(0, len(base), rows - len(base))])
+    out = {}
+    for name in base.columns:
+        col = base[name].to_numpy()
+        if name == 'breed':
+            codes, names = pd.factorize(base[name])
+            out[name] = pd.Categorical.from_codes(codes[src], names)
+        elif name in _LEVELS:
+            jitter = rng.choice(np.array([-1, 0, 0, 0, 0, 0, 1], dtype=np.int8), size=rows)
+            jitter[:len(base)] = 0
+            out[name] = np.clip(col[src] + jitter, 1, 5).astype(col.dtype)
+        else:
+            out[name] = col[src]
+    df = pd.DataFrame(out)
+    if 'hypoallergenic' in df:
+        df['hypoallergenic'] = df['shedding'] <= 2
+    return df
+
+def random_prefs(rng, with_size=False):
+    """One preference profile with every field drawn uniformly from the form's choices."""
+    level = lambda: int(rng.integers(1, 6))
+    prefs = {
+        'activity_level': level(),
+        'home': ['apartment', 'house'][int(rng.integers(2))],
+        'children': bool(rng.integers(2)),
+        'allergies': bool(rng.integers(2)),
+        'time_for_training': level(),
+        'size_pref': [None, 'small', 'medium', 'large'][int(rng.integers(4))] if with_size else None,
+        'other_dogs': bool(rng.integers(2)),
+    }
+    for _, key in COMPONENTS:
+        if key.endswith(('_tolerance', '_pref')) and key not in prefs:
+            prefs[key] = level()
+    prefs['mental_stimulation'] = level()
+    return prefs
+
+def random_profiles(count, seed=0):
+    rng = np.random.default_rng(seed)
+    return [random_prefs(rng) for _ in range(count)]
+
+def _image_bytes(fmt, color):
+    from PIL import Image
+    buf = io.BytesIO()
+    Image.new('RGB', (64, 48), color).save(buf, fmt)
+    return buf.getvalue()
+
+def synthetic_image_tree(directory, folders=400, images_per_folder=8, junk_fraction=0.25, seed=0):
+    """
+    Write an image tree like data/images: `folders` breed folders (names from the real
+    breeds, numbered past the first pass), each with JPEG/PNG images and, for
+    junk_fraction of the files, git-LFS pointer text under an image name. Returns the folder names.
+    """
+    rng = np.random.default_rng(seed)
+    directory = Path(directory)
+    breeds = [str(b) for b in load_breeds(str(TRAITS_FILE))['breed']]
+    blobs = {'.jpg': _image_bytes('JPEG', (200, 150, 100)), '.png': _image_bytes('PNG', (90, 120, 160))}
+    pointer = b'version https://git-lfs.github.com/spec/v1\noid sha256:0\nsize 0\n'
+    names = []
+    for i in range(folders):
+        name = normalize_for_folder(breeds[i % len(breeds)])
+        name = name if i < len(breeds) else f"{name}_{i // len(breeds)}"
+        names.append(name)
+        folder = directory / name
+        folder.mkdir(parents=True, exist_ok=True)
+        for j in range(images_per_folder):
+            suffix = '.png' if rng.random() < 0.2 else '.jpg'
+            data = pointer if rng.random() < junk_fraction else blobs[suffix]
+            (folder / f"{name}_{j}{suffix}").write_bytes(data)
+    return names
+
+def _summary(values):
+    v = np.asarray(values, dtype=np.float64) * 1000
+    return {'min': round(float(v.min()), 4), 'p50': round(float(np.percentile(v, 50)), 4),
+            'p90': round(float(np.percentile(v, 90)), 4), 'p99': round(float(np.percentile(v, 99)), 4),
+            'mean': round(float(v.mean()), 4), 'max': round(float(v.max()), 4)}
+
+def measure(fn, repeat=10, warmup=1, items=1, rows=None):
+    """
+    Time `repeat` calls of fn (after `warmup` untimed ones), then one more call under
+    tracemalloc for the peak memory it allocates. `items` is the work per call, for
+    throughput.
+    """
+    for _ in range(warmup):
+        fn()
+    times = []
+    for _ in range(repeat):
+        t0 = time.perf_counter()
+        fn()
+        times.append(time.perf_counter() - t0)
+    tracemalloc.start()
+    try:
+        tracemalloc.reset_peak()
+        fn()
+        peak = tracemalloc.get_traced_memory()[1]
+    finally:
+        tracemalloc.stop()
+    return {'rows': rows, 'items': items, 'repeat': repeat, 'latency_ms': _summary(times),
+            'throughput_per_s': round(items * len(times) / sum(times), 2) if sum(times) else None,
+            'peak_mb': round(peak / 2**20, 3)}
+
+def matching_stages(sizes, repeat, seed, profiles=64):
+    """score_breeds, top_k_matches and batch_top_k over each synthetic catalog size."""
+    results = {}
+    base = load_breeds(str(TRAITS_FILE))
+    results['load_breeds'] = measure(lambda: load_breeds(str(TRAITS_FILE)), repeat, rows=len(base))
+    batch = random_profiles(profiles, seed)
+    for rows in sizes:
+        df = synthetic_catalog(rows, seed, base)
+        prefs = iter(random_profiles(repeat * 4 + 4, seed + rows))
+        # each call scores a fresh profile, so nothing is served from a warmed-up result
+        results[f'score_breeds[rows={rows}]'] = measure(
+            lambda: score_breeds(df, next(prefs)), repeat, rows=rows)
+        results[f'top_k_matches[rows={rows}]'] = measure(
+            lambda: top_k_matches(df, next(prefs), k=3), repeat, rows=rows)
+        results[f'batch_top_k[rows={rows}]'] = measure(
+            lambda: batch_top_k(df, batch, k=3), max(1, repeat // 2), items=len(batch), rows=rows)
+        del df
+    return results
+
+def image_stages(repeat, seed, folders=400, images_per_folder=8):
+    """Folder normalisation, a cold manifest scan, folder resolution and primary-image lookup."""
+    from utils.image_manifest import ImageManifest
+    from utils.resolver import BreedResolver
+
+    results = {}
+    breeds = [str(b) for b in load_breeds(str(TRAITS_FILE))['breed']]
+    results['normalize_for_folder'] = measure(
+        lambda: [normalize_for_folder(b) for b in breeds], repeat, items=len(breeds))
+    with tempfile.TemporaryDirectory(prefix='dog-bench-') as tmp:
+        names = synthetic_image_tree(tmp, folders, images_per_folder, seed=seed)
+        files = folders * images_per_folder
+        results['image_manifest_scan'] = measure(
+            lambda: ImageManifest(tmp, None).refresh(), max(1, repeat // 2), items=files, rows=folders)
+        manifest = ImageManifest(tmp, None)
+        manifest.refresh()
+        results['resolver_build'] = measure(lambda: BreedResolver(names), repeat, rows=folders)
+        resolver = BreedResolver(names)
+        def resolve_cold():
+            resolver._cache.clear()  # time the matching, not the memo
+            return [resolver.resolve(b) for b in breeds]
+        results['resolve_folder'] = measure(resolve_cold, repeat, items=len(breeds), rows=folders)
+        # the app's get_first_image_for_breed: resolved folder -> manifest primary image
+        results['first_image_for_breed'] = measure(
+            lambda: [manifest.primary(resolver.folder(b)) for b in breeds], repeat,
+            items=len(breeds), rows=folders)
+    return results
+
+def post_stages(repeat, seed):
+    """generate_social_post for the top match of random profiles."""
+    from utils.social_post import generate_social_post
+    df = load_breeds(str(TRAITS_FILE))
+    pairs = [(top_k_matches(df, p, k=1)[0], p) for p in random_profiles(50, seed)]
+    random.seed(seed)
+    return {'generate_social_post': measure(
+        lambda: [generate_social_post(m, p) for m, p in pairs], repeat, items=len(pairs))}
+
+def environment():
+    return {'python': platform.python_version(), 'numpy': np.__version__, 'pandas': pd.__version__,
+            'platform': platform.platform(), 'machine': platform.machine(), 'cpus': os.cpu_count()}
+
+def run(sizes=DEFAULT_SIZES, repeat=10, seed=0, stages=('matching', 'images', 'posts')):
+    """Run the selected stage groups; returns the results document."""
+    results = {}
+    if 'matching' in stages:
+        results.update(matching_stages(sizes, repeat, seed))
+    if 'images' in stages:
+        results.update(image_stages(repeat, seed))
+    if 'posts' in stages:
+        results.update(post_stages(repeat, seed))
+    return {'version': RESULTS_VERSION, 'created': time.strftime('%Y-%m-%dT%H:%M:%S'),
+            'environment': environment(),
+            'config': {'sizes': list(sizes), 'repeat': repeat, 'seed': seed, 'stages': list(stages)},
+            'stages': results}
+
+def compare(current, baseline, threshold=DEFAULT_THRESHOLD):
+    """
+    Stages present in both documents whose p50 latency or peak memory grew by more than
+    `threshold` (a fraction), as dicts with the baseline/current values and their ratio.
+    """
+    regressions = []
+    for stage, cur in current['stages'].items():
+        old = baseline.get('stages', {}).get(stage)
+        if old is None:
+            continue
+        for metric, field in COMPARED_METRICS:
+            a = old[metric][field] if field else old[metric]
+            b = cur[metric][field] if field else cur[metric]
+            if a and b is not None and b > a * (1 + threshold):
+                regressions.append({'stage': stage, 'metric': f"{metric}.{field}" if field else metric,
+                                    'baseline': a, 'current': b, 'ratio': round(b / a, 3)})
+    return regressions
+
+def write_results(doc, path):
+    path = Path(path)
+    tmp = path.with_name(path.name + '.tmp')
+    tmp.write_text(json.dumps(doc, indent=1, sort_keys=True), encoding='utf8')
+    os.replace(tmp, path)
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument('--sizes', default=','.join(map(str, DEFAULT_SIZES)),
+                        help='comma-separated catalog sizes (rows), up to 10000000')
+    parser.add_argument('--repeat', type=int, default=10)
+    parser.add_argument('--seed', type=int, default=0)
+    parser.add_argument('--stages', default='matching,images,posts')
+    parser.add_argument('--out', default=None, help='write the results JSON here')
+    parser.add_argument('--baseline', default=str(BASELINE_FILE))
+    parser.add_argument('--threshold', type=float, default=DEFAULT_THRESHOLD,
+                        help='allowed fractional growth of p50 latency / peak memory')
+    parser.add_argument('--save-baseline', action='store_true',
+                        help='store these results as the baseline instead of comparing')
+    args = parser.parse_args()
+
+    sizes = [int(s) for s in args.sizes.split(',') if s]
+    doc = run(sizes, args.repeat, args.seed, tuple(args.stages.split(',')))
+    for stage, r in doc['stages'].items():
+        lat = r['latency_ms']
+        print(f"{stage:40s} p50 {lat['p50']:10.3f} ms  p99 {lat['p99']:10.3f} ms  "
+              f"{r['throughput_per_s'] or 0:12.1f}/s  peak {r['peak_mb']:9.2f} MB")
+    if args.out:
+        write_results(doc, args.out)
+    if args.save_baseline:
+        write_results(doc, args.baseline)
+        print(f"baseline saved to {args.baseline}")
+        return
+    if not Path(args.baseline).exists():
+        print(f"no baseline at {args.baseline}; run with --save-baseline to create one")
+        return
+    baseline = json.loads(Path(args.baseline).read_text(encoding='utf8'))
+    regressions = compare(doc, baseline, args.threshold)
+    for r in regressions:
+        print(f"REGRESSION {r['stage']} {r['metric']}: {r['baseline']} -> {r['current']} (x{r['ratio']})")
+    if regressions:
+        sys.exit(1)
+    print(f"no regressions beyond {args.threshold:.0%} against {args.baseline}")
+
+if __name__ == '__main__':
+    main()
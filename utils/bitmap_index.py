@@ -0,0 +1,153 @@
+"""
+Bitmap pre-filter for hard constraints.
+
+BitmapIndex keeps, for every trait column and level v, a packed bitmap of the rows with
+trait >= v (plus one bitmap per Size and a bitmap of live rows). A conjunction such as
+"hypoallergenic AND good_with_kids >= 4" is a handful of bitwise ANDs over n/8 bytes,
+and only the surviving rows are scored. Rows can be appended and removed in place.
+
+strict_constraints() turns the near-veto preferences of score_breeds (allergies, young
+children, other dogs, size) into such constraints.
+"""
+import numpy as np
+
+from utils.matching import (TRAIT_COLUMNS, MatchResult, catalog_arrays, combine_scores,
+                            component_scores, top_k_indices)
+
+MAX_LEVEL = 5
+# minimum good_with_kids / good_with_dogs level kept in strict mode
+STRICT_MIN_LEVEL = 4
+
+def _grow(bitmap, nbytes):
+    if len(bitmap) >= nbytes:
+        return bitmap
+    out = np.zeros(max(nbytes, 2 * len(bitmap)), dtype=np.uint8)
+    out[:len(bitmap)] = bitmap
+    return out
+
+def _write_bits(bitmap, start, bits):
+    """Set bits [start, start+len(bits)) of a packed (big-endian bit order) bitmap."""
+    if not len(bits):
+        return
+    lo, hi = start >> 3, (start + len(bits) + 7) >> 3
+    region = np.unpackbits(bitmap[lo:hi])
+    region[start - (lo << 3):start - (lo << 3) + len(bits)] = bits
+    bitmap[lo:hi] = np.packbits(region)
+
+def _clear_bits(bitmap, rows):
+    rows = np.asarray(rows, dtype=np.intp)
+    np.bitwise_and.at(bitmap, rows >> 3, ~(np.uint8(0x80) >> (rows & 7).astype(np.uint8)))
+
+class BitmapIndex:
+    """Per-trait-level bitmaps over catalog rows (positions)."""
+
+    def __init__(self):
+        self.rows = 0
+        self._ge = {(c, v): np.zeros(0, dtype=np.uint8)
+                    for c in TRAIT_COLUMNS for v in range(1, MAX_LEVEL + 1)}
+        self._sizes = {}
+        self._live = np.zeros(0, dtype=np.uint8)
+
+    @classmethod
+    def from_frame(cls, df):
+        index = cls()
+        index.add(*catalog_arrays(df))
+        return index
+
+    @classmethod
+    def from_catalog(cls, catalog):
+        """Index a utils.catalog.ColumnarCatalog, chunk by chunk."""
+        index = cls()
+        for start, stop in catalog.chunks():
+            index.add(catalog.traits(start, stop), catalog.sizes(start, stop))
+        return index
+
+    def add(self, traits, sizes=None):
+        """Append rows (a trait_matrix block, optional Size strings); returns their positions."""
+        start, n = self.rows, len(traits)
+        self.rows += n
+        nbytes = (self.rows + 7) >> 3
+        for i, col in enumerate(TRAIT_COLUMNS):
+            values = traits[:, i]
+            for v in range(1, MAX_LEVEL + 1):
+                bitmap = self._ge[(col, v)] = _grow(self._ge[(col, v)], nbytes)
+                _write_bits(bitmap, start, values >= v)
+        if sizes is not None:
+            sizes = np.asarray(sizes, dtype=object)
+            for size in set(sizes):
+                self._sizes.setdefault(size, np.zeros(0, dtype=np.uint8))
+        for size in list(self._sizes):
+            bitmap = self._sizes[size] = _grow(self._sizes[size], nbytes)
+            if sizes is not None:
+                _write_bits(bitmap, start, sizes == size)
+        self._live = _grow(self._live, nbytes)
+        _write_bits(self._live, start, np.ones(n, dtype=bool))
+        return np.arange(start, self.rows)
+
+    def remove(self, rows):
+        """Drop rows from every future result (positions of other rows are unchanged)."""
+        _clear_bits(self._live, rows)
+
+    def bitmap(self, trait, op, value):
+        """Packed bitmap of the rows satisfying `trait op value` (op: '>=', '<=', '==')."""
+        nbytes = (self.rows + 7) >> 3
+        if trait == 'Size':
+            if op != '==':
+                raise ValueError("Size only supports '=='")
+            return self._sizes.get(value, np.zeros(nbytes, dtype=np.uint8))[:nbytes]
+        value = int(value)
+        full = np.full(nbytes, 0xFF, dtype=np.uint8)
+        empty = np.zeros(nbytes, dtype=np.uint8)
+        def ge(v):
+            if v <= 0:
+                return full
+            if v > MAX_LEVEL:
+                return empty
+            return self._ge[(trait, v)][:nbytes]
+        if op == '>=':
+            return ge(value)
+        if op == '<=':
+            return ~ge(value + 1)
+        if op == '==':
+            return ge(value) & ~ge(value + 1)
+        raise ValueError(f"unknown operator {op!r}")
+
+    def candidates(self, constraints):
+        """Sorted positions of live rows satisfying every (trait, op, value) constraint."""
+        nbytes = (self.rows + 7) >> 3
+        mask = self._live[:nbytes].copy()
+        for trait, op, value in constraints:
+            mask &= self.bitmap(trait, op, value)
+        return np.flatnonzero(np.unpackbits(mask, count=self.rows))
+
+def strict_constraints(prefs, min_level=STRICT_MIN_LEVEL, has_sizes=False):
+    """Hard constraints implied by prefs in strict-filter mode."""
+    constraints = []
+    if prefs.get('allergies'):
+        constraints.append(('hypoallergenic', '>=', 1))
+    if prefs.get('children'):
+        constraints.append(('good_with_kids', '>=', min_level))
+    if prefs.get('other_dogs'):
+        constraints.append(('good_with_dogs', '>=', min_level))
+    if prefs.get('size_pref') is not None and has_sizes:
+        constraints.append(('Size', '==', prefs['size_pref']))
+    return constraints
+
+def strict_top_k_matches(df, prefs, k=3, weights=None, breakdown=False, index=None,
+                         min_level=STRICT_MIN_LEVEL):
+    """
+    top_k_matches restricted to the breeds passing strict_constraints(prefs). Only the
+    surviving rows are scored; pass a prebuilt `index` to avoid rebuilding it per call.
+    """
+    if index is None:
+        index = BitmapIndex.from_frame(df)
+    traits, sizes = catalog_arrays(df)
+    rows = index.candidates(strict_constraints(prefs, min_level, sizes is not None))
+    components = component_scores(traits[rows], prefs,
+                                  sizes[rows] if sizes is not None else None)
+    scores = combine_scores(components, weights, n=len(rows))
+    idx, vals = top_k_indices(scores, k)
+    picked = None
+    if breakdown:
+        picked = {name: np.broadcast_to(v, scores.shape)[idx[0]] for name, v in components.items()}
+    return MatchResult(df, rows[idx[0]], vals[0], picked)
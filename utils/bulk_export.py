@@ -0,0 +1,234 @@
+"""
+Bulk export of matches and social posts.
+
+Profiles stream in from a JSONL file (one object per line: either prefs or
+{"id": ..., "prefs": {...}}) or a CSV file (one column per prefs key, optional id column,
+other columns ignored), are scored in batches with matching.batch_top_k and rendered with
+generate_social_post, then written out as JSONL or CSV batch by batch, so memory stays
+bounded whatever the input size.
+
+    --mode top   the k best breeds of each profile (e.g. every registered user's top match)
+    --mode all   every breed for each profile, ranked (breed x persona campaigns)
+
+Each post's headline is drawn from random.Random seeded with (seed, profile number, rank),
+so output is identical for any batch size, worker count or resume point. Batches can run
+on worker processes (output stays in input order). After every written batch a checkpoint
+(<out>.checkpoint) records how many profiles are done and the output size; a rerun with
+the same arguments truncates any partial write and continues from there.
+
+    python -m utils.bulk_export profiles.jsonl --out posts.jsonl [--mode top] [--k 1]
+                                [--batch 512] [--workers 1] [--seed 0] [--no-resume]
+"""
+import argparse
+import csv
+import io
+import json
+import os
+import random
+from collections import deque
+from concurrent.futures import ProcessPoolExecutor
+from itertools import islice
+from pathlib import Path
+
+import numpy as np
+
+from utils.matching import COMPONENTS, MatchResult, batch_score_matrix, batch_top_k
+from utils.snapshot import SNAPSHOT_FILE, load_snapshot, read_snapshot
+from utils.social_post import generate_social_post
+
+BATCH_SIZE = 512
+CHECKPOINT_VERSION = 1
+CSV_FIELDS = ['profile', 'rank', 'breed', 'score', 'post']
+_BOOL_KEYS = ('children', 'allergies', 'other_dogs')
+_TEXT_KEYS = ('home', 'size_pref')
+_PREFS_KEYS = frozenset(key for _, key in COMPONENTS)
+
+def _csv_prefs(row):
+    """
+    prefs from a CSV row: booleans for yes/no fields, ints for levels, '' = unset. Columns
+    that are not prefs keys (id, name, notes, ...) are ignored.
+    """
+    prefs = {}
+    for key, value in row.items():
+        value = (value or '').strip() if isinstance(value, str) else ''
+        if key not in _PREFS_KEYS or value == '':
+            continue
+        if key in _BOOL_KEYS:
+            prefs[key] = value.lower() in ('1', 'true', 'yes', 'y')
+        elif key in _TEXT_KEYS:
+            prefs[key] = value
+        else:
+            prefs[key] = int(float(value))
+    return prefs
+
+def read_profiles(path):
+    """
+    Yield (profile id, prefs) from a .jsonl/.json or .csv file. Ids are always strings, so
+    every output has one type; a missing or empty id defaults to the profile number.
+    """
+    path = Path(path)
+    with open(path, encoding='utf8', newline='') as f:
+        if path.suffix.lower() == '.csv':
+            for n, row in enumerate(csv.DictReader(f)):
+                pid = (row.get('id') or '').strip()
+                yield pid or str(n), _csv_prefs(row)
+            return
+        n = 0
+        for lineno, line in enumerate(f, 1):
+            if not line.strip():
+                continue
+            obj = json.loads(line)
+            if not isinstance(obj, dict):
+                raise ValueError(f"{path}:{lineno}: expected a JSON object, got {type(obj).__name__}")
+            if isinstance(obj.get('prefs'), dict):
+                pid = obj.get('id')
+                yield str(n) if pid is None or pid == '' else str(pid), obj['prefs']
+            else:
+                yield str(n), obj
+            n += 1
+
+def batches(profiles, size):
+    """Group an iterable into lists of at most `size` items."""
+    it = iter(profiles)
+    while True:
+        chunk = list(islice(it, size))
+        if not chunk:
+            return
+        yield chunk
+
+def post_rng(seed, profile_no, rank):
+    return random.Random(f"{seed}/{profile_no}/{rank}")
+
+class Renderer:
+    """Scores and renders batches of profiles against one catalog snapshot."""
+
+    def __init__(self, snapshot, mode='top', k=1, seed=0, fmt='jsonl'):
+        self.snapshot = snapshot
+        self.mode, self.k, self.seed, self.fmt = mode, k, seed, fmt
+
+    def ranked(self, prefs_list):
+        """(indices, scores) per profile, best first: the top k, or every breed for mode 'all'."""
+        if self.mode == 'top':
+            return batch_top_k(self.snapshot, prefs_list, self.k)
+        scores = batch_score_matrix(self.snapshot.traits, prefs_list, sizes=self.snapshot.sizes)
+        order = np.argsort(-scores, axis=1, kind='stable')  # ties keep catalog order
+        return order, np.take_along_axis(scores, order, axis=1)
+
+    def records(self, start, batch):
+        """Output records (CSV_FIELDS order) for profiles numbered start, start + 1, ..."""
+        indices, scores = self.ranked([prefs for _, prefs in batch])
+        for i, (pid, prefs) in enumerate(batch):
+            for rank, match in enumerate(MatchResult(self.snapshot, indices[i], scores[i]), 1):
+                post = generate_social_post(match, prefs, rng=post_rng(self.seed, start + i, rank))
+                yield pid, rank, match.breed, round(match.score, 6), post
+
+    def render(self, start, batch):
+        """One batch as output text."""
+        buf = io.StringIO()
+        if self.fmt == 'csv':
+            csv.writer(buf).writerows(self.records(start, batch))
+        else:
+            for rec in self.records(start, batch):
+                buf.write(json.dumps(dict(zip(CSV_FIELDS, rec)), ensure_ascii=False) + '\n')
+        return buf.getvalue()
+
+_worker = None
+
+def _init_worker(snapshot_path, mode, k, seed, fmt):
+    global _worker
+    _worker = Renderer(read_snapshot(snapshot_path), mode, k, seed, fmt)
+
+def _render_batch(start, batch):
+    return _worker.render(start, batch)
+
+def _rendered(renderer, numbered, workers, snapshot_path, options):
+    """Yield (profiles done, text) per batch in input order, keeping at most 2x workers in flight."""
+    if workers <= 1:
+        for start, batch in numbered:
+            yield start + len(batch), renderer.render(start, batch)
+        return
+    with ProcessPoolExecutor(workers, initializer=_init_worker,
+                             initargs=(str(snapshot_path), *options)) as pool:
+        pending = deque()
+        for start, batch in numbered:
+            pending.append((start + len(batch), pool.submit(_render_batch, start, batch)))
+            if len(pending) >= 2 * workers:
+                done, fut = pending.popleft()
+                yield done, fut.result()
+        while pending:
+            done, fut = pending.popleft()
+            yield done, fut.result()
+
+def _numbered(profiles, size, skip):
+    start = skip
+    for batch in batches(islice(profiles, skip, None), size):
+        yield start, batch
+        start += len(batch)
+
+def load_checkpoint(path, config):
+    """The saved progress for this exact configuration, or None."""
+    path = Path(path)
+    if not path.exists():
+        return None
+    state = json.loads(path.read_text(encoding='utf8'))
+    if state.get('version') != CHECKPOINT_VERSION or state.get('config') != config:
+        raise ValueError(f"{path} belongs to a different export; remove it or use --no-resume")
+    return state
+
+def save_checkpoint(path, config, done, out_bytes):
+    tmp = Path(str(path) + '.tmp')
+    tmp.write_text(json.dumps({'version': CHECKPOINT_VERSION, 'config': config,
+                               'profiles_done': done, 'out_bytes': out_bytes}), encoding='utf8')
+    os.replace(tmp, path)
+
+def export(input_path, out, mode='top', k=1, fmt=None, batch_size=BATCH_SIZE, workers=1,
+           seed=0, resume=True, snapshot_path=SNAPSHOT_FILE):
+    """
+    Export posts for every profile in input_path to `out`. Returns the number of profiles
+    written in this run. Progress is checkpointed after each batch; the checkpoint is
+    removed once the export completes.
+    """
+    out = Path(out)
+    fmt = fmt or ('csv' if out.suffix.lower() == '.csv' else 'jsonl')
+    snapshot = load_snapshot(snapshot_path)
+    config = {'input': str(Path(input_path).resolve()), 'mode': mode, 'k': k, 'format': fmt,
+              'seed': seed, 'catalog_version': snapshot.version}
+    checkpoint = Path(str(out) + '.checkpoint')
+    state = load_checkpoint(checkpoint, config) if resume and out.exists() else None
+    skip = state['profiles_done'] if state else 0
+
+    renderer = Renderer(snapshot, mode, k, seed, fmt)
+    numbered = _numbered(read_profiles(input_path), batch_size, skip)
+    with open(out, 'r+b' if state else 'wb') as f:
+        if state:
+            f.truncate(state['out_bytes'])  # drop anything written after the checkpoint
+            f.seek(state['out_bytes'])
+        elif fmt == 'csv':
+            f.write((','.join(CSV_FIELDS) + '\r\n').encode('utf8'))
+        done = skip
+        for done, text in _rendered(renderer, numbered, workers, snapshot.path,
+                                    (mode, k, seed, fmt)):
+            f.write(text.encode('utf8'))
+            f.flush()
+            save_checkpoint(checkpoint, config, done, f.tell())
+    checkpoint.unlink(missing_ok=True)
+    return done - skip
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument('input', help='profiles as .jsonl or .csv')
+    parser.add_argument('--out', required=True, help='output .jsonl or .csv')
+    parser.add_argument('--mode', choices=('top', 'all'), default='top')
+    parser.add_argument('--k', type=int, default=1)
+    parser.add_argument('--format', choices=('jsonl', 'csv'), default=None)
+    parser.add_argument('--batch', type=int, default=BATCH_SIZE)
+    parser.add_argument('--workers', type=int, default=1)
+    parser.add_argument('--seed', type=int, default=0)
+    parser.add_argument('--no-resume', action='store_true', help='ignore an existing checkpoint')
+    args = parser.parse_args()
+    written = export(args.input, args.out, args.mode, args.k, args.format, args.batch,
+                     args.workers, args.seed, not args.no_resume)
+    print(f"{written} profiles exported to {args.out}")
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,223 @@
+"""
+Columnar catalog for large collections of individual dogs.
+
+A catalog is a directory holding one memory-mapped uint8 file per scoring trait
+(matching.TRAIT_COLUMNS), an int64 id column, optional Size category codes, and a
+metadata side table (one JSON object per row, plus a uint64 offset index so a row's
+metadata is read without parsing the rest). Opening a catalog reads only meta.json.
+
+Scoring walks the catalog in fixed-size chunks and keeps a bounded top-k heap, so
+resident memory stays roughly constant however many rows there are. In strict mode a
+bitmap index (utils.bitmap_index) first narrows the rows to those meeting the hard
+constraints implied by the prefs.
+"""
+import heapq
+import json
+import uuid
+from pathlib import Path
+
+import numpy as np
+import pandas as pd
+
+from utils.bitmap_index import BitmapIndex, strict_constraints
+from utils.matching import (TRAIT_COLUMNS, MatchResult, combine_scores, component_scores,
+                            top_k_indices, trait_matrix)
+
+CATALOG_FORMAT = 1
+CHUNK_ROWS = 1 << 18
+
+class CatalogWriter:
+    """
+    Append dataframes (shaped like load_breeds output) to a new catalog directory. The
+    catalog is published (meta.json written) by close(); leaving a `with` block on an
+    exception closes the files without publishing.
+    """
+
+    def __init__(self, directory):
+        self.directory = Path(directory)
+        self.directory.mkdir(parents=True, exist_ok=True)
+        (self.directory / 'meta.json').unlink(missing_ok=True)  # unpublished until close()
+        self._traits = {c: open(self.directory / f"{c}.u8", 'wb') for c in TRAIT_COLUMNS}
+        self._ids = open(self.directory / 'ids.i8', 'wb')
+        self._sizes = None
+        self._size_codes = {}
+        self._meta = open(self.directory / 'metadata.jsonl', 'wb')
+        self._meta_idx = open(self.directory / 'metadata.idx', 'wb')
+        self.rows = 0
+
+    def append(self, df):
+        n = len(df)
+        traits = trait_matrix(df)
+        for i, col in enumerate(TRAIT_COLUMNS):
+            self._traits[col].write(np.ascontiguousarray(traits[:, i]).tobytes())
+        ids = df['id'].to_numpy(dtype=np.int64) if 'id' in df.columns else np.arange(self.rows, self.rows + n, dtype=np.int64)
+        self._ids.write(ids.tobytes())
+        if 'Size' in df.columns:
+            if self._sizes is None:
+                if self.rows:
+                    raise ValueError("Size column appeared after rows without it")
+                self._sizes = open(self.directory / 'size.u8', 'wb')
+            values = df['Size'].fillna('medium').astype(str).str.lower()
+            codes = np.array([self._size_codes.setdefault(v, len(self._size_codes)) for v in values], dtype=np.uint8)
+            self._sizes.write(codes.tobytes())
+        elif self._sizes is not None:
+            raise ValueError("Size column missing from a chunk")
+        meta_cols = [c for c in df.columns if c not in TRAIT_COLUMNS and c not in ('id', 'Size')]
+        offsets = np.empty(n, dtype=np.uint64)
+        for j, row in enumerate(df[meta_cols].itertuples(index=False, name=None)):
+            offsets[j] = self._meta.tell()
+            record = {c: (v.item() if hasattr(v, 'item') else v) for c, v in zip(meta_cols, row)}
+            self._meta.write(json.dumps(record, ensure_ascii=False, default=str).encode('utf8') + b'\n')
+        self._meta_idx.write(offsets.tobytes())
+        self.rows += n
+
+    def _close_files(self):
+        for f in (*self._traits.values(), self._ids, self._meta, self._meta_idx, self._sizes):
+            if f is not None:
+                f.close()
+
+    def close(self):
+        self._close_files()
+        sizes = sorted(self._size_codes, key=self._size_codes.get) if self._sizes is not None else None
+        meta = {'format': CATALOG_FORMAT, 'rows': self.rows, 'traits': TRAIT_COLUMNS,
+                'sizes': sizes, 'version': uuid.uuid4().hex}
+        (self.directory / 'meta.json').write_text(json.dumps(meta), encoding='utf8')
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        if exc[0] is None:
+            self.close()
+        else:
+            self._close_files()
+
+def write_catalog(directory, chunks):
+    """Write a catalog from a dataframe or an iterable of dataframe chunks; returns it opened."""
+    if isinstance(chunks, pd.DataFrame):
+        chunks = [chunks]
+    with CatalogWriter(directory) as writer:
+        for chunk in chunks:
+            writer.append(chunk)
+    return ColumnarCatalog(directory)
+
+class ColumnarCatalog:
+    """Read-only, memory-mapped catalog directory."""
+
+    def __init__(self, directory):
+        self.directory = Path(directory)
+        meta = json.loads((self.directory / 'meta.json').read_text(encoding='utf8'))
+        if meta.get('format') != CATALOG_FORMAT or meta['traits'] != TRAIT_COLUMNS:
+            raise ValueError(f"{directory} is not a compatible catalog")
+        self.rows = meta['rows']
+        self.version = meta['version']
+        self.columns = {c: self._map(f"{c}.u8", np.uint8) for c in TRAIT_COLUMNS}
+        self.ids = self._map('ids.i8', np.int64)
+        self._meta_idx = self._map('metadata.idx', np.uint64)
+        self.size_categories = None
+        self.size_codes = None
+        if meta.get('sizes') is not None:
+            self.size_categories = np.array(meta['sizes'], dtype=object)
+            self.size_codes = self._map('size.u8', np.uint8)
+        self._bitmap_index = None
+
+    def _map(self, name, dtype):
+        if self.rows == 0:
+            return np.empty(0, dtype=dtype)
+        return np.memmap(self.directory / name, dtype=dtype, mode='r', shape=(self.rows,))
+
+    def __len__(self):
+        return self.rows
+
+    def traits(self, start, stop):
+        """Dense (rows x traits) uint8 matrix for rows [start, stop)."""
+        out = np.empty((stop - start, len(TRAIT_COLUMNS)), dtype=np.uint8)
+        for i, col in enumerate(TRAIT_COLUMNS):
+            out[:, i] = self.columns[col][start:stop]
+        return out
+
+    def sizes(self, start, stop):
+        """Size strings for rows [start, stop), or None when the catalog has no sizes."""
+        if self.size_codes is None:
+            return None
+        return self.size_categories[self.size_codes[start:stop]]
+
+    def chunks(self, chunk_rows=CHUNK_ROWS):
+        for start in range(0, self.rows, chunk_rows):
+            yield start, min(start + chunk_rows, self.rows)
+
+    def metadata(self, row):
+        """Metadata dict of one row (by position)."""
+        offset = int(self._meta_idx[row])
+        with open(self.directory / 'metadata.jsonl', 'rb') as f:
+            f.seek(offset)
+            return json.loads(f.readline())
+
+    def frame(self, rows):
+        """Dataframe of the given row positions: metadata, id, trait columns and Size."""
+        rows = np.asarray(rows, dtype=np.intp)
+        records = [self.metadata(r) for r in rows]
+        df = pd.DataFrame.from_records(records, index=range(len(rows)))
+        df['id'] = self.ids[rows]
+        for col in TRAIT_COLUMNS:
+            df[col] = self.columns[col][rows].astype(bool if col == 'hypoallergenic' else np.int64)
+        if self.size_codes is not None:
+            df['Size'] = self.size_categories[self.size_codes[rows]]
+        return df
+
+    def traits_at(self, rows):
+        """Dense uint8 trait matrix of the given row positions."""
+        out = np.empty((len(rows), len(TRAIT_COLUMNS)), dtype=np.uint8)
+        for i, col in enumerate(TRAIT_COLUMNS):
+            out[:, i] = self.columns[col][rows]
+        return out
+
+    def bitmap_index(self):
+        """BitmapIndex over this catalog, built on first use."""
+        if self._bitmap_index is None:
+            self._bitmap_index = BitmapIndex.from_catalog(self)
+        return self._bitmap_index
+
+    def _blocks(self, chunk_rows, rows=None):
+        """(positions, traits, sizes) blocks over all rows, or over the given sorted positions."""
+        if rows is None:
+            for start, stop in self.chunks(chunk_rows):
+                yield np.arange(start, stop), self.traits(start, stop), self.sizes(start, stop)
+            return
+        for i in range(0, len(rows), chunk_rows):
+            block = rows[i:i + chunk_rows]
+            sizes = self.size_categories[self.size_codes[block]] if self.size_codes is not None else None
+            yield block, self.traits_at(block), sizes
+
+    def top_k_matches(self, prefs, k=3, weights=None, breakdown=False, chunk_rows=CHUNK_ROWS,
+                      strict=False):
+        """
+        Best k rows for prefs as a MatchResult over a dataframe of just those rows
+        (`ids` holds their catalog ids). Ties go to the lower row, as in matching.top_k_matches.
+        strict=True scores only rows passing bitmap_index.strict_constraints(prefs).
+        """
+        rows = None
+        if strict:
+            rows = self.bitmap_index().candidates(
+                strict_constraints(prefs, has_sizes=self.size_codes is not None))
+        heap = []  # (score, -row, components) min-heap of the best k so far
+        for positions, traits, sizes in self._blocks(chunk_rows, rows):
+            components = component_scores(traits, prefs, sizes)
+            scores = combine_scores(components, weights, n=len(positions))
+            idx, vals = top_k_indices(scores, k)
+            for j, score in zip(idx[0], vals[0]):
+                comps = None
+                if breakdown:
+                    comps = {name: float(np.broadcast_to(v, scores.shape)[j]) for name, v in components.items()}
+                item = (float(score), -int(positions[j]), comps)
+                if len(heap) < k:
+                    heapq.heappush(heap, item)
+                elif item[:2] > heap[0][:2]:
+                    heapq.heapreplace(heap, item)
+        best = sorted(heap, key=lambda item: (-item[0], -item[1]))
+        rows = [-item[1] for item in best]
+        picked = None
+        if breakdown:
+            picked = {name: np.array([item[2][name] for item in best]) for name in (best[0][2] if best else {})}
+        return MatchResult(self.frame(rows), np.arange(len(rows)), [item[0] for item in best], picked,
+                           ids=self.ids[rows] if rows else np.empty(0, dtype=np.int64))
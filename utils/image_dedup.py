@@ -0,0 +1,301 @@
+"""
+Perceptual-hash deduplication of the image dataset.
+
+Every image gets a 64-bit DCT perceptual hash (pHash: 32x32 grayscale, the 8x8 lowest
+frequencies compared to their median) plus a content hash, computed on a process pool.
+Hashes are kept in an on-disk index (data/image_hashes.json) keyed on file size and mtime,
+so reruns only hash new or changed files.
+
+Near-duplicates are pairs within `threshold` bits. They are found with multi-index
+hashing rather than all-pairs comparison: the hash is cut into threshold + 1 chunks, two
+hashes within the threshold agree exactly on at least one chunk, so only images sharing a
+chunk value are compared. Pairs are grouped into clusters around the image to keep (the
+folder's primary image, else the largest), holding only images within `threshold` of it
+(chains of near pairs are split). The report holds
+
+    plan        per cluster, the images to keep (the best copy in each folder; only the
+                cluster's best overall with --cross-folder) and the copies to remove.
+                A folder's primary image is never removed.
+    collisions  folder pairs sharing images, flagging folders whose images mostly
+                belong to another folder (a mapping or scraping mix-up)
+
+    python -m utils.image_dedup [--threshold 6] [--workers N] [--cross-folder]
+                                [--out data/image_dedup.json]
+"""
+import argparse
+import hashlib
+import json
+import os
+import time
+from collections import Counter, defaultdict
+from concurrent.futures import ProcessPoolExecutor
+from pathlib import Path
+
+import numpy as np
+
+from utils.image_manifest import IMAGES_DIR, IMAGE_SUFFIXES, MANIFEST_FILE, ImageManifest
+from utils.image_validation import sniff_format
+
+ROOT = Path(__file__).resolve().parents[1]
+INDEX_FILE = ROOT / "data" / "image_hashes.json"
+REPORT_FILE = ROOT / "data" / "image_dedup.json"
+INDEX_VERSION = 1
+DEFAULT_THRESHOLD = 6
+# share (and least number) of a folder's images found in another folder before it is flagged
+COLLISION_FLAG = 0.5
+COLLISION_MIN_IMAGES = 3
+HASH_CHUNK = 64
+
+_DCT = np.cos(np.pi / 32 * (np.arange(32)[:, None] + 0.5) * np.arange(32)[None, :]).T
+_POPCOUNT = np.array([bin(i).count('1') for i in range(256)], dtype=np.uint8)
+
+def phash(img):
+    """64-bit perceptual hash of a PIL image."""
+    from PIL import Image
+    if img.mode == 'P':
+        img = img.convert('RGBA')  # palette transparency; avoids PIL's conversion warning
+    small = np.asarray(img.convert('L').resize((32, 32), Image.LANCZOS), dtype=np.float64)
+    low = (_DCT @ small @ _DCT.T)[:8, :8].ravel()
+    bits = low > np.median(low[1:])  # the DC term only carries overall brightness
+    return int(np.packbits(bits).view('>u8')[0])
+
+def hash_file(path):
+    """(phash, content hash, width, height) of an image file; None if it is not a readable image."""
+    from PIL import Image
+    try:
+        data = Path(path).read_bytes()
+        if sniff_format(data[:16]) is None:
+            return None
+        with Image.open(path) as img:
+            size = img.size
+            img.draft('RGB', (64, 64))  # JPEG: decode at reduced scale
+            return (phash(img), hashlib.blake2b(data, digest_size=16).hexdigest(), *size)
+    except Exception:
+        return None
+
+def _hash_chunk(paths):
+    return [hash_file(p) for p in paths]
+
+def image_files(images_dir):
+    """'folder/name' -> (size, mtime_ns) for every image file of the tree."""
+    files = {}
+    for folder in os.scandir(images_dir):
+        if not folder.is_dir():
+            continue
+        for e in os.scandir(folder.path):
+            if e.is_file() and os.path.splitext(e.name)[1].lower() in IMAGE_SUFFIXES:
+                st = e.stat()
+                files[f"{folder.name}/{e.name}"] = (st.st_size, st.st_mtime_ns)
+    return files
+
+class HashIndex:
+    """
+    Incremental on-disk index: 'folder/name' -> {size, mtime_ns, phash (hex), content,
+    width, height}; phash is None for files that are not readable images.
+    """
+
+    def __init__(self, images_dir=IMAGES_DIR, path=INDEX_FILE, entries=None):
+        self.images_dir = Path(images_dir)
+        self.path = Path(path) if path else None
+        self.entries = entries or {}
+
+    @classmethod
+    def load(cls, images_dir=IMAGES_DIR, path=INDEX_FILE):
+        index = cls(images_dir, path)
+        if index.path and index.path.exists():
+            try:
+                data = json.loads(index.path.read_text(encoding='utf8'))
+            except ValueError:
+                data = {}
+            if (data.get('version') == INDEX_VERSION
+                    and data.get('images_dir') == str(index.images_dir.resolve())):
+                index.entries = data.get('files', {})
+        return index
+
+    def refresh(self, workers=None):
+        """Hash new and changed files in parallel, drop removed ones. Returns the number hashed."""
+        files = image_files(self.images_dir)
+        for key in set(self.entries) - set(files):
+            del self.entries[key]
+        todo = [key for key, (size, mtime) in files.items()
+                if (e := self.entries.get(key)) is None or e['size'] != size or e['mtime_ns'] != mtime]
+        todo.sort()
+        chunks = [todo[i:i + HASH_CHUNK] for i in range(0, len(todo), HASH_CHUNK)]
+        paths = [[str(self.images_dir / key) for key in chunk] for chunk in chunks]
+        with ProcessPoolExecutor(max_workers=workers) as pool:
+            for chunk, results in zip(chunks, pool.map(_hash_chunk, paths)):
+                for key, res in zip(chunk, results):
+                    size, mtime = files[key]
+                    entry = {'size': size, 'mtime_ns': mtime, 'phash': None}
+                    if res is not None:
+                        entry.update(phash=f"{res[0]:016x}", content=res[1], width=res[2], height=res[3])
+                    self.entries[key] = entry
+        return len(todo)
+
+    def save(self):
+        data = {'version': INDEX_VERSION, 'images_dir': str(self.images_dir.resolve()),
+                'files': self.entries}
+        tmp = self.path.with_name(self.path.name + '.tmp')
+        tmp.write_text(json.dumps(data, sort_keys=True), encoding='utf8')
+        os.replace(tmp, self.path)
+
+    def hashed(self):
+        """(keys, uint64 phashes) of the readable images, in key order."""
+        keys = sorted(k for k, e in self.entries.items() if e['phash'] is not None)
+        return keys, np.array([int(self.entries[k]['phash'], 16) for k in keys], dtype=np.uint64)
+
+def hamming(a, b):
+    """Bit distance between uint64 arrays (element-wise)."""
+    x = np.atleast_1d(np.bitwise_xor(a, b)).astype(np.uint64)
+    return _POPCOUNT[x.view(np.uint8)].reshape(len(x), 8).sum(axis=1)
+
+def _chunk_bounds(parts):
+    edges = np.linspace(0, 64, parts + 1).round().astype(int)
+    return list(zip(edges[:-1], edges[1:]))
+
+def near_pairs(hashes, threshold=DEFAULT_THRESHOLD):
+    """
+    All (i, j, distance), i < j, with hamming(hashes[i], hashes[j]) <= threshold, by
+    multi-index hashing over threshold + 1 chunks of the hash.
+    """
+    hashes = np.asarray(hashes, dtype=np.uint64)
+    found = set()
+    for lo, hi in _chunk_bounds(min(threshold + 1, 64)):
+        width = hi - lo
+        keys = (hashes >> np.uint64(64 - hi)) & np.uint64((1 << width) - 1)
+        order = np.argsort(keys, kind='stable')
+        sorted_keys = keys[order]
+        starts = np.flatnonzero(np.r_[True, sorted_keys[1:] != sorted_keys[:-1]])
+        ends = np.r_[starts[1:], len(order)]
+        for s, e in zip(starts, ends):
+            if e - s < 2:
+                continue
+            members = np.sort(order[s:e])
+            for a in range(len(members) - 1):
+                i = members[a]
+                rest = members[a + 1:]
+                d = hamming(hashes[rest], hashes[i])
+                for j, dist in zip(rest[d <= threshold], d[d <= threshold]):
+                    found.add((int(i), int(j), int(dist)))
+    return sorted(found)
+
+def clusters(n, pairs):
+    """Connected components (lists of indices, size >= 2) of the pair graph."""
+    parent = list(range(n))
+    def find(x):
+        while parent[x] != x:
+            parent[x] = parent[parent[x]]
+            x = parent[x]
+        return x
+    for i, j, _ in pairs:
+        ri, rj = find(i), find(j)
+        if ri != rj:
+            parent[max(ri, rj)] = min(ri, rj)
+    groups = defaultdict(list)
+    for i in range(n):
+        groups[find(i)].append(i)
+    return [g for g in groups.values() if len(g) > 1]
+
+def stars(group, hashes, threshold, rank):
+    """
+    Split a connected component into (leader, members) stars: the best-ranked image leads,
+    the images within `threshold` of it join it, and the rest are split again. Chains of
+    near pairs therefore never put two images more than `threshold` apart in one star.
+    """
+    rest = sorted(group, key=rank)
+    out = []
+    while len(rest) > 1:
+        leader = rest[0]
+        close = hamming(hashes[rest], hashes[leader]) <= threshold
+        members = [i for i, c in zip(rest, close) if c]
+        if len(members) > 1:
+            out.append((leader, members))
+        rest = [i for i, c in zip(rest, close) if not c]
+    return out
+
+def dedup_report(index, threshold=DEFAULT_THRESHOLD, cross_folder=False, primaries=()):
+    """The dedup plan and cross-folder collision report for a refreshed HashIndex."""
+    keys, hashes = index.hashed()
+    pairs = near_pairs(hashes, threshold)
+    folder_of = [k.split('/', 1)[0] for k in keys]
+    primaries = set(primaries)
+
+    def rank(i):
+        e = index.entries[keys[i]]
+        return (keys[i] not in primaries, -e['width'] * e['height'], -e['size'], keys[i])
+
+    plan, reclaimable = [], 0
+    groups = [star for group in clusters(len(keys), pairs) for star in stars(group, hashes, threshold, rank)]
+    for leader, group in sorted(groups, key=lambda g: min(g[1])):
+        keep = {leader}
+        if not cross_folder:
+            best = {}  # folder -> its best-ranked copy
+            for i in sorted(group, key=rank):
+                best.setdefault(folder_of[i], i)
+            keep.update(best.values())
+        keep.update(i for i in group if keys[i] in primaries)
+        remove = [i for i in group if i not in keep]
+        exact = [i for i in group if index.entries[keys[i]]['content'] == index.entries[keys[leader]]['content']]
+        reclaimable += sum(index.entries[keys[i]]['size'] for i in remove)
+        plan.append({'keep': [keys[i] for i in sorted(keep, key=rank)],
+                     'remove': [keys[i] for i in sorted(remove, key=rank)],
+                     'members': len(group), 'exact_copies': len(exact) - 1,
+                     'folders': sorted({folder_of[i] for i in group})})
+
+    per_folder = Counter(folder_of)
+    shared = defaultdict(lambda: (set(), set()))  # (folder a, folder b) -> images of a, of b
+    for i, j, _ in pairs:
+        if folder_of[i] == folder_of[j]:
+            continue
+        if folder_of[i] > folder_of[j]:
+            i, j = j, i
+        left, right = shared[(folder_of[i], folder_of[j])]
+        left.add(i)
+        right.add(j)
+    collisions = []
+    for (a, b), (left, right) in shared.items():
+        in_a, in_b = len(left), len(right)
+        share_a, share_b = in_a / per_folder[a], in_b / per_folder[b]
+        collisions.append({'folders': [a, b], 'images': [in_a, in_b],
+                           'share': [round(share_a, 3), round(share_b, 3)],
+                           'flagged': any(share >= COLLISION_FLAG and n >= COLLISION_MIN_IMAGES
+                                          for share, n in ((share_a, in_a), (share_b, in_b)))})
+    collisions.sort(key=lambda c: (-max(c['share']), c['folders']))
+    return {'threshold': threshold, 'cross_folder': cross_folder, 'images': len(keys),
+            'unreadable': len(index.entries) - len(keys), 'near_pairs': len(pairs),
+            'clusters': len(plan), 'removable': sum(len(p['remove']) for p in plan),
+            'reclaimable_bytes': reclaimable, 'plan': plan, 'collisions': collisions}
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument('--images-dir', default=str(IMAGES_DIR))
+    parser.add_argument('--index', default=str(INDEX_FILE))
+    parser.add_argument('--out', default=str(REPORT_FILE))
+    parser.add_argument('--threshold', type=int, default=DEFAULT_THRESHOLD,
+                        help='max differing bits (of 64) for a near-duplicate')
+    parser.add_argument('--cross-folder', action='store_true',
+                        help='also plan removal of copies in other folders')
+    parser.add_argument('--workers', type=int, default=None)
+    args = parser.parse_args()
+
+    started = time.time()
+    index = HashIndex.load(args.images_dir, args.index)
+    hashed = index.refresh(args.workers)
+    index.save()
+    manifest = ImageManifest.load(args.images_dir, MANIFEST_FILE)
+    primaries = [f"{folder}/{entry['primary']['name']}" for folder, entry in manifest.folders.items()
+                 if entry.get('primary')]
+    report = dedup_report(index, args.threshold, args.cross_folder, primaries)
+    report['seconds'] = round(time.time() - started, 3)
+    out = Path(args.out)
+    tmp = out.with_name(out.name + '.tmp')
+    tmp.write_text(json.dumps(report, indent=1, ensure_ascii=False), encoding='utf8')
+    os.replace(tmp, out)
+    flagged = sum(c['flagged'] for c in report['collisions'])
+    print(f"hashed {hashed} new/changed files, {report['images']} readable images; {report['near_pairs']} near pairs "
+          f"in {report['clusters']} clusters; {report['removable']} removable "
+          f"({report['reclaimable_bytes'] / 2**20:.1f} MB); {len(report['collisions'])} folder "
+          f"collisions, {flagged} flagged -> {args.out}")
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,68 @@
+"""
+Background image loading for result cards.
+
+ImageLoader reads images on a small bounded thread pool and keeps the results in an LRU
+of futures, so the cards of a page load concurrently (a slow folder only delays its own
+card) and the next page can be prefetched while the current one is on screen. A source
+is what the app resolved for a breed: a Path, read from disk, or a memoryview into the
+image pack, passed through as-is. Loads of the same key share one future.
+"""
+import threading
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor
+from pathlib import Path
+
+from utils import instrument
+
+LOADER_WORKERS = 4
+LOADER_CACHE = 256
+
+def read_image(source):
+    """Image bytes of a source (memoryviews unchanged); None when there is none on disk."""
+    if source is None or isinstance(source, memoryview):
+        return source
+    with instrument.span('image_loader.read'):
+        try:
+            return Path(source).read_bytes()
+        except FileNotFoundError:
+            return None
+
+class ImageLoader:
+    """Thread-pooled, cached image reads keyed by e.g. (catalog version, breed)."""
+
+    def __init__(self, workers=LOADER_WORKERS, maxsize=LOADER_CACHE):
+        self.maxsize = maxsize
+        self._pool = ThreadPoolExecutor(workers, thread_name_prefix='image-loader')
+        self._lock = threading.Lock()
+        self._futures = OrderedDict()
+
+    def load(self, key, source):
+        """Future of read_image(source); reused while the key stays cached."""
+        with self._lock:
+            fut = self._futures.get(key)
+            if fut is not None:
+                self._futures.move_to_end(key)
+                instrument.count('image_loader.hits')
+                return fut
+            fut = self._pool.submit(read_image, source)
+            self._futures[key] = fut
+            while len(self._futures) > self.maxsize:
+                self._futures.popitem(last=False)
+        fut.add_done_callback(lambda f: self._done(key, f))
+        return fut
+
+    def prefetch(self, items):
+        """Start loading (key, source) pairs without waiting for them."""
+        for key, source in items:
+            self.load(key, source)
+
+    def _done(self, key, fut):
+        if not fut.cancelled() and fut.exception() is None:
+            return
+        # failed reads are retried on the next request instead of staying cached
+        with self._lock:
+            if self._futures.get(key) is fut:
+                del self._futures[key]
+
+    def close(self):
+        self._pool.shutdown(wait=False, cancel_futures=True)
@@ -0,0 +1,186 @@
+"""
+On-disk manifest of the primary image of every breed folder.
+
+Scanning data/images (hundreds of folders, thousands of files) and decoding candidates
+is done once; the manifest records, per folder, the first valid image together with its
+size, dimensions and mtime. refresh() only rescans folders whose directory mtime changed
+or whose recorded image no longer matches on disk.
+
+Build or refresh it from the command line:
+    python -m utils.image_manifest [--images-dir data/images] [--out data/image_manifest.json]
+"""
+import argparse
+import json
+import os
+from pathlib import Path
+
+from utils import instrument
+
+MANIFEST_VERSION = 1
+ROOT = Path(__file__).resolve().parents[1]
+IMAGES_DIR = ROOT / "data" / "images"
+MANIFEST_FILE = ROOT / "data" / "image_manifest.json"
+
+IMAGE_SUFFIXES = ('.jpg', '.jpeg', '.png')
+# suffix preference used when picking a folder's primary image (case-sensitive, like glob)
+SUFFIX_ORDER = ['.jpg', '.jpeg', '.png', '.JPG', '.JPEG', '.PNG',
+                '.Jpg', '.Jpeg', '.Png', '.JpG', '.JpEg', '.PnG']
+
+@instrument.timed('is_valid_image')
+def is_valid_image(img_path):
+    """
+    Check if a file is a valid image that can be opened by PIL.
+    Returns (width, height) if valid, None otherwise.
+    """
+    from PIL import Image  # only needed when folders are (re)scanned
+    try:
+        with Image.open(img_path) as img:
+            img.verify()  # Verify it's a valid image (this closes the file)
+        # Reopen for actual use (verify() closes the file)
+        with Image.open(img_path) as img:
+            img.load()  # Load the image data to ensure it's readable
+            return img.size
+    except Exception:
+        return None
+
+def _candidate_order(name):
+    suffix = os.path.splitext(name)[1]
+    rank = SUFFIX_ORDER.index(suffix) if suffix in SUFFIX_ORDER else len(SUFFIX_ORDER)
+    return (rank, name)
+
+def image_candidates(folder_path):
+    """Image file names in a folder, in primary-image preference order."""
+    names = [e.name for e in os.scandir(folder_path)
+             if e.is_file() and os.path.splitext(e.name)[1].lower() in IMAGE_SUFFIXES]
+    return sorted(names, key=_candidate_order)
+
+def scan_folder(folder_path, validate=is_valid_image):
+    """Manifest entry for one folder: its mtime and first valid image (or None)."""
+    entry = {'mtime_ns': os.stat(folder_path).st_mtime_ns, 'primary': None}
+    for name in image_candidates(folder_path):
+        path = os.path.join(folder_path, name)
+        instrument.count('images_probed')
+        dims = validate(path)
+        if dims:
+            st = os.stat(path)
+            entry['primary'] = {'name': name, 'size': st.st_size, 'mtime_ns': st.st_mtime_ns,
+                                'width': dims[0], 'height': dims[1]}
+            break
+    return entry
+
+def _primary_unchanged(folder_path, primary):
+    if primary is None:
+        return True
+    try:
+        st = os.stat(os.path.join(folder_path, primary['name']))
+    except OSError:
+        return False
+    return st.st_size == primary['size'] and st.st_mtime_ns == primary['mtime_ns']
+
+class ImageManifest:
+    """Folder name -> primary image record for an images directory."""
+
+    def __init__(self, images_dir=IMAGES_DIR, path=MANIFEST_FILE, folders=None):
+        self.images_dir = Path(images_dir)
+        self.path = Path(path) if path else None
+        self.folders = folders or {}
+        self.dirty = False
+
+    @classmethod
+    def load(cls, images_dir=IMAGES_DIR, path=MANIFEST_FILE):
+        """Read a saved manifest; starts empty when missing, stale-format or for another directory."""
+        manifest = cls(images_dir, path)
+        if manifest.path and manifest.path.exists():
+            try:
+                data = json.loads(manifest.path.read_text(encoding='utf8'))
+            except ValueError:
+                data = {}
+            if (data.get('version') == MANIFEST_VERSION
+                    and data.get('images_dir') == str(manifest.images_dir.resolve())):
+                manifest.folders = data.get('folders', {})
+        return manifest
+
+    def refresh(self, validate=is_valid_image):
+        """Rescan changed, new and removed folders. Returns the number of folders rescanned."""
+        if not self.images_dir.exists():
+            if self.folders:
+                self.folders, self.dirty = {}, True
+            return 0
+        rescanned = 0
+        seen = set()
+        for e in os.scandir(self.images_dir):
+            if not e.is_dir():
+                continue
+            seen.add(e.name)
+            old = self.folders.get(e.name)
+            if (old is not None and old['mtime_ns'] == e.stat().st_mtime_ns
+                    and _primary_unchanged(e.path, old['primary'])):
+                continue
+            self.folders[e.name] = scan_folder(e.path, validate)
+            rescanned += 1
+        for name in set(self.folders) - seen:
+            del self.folders[name]
+            rescanned += 1
+        if rescanned:
+            self.dirty = True
+        return rescanned
+
+    def save(self):
+        """Write the manifest atomically (temp file + rename)."""
+        data = {'version': MANIFEST_VERSION, 'images_dir': str(self.images_dir.resolve()),
+                'folders': self.folders}
+        tmp = self.path.with_name(self.path.name + '.tmp')
+        tmp.write_text(json.dumps(data, ensure_ascii=False, sort_keys=True), encoding='utf8')
+        os.replace(tmp, self.path)
+        self.dirty = False
+
+    def __contains__(self, folder):
+        return folder in self.folders
+
+    def primary(self, folder):
+        """Path of a folder's primary image, or None."""
+        entry = self.folders.get(folder)
+        if not entry or not entry['primary']:
+            return None
+        return self.images_dir / folder / entry['primary']['name']
+
+    def record(self, folder):
+        """The primary image record (name, size, width, height, mtime_ns) or None."""
+        entry = self.folders.get(folder)
+        return entry['primary'] if entry else None
+
+def default_validator(images_dir=IMAGES_DIR):
+    """
+    Trust the offline validation report (utils.image_validation) when there is a current
+    one for images_dir, so folders are scanned without decoding; else decode candidates.
+    """
+    from utils.image_validation import load_report, trusted_validator
+    report = load_report(images_dir=images_dir)
+    return trusted_validator(report, is_valid_image) if report else is_valid_image
+
+def load_manifest(images_dir=IMAGES_DIR, path=MANIFEST_FILE):
+    """Load, incrementally refresh and (if anything changed) persist the manifest."""
+    manifest = ImageManifest.load(images_dir, path)
+    manifest.refresh(default_validator(images_dir))
+    if manifest.dirty and manifest.path:
+        try:
+            manifest.save()
+        except OSError:
+            pass  # read-only deployments still get the in-memory manifest
+    return manifest
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument('--images-dir', default=str(IMAGES_DIR))
+    parser.add_argument('--out', default=str(MANIFEST_FILE))
+    args = parser.parse_args()
+    manifest = ImageManifest.load(args.images_dir, args.out)
+    rescanned = manifest.refresh(default_validator(args.images_dir))
+    manifest.save()
+    missing = sorted(f for f in manifest.folders if not manifest.folders[f]['primary'])
+    print(f"{len(manifest.folders)} folders, {rescanned} rescanned, {len(missing)} without a valid image")
+    for name in missing:
+        print(f"  no image: {name}")
+
+if __name__ == '__main__':
+    main()
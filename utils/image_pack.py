@@ -0,0 +1,156 @@
+"""
+Single-file image pack with memory-mapped, zero-copy reads.
+
+The serving image of every breed folder (its card-width thumbnail, or the original when
+no thumbnail has been built) is written into one contiguous file:
+
+    b'DOGPACK1' | image bytes ... | index (JSON) | index offset (u64) | index length (u64) | b'DOGPACK1'
+
+The index maps "<folder>/<name>" keys to (offset, length) and each folder to its image key.
+ImagePack maps the file read-only and hands out memoryview slices of it, so serving an
+image costs no open() or stat() and no copy until the renderer needs one. PackCache keeps
+the pack open for long-running processes and reopens it when the file is rebuilt.
+
+    python -m utils.image_pack [--originals] [--width 480] [--out data/images.pack]
+"""
+import argparse
+import json
+import mmap
+import os
+import struct
+import threading
+from pathlib import Path
+
+from utils.image_manifest import load_manifest
+from utils.thumbnails import CARD_WIDTH, THUMBS_DIR, serving_path
+
+ROOT = Path(__file__).resolve().parents[1]
+PACK_FILE = ROOT / "data" / "images.pack"
+MAGIC = b'DOGPACK1'
+_FOOTER = struct.Struct('<QQ8s')
+
+def write_pack(items, path=PACK_FILE):
+    """
+    Write (folder, source path) items into a pack file, atomically.
+    Returns the number of images packed.
+    """
+    path = Path(path)
+    entries, folders = {}, {}
+    tmp = path.with_name(path.name + '.tmp')
+    with open(tmp, 'wb') as out:
+        out.write(MAGIC)
+        for folder, source in items:
+            source = Path(source)
+            key = f"{folder}/{source.name}"
+            data = source.read_bytes()
+            entries[key] = [out.tell(), len(data)]
+            folders[folder] = key
+            out.write(data)
+        index = json.dumps({'entries': entries, 'folders': folders}, ensure_ascii=False).encode('utf8')
+        offset = out.tell()
+        out.write(index)
+        out.write(_FOOTER.pack(offset, len(index), MAGIC))
+    os.replace(tmp, path)
+    return len(entries)
+
+class ImagePack:
+    """Read-only, memory-mapped view of a pack file."""
+
+    def __init__(self, path=PACK_FILE):
+        self.path = Path(path)
+        with open(self.path, 'rb') as f:
+            self._mmap = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+        self._view = memoryview(self._mmap)
+        if len(self._mmap) < len(MAGIC) + _FOOTER.size or self._mmap[:len(MAGIC)] != MAGIC:
+            self.close()
+            raise ValueError(f"{self.path} is not an image pack")
+        offset, length, magic = _FOOTER.unpack_from(self._mmap, len(self._mmap) - _FOOTER.size)
+        if magic != MAGIC:
+            self.close()
+            raise ValueError(f"{self.path} is truncated")
+        index = json.loads(bytes(self._view[offset:offset + length]).decode('utf8'))
+        self.entries = index['entries']
+        self.folders = index['folders']
+
+    def __contains__(self, key):
+        return key in self.entries
+
+    def __len__(self):
+        return len(self.entries)
+
+    def get(self, key):
+        """memoryview of an image's bytes (no copy), or None."""
+        loc = self.entries.get(key)
+        if loc is None:
+            return None
+        offset, length = loc
+        return self._view[offset:offset + length]
+
+    def folder_image(self, folder):
+        """memoryview of a breed folder's serving image, or None."""
+        key = self.folders.get(folder)
+        return self.get(key) if key else None
+
+    def close(self):
+        self._view.release()
+        try:
+            self._mmap.close()
+        except BufferError:
+            pass  # slices still in use; the mapping goes away with the last of them
+
+def open_pack(path=PACK_FILE):
+    """ImagePack for `path`, or None when there is no (valid) pack, so callers fall back to files."""
+    try:
+        return ImagePack(path)
+    except (OSError, ValueError):
+        return None
+
+def pack_stat(path=PACK_FILE):
+    """(size, mtime_ns, inode) of a pack file, or None; changes whenever the pack is rebuilt."""
+    try:
+        st = os.stat(path)
+    except OSError:
+        return None
+    return st.st_size, st.st_mtime_ns, st.st_ino
+
+class PackCache:
+    """The open ImagePack for a pack file's current stat; a rebuilt file is reopened and the old mapping closed."""
+
+    def __init__(self, path=PACK_FILE):
+        self.path = Path(path)
+        self._lock = threading.Lock()
+        self._stat = None
+        self._pack = None
+
+    def get(self, stat=None):
+        """The pack matching `stat` (default: the file's stat now), or None when there is none."""
+        if stat is None:
+            stat = pack_stat(self.path)
+        with self._lock:
+            if stat != self._stat:
+                old = self._pack
+                self._pack = open_pack(self.path) if stat else None
+                self._stat = stat
+                if old is not None:
+                    old.close()
+            return self._pack
+
+def serving_items(manifest, width=CARD_WIDTH, thumbs_dir=THUMBS_DIR):
+    """(folder, path) of each folder's serving image: its thumbnail if built, else the original."""
+    for folder in sorted(manifest.folders):
+        source = manifest.primary(folder)
+        if source is not None:
+            yield folder, serving_path(source, width, thumbs_dir) if width else source
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument('--out', default=str(PACK_FILE))
+    parser.add_argument('--width', type=int, default=CARD_WIDTH, help='thumbnail width to pack')
+    parser.add_argument('--originals', action='store_true', help='pack original images, not thumbnails')
+    args = parser.parse_args()
+    items = serving_items(load_manifest(), None if args.originals else args.width)
+    count = write_pack(items, args.out)
+    print(f"packed {count} images into {args.out} ({os.path.getsize(args.out)} bytes)")
+
+if __name__ == '__main__':
+    main()
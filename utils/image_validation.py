@@ -0,0 +1,198 @@
+"""
+Offline validation of the image dataset.
+
+Every image is checked on a process pool. A cheap pass reads the file header (format
+magic, dimensions) and its tail (JPEG end-of-image marker, PNG IEND chunk); images are
+only fully decoded when that pass cannot vouch for them, or with --full. The JSON report
+lists, per breed folder, the files that are corrupt, truncated, not images at all (e.g.
+git-lfs pointers), carry the wrong extension, or are oversized, plus the size and mtime
+of every file checked.
+
+    python -m utils.image_validation [--full] [--workers N] [--out data/image_report.json]
+
+The image manifest trusts a current report: files it checked and does not flag, still
+with the recorded size and mtime, are accepted from their header alone, with no decoding.
+"""
+import argparse
+import json
+import os
+import time
+from collections import Counter
+from concurrent.futures import ProcessPoolExecutor
+from pathlib import Path
+
+from PIL import Image
+
+from utils.image_manifest import IMAGES_DIR, IMAGE_SUFFIXES
+
+ROOT = Path(__file__).resolve().parents[1]
+REPORT_FILE = ROOT / "data" / "image_report.json"
+REPORT_VERSION = 2
+MAX_BYTES = 5 * 1024 * 1024
+MAX_PIXELS = 4000 * 4000
+# statuses that make a file unusable; mislabeled/oversized files still render
+UNUSABLE = ('not_image', 'corrupt', 'truncated')
+
+_MAGIC = [
+    (b'\xff\xd8\xff', 'JPEG'),
+    (b'\x89PNG\r\n\x1a\n', 'PNG'),
+    (b'GIF87a', 'GIF'),
+    (b'GIF89a', 'GIF'),
+    (b'BM', 'BMP'),
+]
+_EXTENSIONS = {'JPEG': ('.jpg', '.jpeg'), 'PNG': ('.png',), 'GIF': ('.gif',),
+               'BMP': ('.bmp',), 'WEBP': ('.webp',)}
+
+def sniff_format(head):
+    """Image format from the first bytes of a file, or None."""
+    for magic, fmt in _MAGIC:
+        if head.startswith(magic):
+            return fmt
+    if head[:4] == b'RIFF' and head[8:12] == b'WEBP':
+        return 'WEBP'
+    return None
+
+def _tail_ok(fmt, tail):
+    """
+    True when the trailer proves the file complete. False (marker not near the end, e.g.
+    behind long padding) or None (no trailer to check) leave it to a full decode.
+    """
+    if fmt == 'JPEG':
+        # allow trailing padding after the end-of-image marker
+        return b'\xff\xd9' in tail[-64:]
+    if fmt == 'PNG':
+        return b'IEND\xaeB`\x82' in tail[-64:]
+    return None
+
+def check_image(path, full=False, max_bytes=MAX_BYTES, max_pixels=MAX_PIXELS):
+    """
+    Validate one file. Returns a record with `issues` (empty when fine), and the format,
+    dimensions, size and mtime when known.
+    """
+    rec = {'name': os.path.basename(path), 'issues': []}
+    try:
+        st = os.stat(path)
+        size = st.st_size
+        rec['bytes'], rec['mtime_ns'] = size, st.st_mtime_ns
+        with open(path, 'rb') as f:
+            head = f.read(32)
+            f.seek(max(0, size - 64))
+            tail = f.read(64)
+    except OSError as e:
+        rec['issues'].append('corrupt')
+        rec['error'] = str(e)
+        return rec
+    fmt = sniff_format(head)
+    if fmt is None:
+        rec['issues'].append('not_image')
+        if head.startswith(b'version https://git-lfs'):
+            rec['error'] = 'git-lfs pointer'
+        return rec
+    rec['format'] = fmt
+    if os.path.splitext(path)[1].lower() not in _EXTENSIONS.get(fmt, ()):
+        rec['issues'].append('mislabeled_extension')
+    complete = _tail_ok(fmt, tail)
+    try:
+        with Image.open(path) as img:  # parses the header only
+            rec['width'], rec['height'] = img.size
+            if full or not complete:
+                img.load()  # raises on a truncated or corrupt file
+    except Exception as e:
+        # a decode failure with no end marker in sight is a cut-off file
+        truncated = complete is False or 'truncated' in str(e)
+        rec['issues'].append('truncated' if truncated else 'corrupt')
+        rec['error'] = f"{type(e).__name__}: {e}"
+        return rec
+    if size > max_bytes or rec['width'] * rec['height'] > max_pixels:
+        rec['issues'].append('oversized')
+    return rec
+
+def check_folder(folder_path, full=False, max_bytes=MAX_BYTES, max_pixels=MAX_PIXELS):
+    """Check every image file in a folder; runs in pool workers. Returns (folder name, records)."""
+    names = sorted(e.name for e in os.scandir(folder_path)
+                   if e.is_file() and os.path.splitext(e.name)[1].lower() in IMAGE_SUFFIXES + ('.gif', '.bmp', '.webp'))
+    return (os.path.basename(folder_path),
+            [check_image(os.path.join(folder_path, n), full, max_bytes, max_pixels) for n in names])
+
+def validate_tree(images_dir=IMAGES_DIR, full=False, workers=None,
+                  max_bytes=MAX_BYTES, max_pixels=MAX_PIXELS):
+    """Validate every breed folder of an image tree in parallel; returns the report dict."""
+    started = time.time()
+    folders = sorted(e.path for e in os.scandir(images_dir) if e.is_dir())
+    report = {'version': REPORT_VERSION, 'images_dir': str(Path(images_dir).resolve()),
+              'generated_at': started, 'full_decode': full, 'folders': {}}
+    totals = Counter()
+    with ProcessPoolExecutor(max_workers=workers) as pool:
+        n = len(folders)
+        results = pool.map(check_folder, folders, [full] * n, [max_bytes] * n, [max_pixels] * n)
+        for folder, records in results:
+            issues = [r for r in records if r['issues']]
+            totals['checked'] += len(records)
+            for r in issues:
+                totals.update(r['issues'])
+            files = {r['name']: [r['bytes'], r['mtime_ns']] for r in records if 'mtime_ns' in r}
+            report['folders'][folder] = {'checked': len(records), 'issues': issues, 'files': files}
+    report['summary'] = dict(totals)
+    report['seconds'] = round(time.time() - started, 3)
+    return report
+
+def load_report(path=REPORT_FILE, images_dir=IMAGES_DIR):
+    """A saved report for `images_dir`, or None."""
+    path = Path(path)
+    if not path.exists():
+        return None
+    try:
+        report = json.loads(path.read_text(encoding='utf8'))
+    except ValueError:
+        return None
+    if report.get('version') != REPORT_VERSION or report.get('images_dir') != str(Path(images_dir).resolve()):
+        return None
+    return report
+
+def trusted_validator(report, fallback):
+    """
+    Validator for the image manifest that trusts `report` for the files it checked, as
+    long as their size and mtime still match the recorded ones: flagged-unusable files are
+    rejected, other files are accepted from their header alone. Files the report does not
+    know, or that changed since, go through `fallback` (full validation).
+    """
+    unusable = {(folder, r['name'])
+                for folder, entry in report['folders'].items()
+                for r in entry['issues'] if set(r['issues']) & set(UNUSABLE)}
+    checked = {(folder, name): tuple(stat)
+               for folder, entry in report['folders'].items()
+               for name, stat in entry.get('files', {}).items()}
+
+    def validate(path):
+        key = (os.path.basename(os.path.dirname(path)), os.path.basename(path))
+        try:
+            st = os.stat(path)
+            if checked.get(key) != (st.st_size, st.st_mtime_ns):
+                return fallback(path)
+            if key in unusable:
+                return None
+            with Image.open(path) as img:
+                return img.size
+        except Exception:
+            return None
+    return validate
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument('--images-dir', default=str(IMAGES_DIR))
+    parser.add_argument('--out', default=str(REPORT_FILE))
+    parser.add_argument('--full', action='store_true', help='fully decode every image')
+    parser.add_argument('--workers', type=int, default=None)
+    parser.add_argument('--max-bytes', type=int, default=MAX_BYTES)
+    parser.add_argument('--max-pixels', type=int, default=MAX_PIXELS)
+    args = parser.parse_args()
+    report = validate_tree(args.images_dir, args.full, args.workers, args.max_bytes, args.max_pixels)
+    out = Path(args.out)
+    tmp = out.with_name(out.name + '.tmp')
+    tmp.write_text(json.dumps(report, indent=1, ensure_ascii=False), encoding='utf8')
+    os.replace(tmp, out)
+    print(f"checked {report['summary'].get('checked', 0)} images in {report['seconds']}s: "
+          + ", ".join(f"{k}={v}" for k, v in sorted(report['summary'].items()) if k != 'checked'))
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,188 @@
+"""
+Incremental rescoring for interactive sessions.
+
+An IncrementalScorer keeps one session's per-component score arrays and their weighted
+sum. When prefs change it only recomputes the components whose (canonical) preference
+changed: the old contribution is subtracted from the sum and the new one added, then the
+top-k is reselected. Every REBUILD_EVERY updates the sum is re-accumulated from the stored
+components so floating-point drift stays bounded, and the few rows within DRIFT_TOLERANCE
+of the k-th best are rescored exactly, so rankings match a full rescore bit for bit. Paged
+rankings work the same way: each page is picked from the running sum and only the rows
+near the page boundary are rescored exactly.
+
+SessionScorers holds one scorer per session id, bounded in number and expiring after a
+period of inactivity or when the session ends.
+"""
+import threading
+import time
+from collections import OrderedDict
+
+import numpy as np
+
+from utils.matching import (COMPONENTS, DEFAULT_WEIGHTS, MatchResult, Ranking,
+                            _component_score, _encode_pref, _trait_columns, canonical_prefs,
+                            catalog_arrays, top_k_indices)
+
+REBUILD_EVERY = 32
+DRIFT_TOLERANCE = 1e-9
+
+class _SessionRanking(Ranking):
+    """
+    A Ranking over a scorer's running (approximate) scores: each page rescores exactly only
+    the rows within DRIFT_TOLERANCE of its boundary, so the order and the scores handed out
+    are those of a full rescore.
+    """
+    def __init__(self, df, approx, components, weights, wsum):
+        super().__init__(df, approx)
+        self._components = [(components[name], weights[name]) for name, _ in COMPONENTS
+                            if name in components]
+        self._wsum = wsum
+
+    def _exact(self, rows):
+        exact = np.zeros(len(rows))
+        for comp, w in self._components:
+            exact += comp[rows] * w
+        return exact / (self._wsum + 1e-9)
+
+    def _extend(self, stop):
+        need = min(stop - len(self._order), len(self._rest))
+        if need <= 0:
+            return
+        approx = self.scores[self._rest]
+        kth = np.partition(approx, len(approx) - need)[len(approx) - need]
+        near = np.flatnonzero(approx >= kth - DRIFT_TOLERANCE)
+        rows = self._rest[near]
+        self.scores[rows] = exact = self._exact(rows)
+        idx, _ = top_k_indices(exact, need)
+        keep = np.ones(len(self._rest), dtype=bool)
+        keep[near[idx[0]]] = False
+        self._order = np.concatenate([self._order, rows[idx[0]]])
+        self._rest = self._rest[keep]
+
+class IncrementalScorer:
+    """Scores of one session's prefs over a breeds dataframe, updated component by component."""
+
+    def __init__(self, df, weights=None, version=None):
+        self.df = df
+        self.version = version
+        self.weights = weights or DEFAULT_WEIGHTS
+        traits, self.sizes = catalog_arrays(df)
+        self._cols = _trait_columns(traits)
+        self.n = len(df)
+        self.key = None
+        self.components = {}
+        self.total = np.zeros(self.n)
+        self.wsum = 0.0
+        self.updates = 0
+        self.components_computed = 0
+        self._ranking = None
+
+    def _component(self, name, key, prefs):
+        self.components_computed += 1
+        value = _encode_pref(name, prefs[key])
+        return np.broadcast_to(_component_score(name, value, self._cols, self.sizes), (self.n,))
+
+    def _accumulate(self):
+        self.total = np.zeros(self.n)
+        for name, _ in COMPONENTS:
+            if name in self.components:
+                self.total += self.components[name] * self.weights[name]
+
+    def update(self, prefs):
+        """Bring the scores up to date with prefs; returns the normalized scores."""
+        key = canonical_prefs(prefs, self.sizes is not None)
+        if self.key is None:
+            for (name, pref_key), value in zip(COMPONENTS, key):
+                if value is not None:
+                    self.components[name] = self._component(name, pref_key, prefs)
+            self._accumulate()
+        elif key != self.key:
+            for (name, pref_key), old, new in zip(COMPONENTS, self.key, key):
+                if old == new:
+                    continue
+                w = self.weights[name]
+                if old is not None:
+                    self.total -= self.components.pop(name) * w
+                if new is not None:
+                    self.components[name] = self._component(name, pref_key, prefs)
+                    self.total += self.components[name] * w
+            self.updates += 1
+            if self.updates % REBUILD_EVERY == 0:
+                self._accumulate()
+        self.key = key
+        self.wsum = sum(self.weights[name] for name, _ in COMPONENTS if name in self.components)
+        return self.total / (self.wsum + 1e-9)
+
+    def ranking(self, prefs):
+        """
+        A matching.Ranking of every breed for prefs, with exact scores (same order as a full
+        rescore), built on the running scores without re-adding every component. Kept while
+        prefs are unchanged, so later pages continue where it left off.
+        """
+        approx = self.update(prefs)
+        if self._ranking is None or self._ranking[0] != self.key:
+            ranking = _SessionRanking(self.df, approx, dict(self.components), self.weights, self.wsum)
+            self._ranking = (self.key, ranking)
+        return self._ranking[1]
+
+    def top_k_matches(self, prefs, k=3, breakdown=False):
+        """Like matching.top_k_matches (same result), reusing the components of the previous call."""
+        approx = self.update(prefs)
+        k = min(k, self.n)
+        if k == 0:
+            return MatchResult(self.df, [], [])
+        kth = np.partition(approx, self.n - k)[self.n - k]
+        rows = np.flatnonzero(approx >= kth - DRIFT_TOLERANCE)
+        # exact scores of the candidates, accumulated in the same order as combine_scores
+        exact = np.zeros(len(rows))
+        for name, _ in COMPONENTS:
+            if name in self.components:
+                exact += self.components[name][rows] * self.weights[name]
+        idx, vals = top_k_indices(exact / (self.wsum + 1e-9), k)
+        rows = rows[idx[0]]
+        picked = None
+        if breakdown:
+            picked = {name: v[rows] for name, v in self.components.items()}
+        return MatchResult(self.df, rows, vals[0], picked)
+
+class SessionScorers:
+    """Bounded, expiring session id -> IncrementalScorer map. Thread-safe."""
+
+    def __init__(self, maxsize=256, ttl=1800):
+        self.maxsize = maxsize
+        self.ttl = ttl
+        self._sessions = OrderedDict()  # id -> (scorer, last used)
+        self._lock = threading.Lock()
+
+    def get(self, session_id, df, weights=None, version=None):
+        """The session's scorer, replaced when the catalog (object or version) or weights changed."""
+        now = time.monotonic()
+        with self._lock:
+            self._expire(now)
+            entry = self._sessions.pop(session_id, None)
+            scorer = entry[0] if entry else None
+            if (scorer is None or scorer.df is not df or scorer.version != version
+                    or scorer.weights != (weights or DEFAULT_WEIGHTS)):
+                scorer = IncrementalScorer(df, weights, version)
+            self._sessions[session_id] = (scorer, now)
+            while len(self._sessions) > self.maxsize:
+                self._sessions.popitem(last=False)
+        return scorer
+
+    def top_k_matches(self, session_id, df, prefs, k=3, weights=None, version=None, breakdown=False):
+        return self.get(session_id, df, weights, version).top_k_matches(prefs, k, breakdown)
+
+    def end(self, session_id):
+        """Drop a session's state (call when the session ends)."""
+        with self._lock:
+            self._sessions.pop(session_id, None)
+
+    def _expire(self, now):
+        while self._sessions:
+            _, (_, last) = next(iter(self._sessions.items()))
+            if now - last <= self.ttl:
+                break
+            self._sessions.popitem(last=False)
+
+    def __len__(self):
+        return len(self._sessions)
@@ -0,0 +1,310 @@
+"""
+Per-stage timing, counters and slow-request profiling.
+
+Off by default; every hook then returns immediately (a flag check), so the calls can
+stay in the request path. When enabled, spans record their duration into in-process
+log-bucket histograms and counters are summed; snapshot() summarises both and export()
+writes them as JSON to a file or POSTs them to an http(s) URL.
+
+    from utils import instrument
+    with instrument.span('score_breeds.sort'):
+        ...
+    instrument.count('rows_scored', len(df))
+
+    @instrument.timed('generate_social_post')
+    def generate_social_post(...): ...
+
+request(name) wraps a whole request: a span, plus (with profiling on) stack samples of
+the calling thread taken every few ms. Requests slower than slow_ms are appended to a
+folded-stacks file ("frame;frame;frame count" lines, as read by flamegraph.pl or
+speedscope).
+
+Configuration comes from configure() or, at import, the environment:
+DOG_INSTRUMENT=1, DOG_INSTRUMENT_EXPORT=<path or URL> (written at exit),
+DOG_PROFILE_SLOW_MS=<ms> (turns profiling on) and DOG_PROFILE_FILE=<path>.
+"""
+import atexit
+import bisect
+import functools
+import json
+import os
+import sys
+import threading
+import time
+import urllib.request
+from collections import Counter
+from pathlib import Path
+
+ROOT = Path(__file__).resolve().parents[1]
+PROFILE_FILE = ROOT / "data" / "slow_requests.folded"
+SAMPLE_INTERVAL = 0.005
+MAX_DEPTH = 64
+# histogram bucket upper bounds: 1us .. ~137s, four buckets per doubling
+_BOUNDS = [1e-6 * 2 ** (i / 4) for i in range(108)]
+
+_enabled = False
+
+class Histogram:
+    """Count, sum, min, max and log-spaced buckets of durations (seconds)."""
+
+    __slots__ = ('count', 'total', 'min', 'max', 'buckets')
+
+    def __init__(self):
+        self.count = 0
+        self.total = 0.0
+        self.min = float('inf')
+        self.max = 0.0
+        self.buckets = [0] * (len(_BOUNDS) + 1)
+
+    def add(self, value):
+        self.count += 1
+        self.total += value
+        if value < self.min:
+            self.min = value
+        if value > self.max:
+            self.max = value
+        self.buckets[bisect.bisect_left(_BOUNDS, value)] += 1
+
+    def percentile(self, q):
+        """Upper bound of the bucket holding the q-th percentile (capped at max)."""
+        if not self.count:
+            return 0.0
+        rank = q / 100 * self.count
+        seen = 0
+        for i, n in enumerate(self.buckets):
+            seen += n
+            if n and seen >= rank:
+                return min(_BOUNDS[i] if i < len(_BOUNDS) else self.max, self.max)
+        return self.max
+
+    def summary(self):
+        ms = lambda v: round(v * 1000, 4)
+        return {'count': self.count, 'total_ms': ms(self.total),
+                'mean_ms': ms(self.total / self.count) if self.count else 0.0,
+                'min_ms': ms(self.min) if self.count else 0.0, 'max_ms': ms(self.max),
+                'p50_ms': ms(self.percentile(50)), 'p95_ms': ms(self.percentile(95)),
+                'p99_ms': ms(self.percentile(99))}
+
+class Registry:
+    """Thread-safe named histograms and counters."""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self.histograms = {}
+        self.counters = Counter()
+        self.started = time.time()
+
+    def observe(self, name, seconds):
+        with self._lock:
+            hist = self.histograms.get(name)
+            if hist is None:
+                hist = self.histograms[name] = Histogram()
+            hist.add(seconds)
+
+    def count(self, name, n=1):
+        with self._lock:
+            self.counters[name] += n
+
+    def snapshot(self):
+        with self._lock:
+            return {'since': round(self.started, 3), 'time': round(time.time(), 3),
+                    'spans': {name: h.summary() for name, h in sorted(self.histograms.items())},
+                    'counters': dict(sorted(self.counters.items()))}
+
+    def reset(self):
+        with self._lock:
+            self.histograms.clear()
+            self.counters.clear()
+            self.started = time.time()
+
+registry = Registry()
+
+class _NoopSpan:
+    __slots__ = ()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        return False
+
+_NOOP = _NoopSpan()
+
+class _Span:
+    __slots__ = ('name', 'started')
+
+    def __init__(self, name):
+        self.name = name
+
+    def __enter__(self):
+        self.started = time.perf_counter()
+        return self
+
+    def __exit__(self, *exc):
+        registry.observe(self.name, time.perf_counter() - self.started)
+        if exc[0] is not None:
+            registry.count(self.name + '.errors')
+        return False
+
+def enabled():
+    return _enabled
+
+def span(name):
+    """Context manager timing a block into the `name` histogram."""
+    if not _enabled:
+        return _NOOP
+    return _Span(name)
+
+def count(name, n=1):
+    """Add n to a counter."""
+    if _enabled:
+        registry.count(name, n)
+
+def timed(name=None):
+    """Decorator: time every call of the function as span `name` (default: its qualname)."""
+    def wrap(fn):
+        label = name or fn.__qualname__
+        @functools.wraps(fn)
+        def inner(*args, **kwargs):
+            if not _enabled:
+                return fn(*args, **kwargs)
+            with _Span(label):
+                return fn(*args, **kwargs)
+        return inner
+    return wrap
+
+class Sampler:
+    """
+    One background thread sampling the stacks of the threads currently inside a
+    profiled request; stops itself when none are.
+    """
+
+    def __init__(self, interval=SAMPLE_INTERVAL):
+        self.interval = interval
+        self._lock = threading.Lock()
+        self._watched = {}  # thread id -> Counter of folded stacks
+        self._thread = None
+
+    def watch(self, thread_id):
+        stacks = Counter()
+        with self._lock:
+            self._watched[thread_id] = stacks
+            if self._thread is None:
+                self._thread = threading.Thread(target=self._run, name='instrument-sampler', daemon=True)
+                self._thread.start()
+        return stacks
+
+    def unwatch(self, thread_id):
+        with self._lock:
+            self._watched.pop(thread_id, None)
+
+    def _run(self):
+        while True:
+            time.sleep(self.interval)
+            with self._lock:
+                if not self._watched:
+                    self._thread = None
+                    return
+                watched = list(self._watched.items())
+            frames = sys._current_frames()
+            for tid, stacks in watched:
+                frame = frames.get(tid)
+                if frame is not None:
+                    stacks[_fold(frame)] += 1
+
+def _fold(frame):
+    parts = []
+    while frame is not None and len(parts) < MAX_DEPTH:
+        code = frame.f_code
+        parts.append(f"{code.co_name} ({os.path.basename(code.co_filename)}:{frame.f_lineno})")
+        frame = frame.f_back
+    return ';'.join(reversed(parts))
+
+_profile = {'slow_ms': None, 'file': PROFILE_FILE}
+_sampler = Sampler()
+_profile_lock = threading.Lock()
+
+class _Request(_Span):
+    __slots__ = ('stacks',)
+
+    def __enter__(self):
+        self.stacks = _sampler.watch(threading.get_ident()) if _profile['slow_ms'] is not None else None
+        return super().__enter__()
+
+    def __exit__(self, *exc):
+        elapsed = time.perf_counter() - self.started
+        super().__exit__(*exc)
+        if self.stacks is not None:
+            _sampler.unwatch(threading.get_ident())
+            slow_ms = _profile['slow_ms']  # configure() may have turned profiling off meanwhile
+            if slow_ms is not None and elapsed * 1000 >= slow_ms and self.stacks:
+                registry.count(self.name + '.profiled')
+                _write_stacks(self.name, self.stacks)
+        return False
+
+def _write_stacks(name, stacks):
+    lines = ''.join(f"{name};{stack} {n}\n" for stack, n in stacks.items())
+    with _profile_lock:
+        with open(_profile['file'], 'a', encoding='utf8') as f:
+            f.write(lines)
+
+def request(name):
+    """Like span(), and samples the thread's stacks while profiling slow requests."""
+    if not _enabled:
+        return _NOOP
+    return _Request(name)
+
+def snapshot():
+    return registry.snapshot()
+
+def export(target):
+    """Write the snapshot as JSON to a file path, or POST it to an http(s):// URL."""
+    data = json.dumps(snapshot(), indent=1).encode('utf8')
+    target = str(target)
+    if target.startswith(('http://', 'https://')):
+        req = urllib.request.Request(target, data=data, method='POST',
+                                     headers={'Content-Type': 'application/json'})
+        with urllib.request.urlopen(req, timeout=5) as resp:
+            resp.read()
+        return
+    path = Path(target)
+    tmp = path.with_name(path.name + '.tmp')
+    tmp.write_bytes(data)
+    os.replace(tmp, path)
+
+_export_target = {'target': None, 'registered': False}
+
+def _export_at_exit():
+    target = _export_target['target']
+    if target is None:
+        return
+    try:
+        export(target)
+    except OSError as e:
+        print(f"instrument: export to {target} failed: {e}", file=sys.stderr)
+
+def configure(enabled=True, export_to=None, slow_ms=None, profile_file=None):
+    """
+    Turn instrumentation on or off. export_to (the latest one given; none once disabled)
+    is written at interpreter exit.
+    """
+    global _enabled
+    _enabled = bool(enabled)
+    _profile['slow_ms'] = slow_ms if enabled else None
+    if profile_file:
+        _profile['file'] = Path(profile_file)
+    if not enabled:
+        _export_target['target'] = None
+    elif export_to:
+        _export_target['target'] = export_to
+        if not _export_target['registered']:
+            atexit.register(_export_at_exit)
+            _export_target['registered'] = True
+
+def _configure_from_env():
+    slow = os.environ.get('DOG_PROFILE_SLOW_MS')
+    if os.environ.get('DOG_INSTRUMENT', '').lower() in ('1', 'true', 'yes') or slow:
+        configure(True, os.environ.get('DOG_INSTRUMENT_EXPORT') or None,
+                  float(slow) if slow else None, os.environ.get('DOG_PROFILE_FILE') or None)
+
+_configure_from_env()
@@ -0,0 +1,487 @@
+"""
+Concurrent load testing with latency SLOs.
+
+Replays preference profiles against the matching request path, either in-process (the
+app's path: shared catalog, cached top-k scoring, card image reads, social post) or
+against a local HTTP front end speaking utils.service's API (POST /match, then POST
+/social_post). Profiles come from a JSONL/CSV file or are drawn from a skewed
+distribution of form answers (most users keep the defaults).
+
+Load runs as a sequence of steps, each `concurrency x seconds`, optionally `@rate`:
+without a rate every worker sends back to back (closed loop); with one, requests arrive
+as a Poisson process (open loop) and latency counts from the scheduled arrival, so
+queueing under overload shows up instead of being hidden. Steps run on a thread driver or
+an asyncio driver. Per step the report has p50/p95/p99 latency (total and per request
+phase), throughput, error rate and the peak RSS of this process (or --rss-pid). SLOs
+like `p99<=250` (ms), `score.p95<=20`, `error_rate<=0.01` or `throughput>=100` are checked
+per step and the run exits non-zero when one is breached.
+
+    python -m utils.loadtest [--target inprocess|http://127.0.0.1:8765] [--driver thread|asyncio]
+                             [--steps 4x10s,16x10s@200] [--slo p99<=250 ...] [--out report.json]
+"""
+import argparse
+import asyncio
+import http.client
+import itertools
+import json
+import os
+import queue
+import random
+import re
+import resource
+import sys
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from urllib.parse import urlsplit
+
+import numpy as np
+
+ARRIVAL_GRACE = 5.0  # seconds an open-loop step may run over to drain its backlog
+RSS_INTERVAL = 0.02
+_STEP = re.compile(r'^(\d+)x(\d+(?:\.\d+)?)s?(?:@(\d+(?:\.\d+)?))?$')
+_SLO = re.compile(r'^([\w.]+)\s*(<=|>=)\s*([\d.]+)$')
+
+def realistic_prefs(rng):
+    """One profile from a skewed distribution of form answers (defaults are common)."""
+    level = lambda p: int(rng.choice(5, p=p)) + 1
+    middle = [0.1, 0.2, 0.4, 0.2, 0.1]
+    prefs = {
+        'activity_level': level([0.1, 0.2, 0.35, 0.25, 0.1]),
+        'home': 'apartment' if rng.random() < 0.4 else 'house',
+        'children': bool(rng.random() < 0.35),
+        'allergies': bool(rng.random() < 0.15),
+        'time_for_training': level(middle),
+        'size_pref': [None, 'small', 'medium', 'large'][int(rng.choice(4, p=[0.4, 0.25, 0.2, 0.15]))],
+        'other_dogs': bool(rng.random() < 0.3),
+    }
+    # the extra sliders sit in collapsed expanders: most users leave them at 3
+    untouched = rng.random() < 0.6
+    for key in ('shedding_tolerance', 'grooming_tolerance', 'drooling_tolerance',
+                'playfulness_pref', 'affection_pref', 'barking_tolerance', 'openness_pref',
+                'mental_stimulation'):
+        prefs[key] = 3 if untouched else level(middle)
+    return prefs
+
+def profile_source(path=None, seed=0):
+    """Endless iterator of prefs: replayed from a file (cycled) or drawn at random."""
+    if path:
+        from utils.bulk_export import read_profiles
+        profiles = [prefs for _, prefs in read_profiles(path)]
+        if not profiles:
+            raise ValueError(f"no profiles in {path}")
+        return itertools.cycle(profiles)
+    rng = np.random.default_rng(seed)
+    return (realistic_prefs(rng) for _ in itertools.count())
+
+class InProcessTarget:
+    """
+    The app's request path, timed per phase: the shared snapshot is scored by a
+    per-session IncrementalScorer (one per worker thread), behind the match cache.
+    """
+
+    name = 'inprocess'
+
+    def __init__(self, cache=True, k=3):
+        from utils.snapshot import current_snapshot
+        self.current_snapshot = current_snapshot
+        self.cache = cache
+        self.k = k
+        self._sessions = threading.local()  # each worker thread plays one app session
+        self.current_snapshot()  # load before the clock starts
+
+    def __call__(self, prefs, rng):
+        from utils.image_loader import read_image
+        from utils.image_manifest import IMAGES_DIR
+        from utils.incremental import IncrementalScorer
+        from utils.match_cache import cached_top_k_matches
+        from utils.social_post import generate_social_post
+        from utils.thumbnails import serving_path
+
+        phases = {}
+        t0 = time.perf_counter()
+        catalog = self.current_snapshot()
+        t1 = time.perf_counter()
+        scorer = getattr(self._sessions, 'scorer', None)
+        if scorer is None or scorer.df is not catalog or scorer.version != catalog.version:
+            scorer = self._sessions.scorer = IncrementalScorer(catalog, version=catalog.version)
+        if self.cache:
+            results = cached_top_k_matches(catalog, prefs, k=self.k, version=catalog.version,
+                                           compute=scorer.top_k_matches)
+        else:
+            results = scorer.top_k_matches(prefs, k=self.k)
+        t2 = time.perf_counter()
+        for m in results:
+            read_image(serving_path(catalog.image_path(m.breed, IMAGES_DIR)))
+        t3 = time.perf_counter()
+        if len(results):
+            generate_social_post(results[0], prefs, rng=rng)
+        t4 = time.perf_counter()
+        phases.update(catalog=t1 - t0, score=t2 - t1, images=t3 - t2, post=t4 - t3)
+        return phases
+
+    async def acall(self, prefs, rng, executor):
+        return await asyncio.get_running_loop().run_in_executor(executor, self, prefs, rng)
+
+class HTTPTarget:
+    """POST /match, then POST /social_post for the top breed, on a local HTTP front end."""
+
+    def __init__(self, url, k=3, timeout=30.0):
+        parts = urlsplit(url)
+        self.name = url
+        self.host, self.port = parts.hostname, parts.port or 80
+        self.k = k
+        self.timeout = timeout
+        self._local = threading.local()
+
+    def _match_body(self, prefs):
+        return json.dumps({'prefs': prefs, 'k': self.k}).encode('utf8')
+
+    def _post_body(self, prefs, reply):
+        matches = json.loads(reply)['matches']
+        if not matches:
+            raise RuntimeError('/match: no matches')
+        return json.dumps({'prefs': prefs, 'breed': matches[0]['breed']}).encode('utf8')
+
+    def _post(self, path, body):
+        conn = getattr(self._local, 'conn', None)
+        if conn is None:
+            conn = self._local.conn = http.client.HTTPConnection(self.host, self.port, timeout=self.timeout)
+        try:
+            conn.request('POST', path, body, {'Content-Type': 'application/json'})
+            resp = conn.getresponse()
+            data = resp.read()
+        except (OSError, http.client.HTTPException):
+            conn.close()
+            self._local.conn = None
+            raise
+        if resp.status >= 400:
+            raise RuntimeError(f"{path}: HTTP {resp.status}")
+        return data
+
+    def __call__(self, prefs, rng):
+        t0 = time.perf_counter()
+        reply = self._post('/match', self._match_body(prefs))
+        t1 = time.perf_counter()
+        self._post('/social_post', self._post_body(prefs, reply))
+        return {'match': t1 - t0, 'social_post': time.perf_counter() - t1}
+
+    async def _apost(self, conn, path, body):
+        reader, writer = conn
+        writer.write((f"POST {path} HTTP/1.1\r\nHost: {self.host}\r\nContent-Type: application/json\r\n"
+                      f"Content-Length: {len(body)}\r\n\r\n").encode('latin-1') + body)
+        await writer.drain()
+        status_line = await reader.readline()
+        if not status_line:
+            raise ConnectionError(f"{path}: connection closed")
+        status = int(status_line.split()[1])
+        length = 0
+        while True:
+            line = await reader.readline()
+            if line in (b'\r\n', b'\n', b''):
+                break
+            name, _, value = line.decode('latin-1').partition(':')
+            if name.strip().lower() == 'content-length':
+                length = int(value)
+        data = await reader.readexactly(length)
+        if status >= 400:
+            raise RuntimeError(f"{path}: HTTP {status}")
+        return data
+
+    async def acall(self, prefs, rng, connections):
+        conn = await connections.get()
+        try:
+            if conn is None:
+                conn = await asyncio.wait_for(asyncio.open_connection(self.host, self.port), self.timeout)
+            t0 = time.perf_counter()
+            reply = await asyncio.wait_for(self._apost(conn, '/match', self._match_body(prefs)), self.timeout)
+            t1 = time.perf_counter()
+            await asyncio.wait_for(self._apost(conn, '/social_post', self._post_body(prefs, reply)),
+                                   self.timeout)
+            return {'match': t1 - t0, 'social_post': time.perf_counter() - t1}
+        except BaseException:
+            if conn is not None:
+                conn[1].close()
+            conn = None
+            raise
+        finally:
+            connections.put_nowait(conn)
+
+class RSSSampler:
+    """Peak resident set size of a process while running (Linux /proc; else ru_maxrss of self)."""
+
+    def __init__(self, pid=None, interval=RSS_INTERVAL):
+        self.pid = pid or os.getpid()
+        self.interval = interval
+        self.peak = 0
+        self._stop = threading.Event()
+        self._thread = None
+
+    def _rss(self):
+        try:
+            with open(f"/proc/{self.pid}/status") as f:
+                for line in f:
+                    if line.startswith('VmRSS:'):
+                        return int(line.split()[1]) * 1024
+        except OSError:
+            pass
+        if self.pid == os.getpid():
+            scale = 1 if sys.platform == 'darwin' else 1024
+            return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss * scale
+        return 0
+
+    def _run(self):
+        while True:
+            self.peak = max(self.peak, self._rss())
+            if self._stop.wait(self.interval):
+                return
+
+    def __enter__(self):
+        self._thread = threading.Thread(target=self._run, name='rss-sampler', daemon=True)
+        self._thread.start()
+        return self
+
+    def __exit__(self, *exc):
+        self._stop.set()
+        self._thread.join()
+        self.peak = max(self.peak, self._rss())
+        return False
+
+class Step:
+    def __init__(self, concurrency, seconds, rate=None):
+        self.concurrency, self.seconds, self.rate = concurrency, seconds, rate
+
+    @classmethod
+    def parse(cls, spec):
+        m = _STEP.match(spec.strip())
+        if not m:
+            raise ValueError(f"bad step {spec!r}; expected CONCURRENCYxSECONDS[@RATE], e.g. 16x10s@200")
+        return cls(int(m.group(1)), float(m.group(2)), float(m.group(3)) if m.group(3) else None)
+
+    def arrivals(self, rng):
+        """Open-loop arrival offsets (seconds from the step start) of a Poisson process."""
+        gaps = rng.exponential(1 / self.rate, int(self.rate * self.seconds * 1.5) + 16)
+        times = np.cumsum(gaps)
+        return times[times < self.seconds]
+
+class Recorder:
+    """Latencies (from scheduled arrival), per-phase times and errors of one step."""
+
+    def __init__(self):
+        self.latencies = []
+        self.phases = {}
+        self.errors = []
+        self.started = self.finished = None
+
+    def ok(self, latency, phases):
+        self.latencies.append(latency)
+        for name, seconds in phases.items():
+            self.phases.setdefault(name, []).append(seconds)
+
+    def error(self, exc):
+        self.errors.append(f"{type(exc).__name__}: {exc}")
+
+def run_threads(target, step, profiles, rng, rec):
+    lock = threading.Lock()
+    def next_prefs():
+        with lock:
+            return next(profiles), random.Random(int(rng.integers(1 << 62)))
+
+    def one(scheduled):
+        prefs, post_rng = next_prefs()
+        try:
+            phases = target(prefs, post_rng)
+        except Exception as e:
+            rec.error(e)
+        else:
+            rec.ok(time.perf_counter() - scheduled, phases)
+
+    rec.started = start = time.perf_counter()
+    deadline = start + step.seconds
+    if step.rate is None:
+        def closed_loop():
+            while time.perf_counter() < deadline:
+                one(time.perf_counter())
+        workers = [threading.Thread(target=closed_loop) for _ in range(step.concurrency)]
+    else:
+        offsets = step.arrivals(rng)
+        arrivals = queue.Queue()
+        def open_loop():
+            while True:
+                scheduled = arrivals.get()
+                if scheduled is None:
+                    return
+                if time.perf_counter() > deadline + ARRIVAL_GRACE:
+                    rec.error(TimeoutError('not started before the step ended'))
+                    continue
+                one(scheduled)
+        workers = [threading.Thread(target=open_loop) for _ in range(step.concurrency)]
+    for w in workers:
+        w.start()
+    if step.rate is not None:
+        for offset in offsets:
+            delay = start + offset - time.perf_counter()
+            if delay > 0:
+                time.sleep(delay)
+            arrivals.put(start + offset)
+        for _ in workers:
+            arrivals.put(None)
+    for w in workers:
+        w.join()
+    rec.finished = time.perf_counter()
+
+async def _run_async(target, step, profiles, rng, rec):
+    if isinstance(target, HTTPTarget):
+        resources = asyncio.Queue()
+        for _ in range(step.concurrency):
+            resources.put_nowait(None)  # connections are opened on first use
+        executor = None
+    else:
+        executor = resources = ThreadPoolExecutor(step.concurrency)
+    sem = asyncio.Semaphore(step.concurrency)
+
+    async def one(scheduled):
+        prefs, post_rng = next(profiles), random.Random(int(rng.integers(1 << 62)))
+        async with sem:
+            if time.perf_counter() > deadline + ARRIVAL_GRACE:
+                rec.error(TimeoutError('not started before the step ended'))
+                return
+            try:
+                phases = await target.acall(prefs, post_rng, resources)
+            except Exception as e:
+                rec.error(e)
+            else:
+                rec.ok(time.perf_counter() - scheduled, phases)
+
+    rec.started = start = time.perf_counter()
+    deadline = start + step.seconds
+    try:
+        if step.rate is None:
+            async def closed_loop():
+                while time.perf_counter() < deadline:
+                    await one(time.perf_counter())
+            await asyncio.gather(*(closed_loop() for _ in range(step.concurrency)))
+        else:
+            tasks = []
+            for offset in step.arrivals(rng):
+                delay = start + offset - time.perf_counter()
+                if delay > 0:
+                    await asyncio.sleep(delay)
+                tasks.append(asyncio.create_task(one(start + offset)))
+            await asyncio.gather(*tasks)
+    finally:
+        if executor is not None:
+            executor.shutdown()
+        elif resources is not None:
+            while not resources.empty():
+                conn = resources.get_nowait()
+                if conn is not None:
+                    conn[1].close()
+    rec.finished = time.perf_counter()
+
+def run_asyncio(target, step, profiles, rng, rec):
+    asyncio.run(_run_async(target, step, profiles, rng, rec))
+
+DRIVERS = {'thread': run_threads, 'asyncio': run_asyncio}
+
+def _percentiles(seconds):
+    if not seconds:
+        return {'p50': None, 'p95': None, 'p99': None, 'max': None, 'mean': None}
+    ms = np.asarray(seconds) * 1000
+    return {'p50': round(float(np.percentile(ms, 50)), 3), 'p95': round(float(np.percentile(ms, 95)), 3),
+            'p99': round(float(np.percentile(ms, 99)), 3), 'max': round(float(ms.max()), 3),
+            'mean': round(float(ms.mean()), 3)}
+
+def summarize(step, rec, peak_rss):
+    total = len(rec.latencies) + len(rec.errors)
+    elapsed = rec.finished - rec.started
+    return {'concurrency': step.concurrency, 'rate': step.rate, 'seconds': step.seconds,
+            'elapsed_s': round(elapsed, 3), 'requests': total, 'errors': len(rec.errors),
+            'error_rate': round(len(rec.errors) / total, 5) if total else 0.0,
+            'throughput_per_s': round(len(rec.latencies) / elapsed, 2) if elapsed else 0.0,
+            'latency_ms': _percentiles(rec.latencies),
+            'phases_ms': {name: _percentiles(v) for name, v in rec.phases.items()},
+            'peak_rss_mb': round(peak_rss / 2**20, 1),
+            'error_samples': sorted(set(rec.errors))[:5]}
+
+def parse_slo(spec):
+    """'p99<=250' -> ('p99', '<=', 250.0); latency metrics are ms, optionally 'phase.p95'."""
+    m = _SLO.match(spec.strip())
+    if not m:
+        raise ValueError(f"bad SLO {spec!r}; expected e.g. p99<=250, score.p95<=20, error_rate<=0.01")
+    return m.group(1), m.group(2), float(m.group(3))
+
+def _metric(result, name):
+    if name in ('error_rate', 'throughput', 'throughput_per_s', 'peak_rss_mb'):
+        return result['throughput_per_s'] if name.startswith('throughput') else result[name]
+    phase, _, pct = name.rpartition('.')
+    stats = result['phases_ms'].get(phase) if phase else result['latency_ms']
+    if stats is None or pct not in stats:
+        raise ValueError(f"unknown SLO metric {name!r}")
+    return stats[pct]
+
+def check_slos(results, slos):
+    """Breaches as dicts (step, slo, value) over every step."""
+    breaches = []
+    for i, result in enumerate(results):
+        for name, op, limit in slos:
+            value = _metric(result, name)
+            if value is None or (value > limit if op == '<=' else value < limit):
+                breaches.append({'step': i, 'slo': f"{name}{op}{limit:g}", 'value': value})
+    return breaches
+
+def run(target, steps, driver='thread', profiles=None, seed=0, rss_pid=None):
+    """Run the steps in order; returns one summary per step."""
+    rng = np.random.default_rng(seed)
+    profiles = profiles or profile_source(seed=seed)
+    results = []
+    for step in steps:
+        rec = Recorder()
+        with RSSSampler(rss_pid) as rss:
+            DRIVERS[driver](target, step, profiles, rng, rec)
+        results.append(summarize(step, rec, rss.peak))
+    return results
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument('--target', default='inprocess', help="'inprocess' or an http:// base URL")
+    parser.add_argument('--driver', choices=sorted(DRIVERS), default='thread')
+    parser.add_argument('--steps', default='4x10s', help='comma-separated CONCURRENCYxSECONDS[@RATE]')
+    parser.add_argument('--profiles', default=None, help='replay prefs from a .jsonl/.csv file')
+    parser.add_argument('--slo', action='append', default=[], help='e.g. p99<=250 (repeatable)')
+    parser.add_argument('--no-cache', action='store_true', help='in-process: score every request')
+    parser.add_argument('--k', type=int, default=3)
+    parser.add_argument('--rss-pid', type=int, default=None, help='sample this process for peak RSS')
+    parser.add_argument('--seed', type=int, default=0)
+    parser.add_argument('--out', default=None, help='write the report as JSON')
+    args = parser.parse_args()
+
+    steps = [Step.parse(s) for s in args.steps.split(',') if s.strip()]
+    slos = [parse_slo(s) for s in args.slo]
+    if args.target == 'inprocess':
+        target = InProcessTarget(cache=not args.no_cache, k=args.k)
+    else:
+        target = HTTPTarget(args.target, k=args.k)
+    results = run(target, steps, args.driver, profile_source(args.profiles, args.seed), args.seed,
+                  args.rss_pid)
+    for r in results:
+        lat = r['latency_ms']
+        fmt = lambda v: f"{v:9.2f}" if v is not None else '        -'
+        print(f"c={r['concurrency']:<4} rate={r['rate'] or 'max':<6} {r['requests']:>7} req  "
+              f"{r['throughput_per_s']:9.1f}/s  p50 {fmt(lat['p50'])}  p95 {fmt(lat['p95'])}  "
+              f"p99 {fmt(lat['p99'])} ms  err {r['error_rate']:.2%}  rss {r['peak_rss_mb']} MB")
+        for name, p in r['phases_ms'].items():
+            print(f"    {name:<12} p50 {fmt(p['p50'])}  p95 {fmt(p['p95'])}  p99 {fmt(p['p99'])} ms")
+    breaches = check_slos(results, slos)
+    if args.out:
+        report = {'target': target.name, 'driver': args.driver, 'seed': args.seed,
+                  'slos': args.slo, 'steps': results, 'breaches': breaches}
+        with open(args.out, 'w', encoding='utf8') as f:
+            json.dump(report, f, indent=1)
+    for b in breaches:
+        print(f"SLO BREACH step {b['step']}: {b['slo']} (got {b['value']})")
+    if breaches:
+        sys.exit(1)
+
+if __name__ == '__main__':
+    main()
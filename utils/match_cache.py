@@ -0,0 +1,117 @@
+"""
+Memoized top-k matching.
+
+Many slider combinations rank breeds identically (see matching.canonical_prefs), so
+results are cached under the canonical prefs, the weights, k and a catalog version.
+"""
+import hashlib
+import threading
+import weakref
+from collections import OrderedDict
+
+from utils import instrument
+from utils.matching import (DEFAULT_WEIGHTS, MatchResult, _is_frame, canonical_prefs,
+                            catalog_arrays, top_k_matches)
+
+# catalog fingerprints memoized per dataframe object
+_versions = {}
+
+def catalog_version(df):
+    """
+    Content fingerprint of a breeds dataframe (breed names, traits, sizes). Memoized per
+    dataframe object, so edit a frame in place only together with MatchCache.clear().
+    A compiled snapshot carries its own version.
+    """
+    if not _is_frame(df):
+        return df.version
+    key = id(df)
+    version = _versions.get(key)
+    if version is None:
+        h = hashlib.blake2b(digest_size=16)
+        traits, sizes = catalog_arrays(df)
+        h.update(traits.tobytes())
+        if 'breed' in df.columns:
+            h.update('\x00'.join(map(str, df['breed'])).encode('utf8'))
+        if sizes is not None:
+            h.update('\x00'.join(sizes).encode('utf8'))
+        version = h.hexdigest()
+        _versions[key] = version
+        weakref.finalize(df, _versions.pop, key, None)
+    return version
+
+class MatchCache:
+    """Bounded LRU of top-k results with hit/miss/eviction counters. Thread-safe."""
+
+    def __init__(self, maxsize=1024):
+        self.maxsize = maxsize
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+
+    def key(self, df, prefs, k=3, weights=None, version=None, breakdown=False):
+        if version is None:
+            version = catalog_version(df)
+        weights_key = tuple(sorted((weights or DEFAULT_WEIGHTS).items()))
+        has_sizes = catalog_arrays(df)[1] is not None
+        return (version, canonical_prefs(prefs, has_sizes), weights_key, k, breakdown)
+
+    def top_k_matches(self, df, prefs, k=3, weights=None, version=None, breakdown=False,
+                      compute=None):
+        """
+        Same as matching.top_k_matches, served from the cache when possible. On a miss the
+        result comes from `compute(prefs, k, breakdown)` when given (e.g. a session's
+        incremental scorer), else from top_k_matches. Results are keyed under `weights`,
+        which compute cannot be given, so compute must score with the default weights and
+        passing both is an error.
+        """
+        if compute is not None and weights is not None:
+            raise ValueError("weights cannot be used with compute; give them to the scorer instead")
+        key = self.key(df, prefs, k, weights, version, breakdown)
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is not None:
+                self._entries.move_to_end(key)
+                self.hits += 1
+        instrument.count('match_cache.misses' if entry is None else 'match_cache.hits')
+        if entry is None:
+            if compute is not None:
+                result = compute(prefs, k, breakdown)
+            else:
+                result = top_k_matches(df, prefs, k=k, weights=weights, breakdown=breakdown)
+            entry = (result.indices, result.scores, result.components)
+            for arr in (result.indices, result.scores, *(result.components or {}).values()):
+                arr.flags.writeable = False
+            with self._lock:
+                self.misses += 1
+                self._entries[key] = entry
+                self._entries.move_to_end(key)
+                while len(self._entries) > self.maxsize:
+                    self._entries.popitem(last=False)
+                    self.evictions += 1
+        indices, scores, components = entry
+        return MatchResult(df, indices, scores, components)
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+
+    def stats(self):
+        with self._lock:
+            lookups = self.hits + self.misses
+            return {
+                'size': len(self._entries),
+                'maxsize': self.maxsize,
+                'hits': self.hits,
+                'misses': self.misses,
+                'evictions': self.evictions,
+                'hit_rate': self.hits / lookups if lookups else 0.0,
+            }
+
+# process-wide default cache
+default_cache = MatchCache()
+
+def cached_top_k_matches(df, prefs, k=3, weights=None, version=None, compute=None):
+    return default_cache.top_k_matches(df, prefs, k=k, weights=weights, version=version,
+                                       compute=compute)
@@ -1,8 +1,27 @@
-import pandas as pd
+import sys
+import weakref
+
 import numpy as np
+from utils import instrument
 from utils.normalize import normalize_for_folder
 
+# pandas is imported only where a dataframe is parsed or built: the app scores the compiled
+# snapshot (utils.snapshot) and never loads it
+
+def _is_frame(obj):
+    pd = sys.modules.get('pandas')
+    return pd is not None and isinstance(obj, pd.DataFrame)
+
+def _isna(values):
+    """Missing-value mask of an object array (None/NaN; pd.isna when pandas is loaded)."""
+    pd = sys.modules.get('pandas')
+    if pd is not None:
+        return pd.isna(values)
+    return np.array([v is None or v != v for v in values], dtype=bool)
+
+@instrument.timed('load_breeds')
 def load_breeds(path='data/breed_traits.csv'):
+    import pandas as pd
     df = pd.read_csv(path)
     # Ensure numeric columns exist as ints
     numeric_cols = ['Energy Level','Trainability Level','Good With Young Children',
@@ -35,8 +54,333 @@ def load_breeds(path='data/breed_traits.csv'):
     # If hypoallergenic info isn't available, derive from low shedding
     if 'hypoallergenic' not in df.columns:
         df['hypoallergenic'] = df['shedding'] <= 2
+    instrument.count('breeds_loaded', len(df))
     return df
 
+# default weight of each score component
+DEFAULT_WEIGHTS = {
+    'activity': 3.0,
+    'home': 2.0,
+    'children': 2.0,
+    'allergies': 2.5,
+    'training_time': 2.0,
+    'size': 1.0,
+    'shedding': 1.5,
+    'grooming': 1.5,
+    'drooling': 2.0,  # High CV feature - very useful for matching
+    'barking': 1.5,
+    'playfulness': 1.5,
+    'affection': 1.5,
+    'other_dogs': 2.0,
+    'openness': 1.0,
+    'mental_stimulation': 1.0
+}
+
+# (component, prefs key) in the order component scores are accumulated
+COMPONENTS = [
+    ('activity', 'activity_level'),
+    ('home', 'home'),
+    ('children', 'children'),
+    ('allergies', 'allergies'),
+    ('training_time', 'time_for_training'),
+    ('size', 'size_pref'),
+    ('shedding', 'shedding_tolerance'),
+    ('grooming', 'grooming_tolerance'),
+    ('drooling', 'drooling_tolerance'),
+    ('barking', 'barking_tolerance'),
+    ('playfulness', 'playfulness_pref'),
+    ('affection', 'affection_pref'),
+    ('other_dogs', 'other_dogs'),
+    ('openness', 'openness_pref'),
+    ('mental_stimulation', 'mental_stimulation'),
+]
+
+# columns of the dense trait matrix, with the value used when a column is missing
+TRAIT_COLUMNS = ['energy', 'good_for_apartment', 'good_with_kids', 'hypoallergenic',
+                 'trainability', 'shedding', 'grooming', 'drooling', 'barking',
+                 'playfulness', 'affection', 'good_with_dogs', 'openness', 'mental_needs']
+TRAIT_DEFAULTS = {c: 3 for c in TRAIT_COLUMNS}
+TRAIT_DEFAULTS['hypoallergenic'] = 0
+
+def trait_matrix(df):
+    """
+    Pack the trait columns of a breeds dataframe into a dense (n_breeds x n_traits)
+    uint8 matrix, columns ordered as TRAIT_COLUMNS. Missing columns get their default.
+    """
+    import pandas as pd
+    traits = np.empty((len(df), len(TRAIT_COLUMNS)), dtype=np.uint8)
+    for i, col in enumerate(TRAIT_COLUMNS):
+        if col in df.columns:
+            traits[:, i] = pd.to_numeric(df[col], errors='coerce').fillna(TRAIT_DEFAULTS[col]).astype(int)
+        else:
+            traits[:, i] = TRAIT_DEFAULTS[col]
+    return traits
+
+def size_column(df):
+    """Lower-cased `Size` values as an object array, or None when the catalog has no sizes."""
+    if 'Size' not in df.columns:
+        return None
+    return df['Size'].fillna('medium').astype(str).str.lower().to_numpy(dtype=object)
+
+# (trait matrix, size column) memoized per dataframe object
+_arrays = {}
+
+def catalog_arrays(df):
+    """
+    (trait_matrix(df), size_column(df)), built once per dataframe object so repeated
+    scoring of the same catalog never re-parses it. Edit a frame in place only together
+    with MatchCache.clear() (see match_cache.catalog_version). A compiled
+    snapshot.CatalogSnapshot can stand in for the dataframe: its precomputed arrays are used.
+    """
+    if not _is_frame(df):
+        return df.traits, df.sizes
+    key = id(df)
+    arrays = _arrays.get(key)
+    if arrays is None:
+        arrays = (trait_matrix(df), size_column(df))
+        _arrays[key] = arrays
+        weakref.finalize(df, _arrays.pop, key, None)
+    return arrays
+
+def _trait_columns(traits):
+    """Float views of every trait column, keyed by name."""
+    values = traits.astype(np.float64)
+    return {col: values[:, i] for i, col in enumerate(TRAIT_COLUMNS)}
+
+def _preferred_low(level, tolerance, low_weight):
+    """Shared rule for shedding/drooling/barking: low tolerance wants level 1, otherwise a slight lean to low."""
+    return np.where(tolerance <= 2,
+                    np.maximum(0, 1 - np.abs(level - 1) / 4.0),
+                    1.0 - (level - 1) / 4.0 * low_weight)
+
+def _closeness(pref, level):
+    """1 for an exact match, falling linearly to 0 four levels away."""
+    return np.maximum(0, 1 - np.abs(pref - level) / 4.0)
+
+def _component_score(name, value, cols, sizes=None):
+    """
+    Score one component for every breed. `value` is the (encoded) preference and may be
+    a scalar or a column of values, in which case the result broadcasts against the breeds.
+    """
+    if name == 'activity':
+        return _closeness(value, cols['energy'])
+    if name == 'home':
+        # houses prefer higher-yard breeds
+        apt_score = cols['good_for_apartment'] / 5.0
+        return np.where(value, apt_score, 1 - apt_score + 0.5)
+    if name == 'children':
+        return np.where(value, cols['good_with_kids'] / 5.0, 1.0)
+    if name == 'allergies':
+        s_allergy = np.where(cols['hypoallergenic'] > 0, 1.0, np.where(cols['shedding'] <= 2, 0.6, 0.1))
+        return np.where(value, s_allergy, 1.0)
+    if name == 'training_time':
+        # high time -> prefer high trainability; low time -> prefer less demanding breeds
+        train_score = cols['trainability'] / 5.0
+        return np.where(value >= 4, train_score,
+                        np.where(value >= 3, 0.8*train_score + 0.2*(1-train_score), 1 - 0.6*train_score))
+    if name == 'size':
+        return np.where(value == sizes, 1.0, 0.5)
+    if name == 'shedding':
+        return _preferred_low(cols['shedding'], value, 0.3)
+    if name == 'grooming':
+        return _closeness(value, cols['grooming'])
+    if name == 'drooling':
+        return _preferred_low(cols['drooling'], value, 0.3)
+    if name == 'barking':
+        return _preferred_low(cols['barking'], value, 0.2)
+    if name == 'playfulness':
+        return _closeness(value, cols['playfulness'])
+    if name == 'affection':
+        return _closeness(value, cols['affection'])
+    if name == 'other_dogs':
+        # no preference if no other dogs
+        return np.where(value, cols['good_with_dogs'] / 5.0, 1.0)
+    if name == 'openness':
+        return _closeness(value, cols['openness'])
+    if name == 'mental_stimulation':
+        return _closeness(value, cols['mental_needs'])
+    raise KeyError(name)
+
+def _encode_pref(name, value):
+    """Map a raw prefs value onto what _component_score expects."""
+    if name == 'home':
+        return value == 'apartment'
+    if name in ('children', 'allergies', 'other_dogs'):
+        return bool(value)
+    return value
+
+def active_components(prefs, sizes=None):
+    """Names of the components a prefs dict switches on, in accumulation order."""
+    return [name for name, key in COMPONENTS
+            if prefs.get(key) is not None and (name != 'size' or sizes is not None)]
+
+def component_scores(traits, prefs, sizes=None):
+    """
+    Per-component scores (each an array over breeds) for the components prefs activates.
+    traits: matrix from trait_matrix(); sizes: array from size_column() or None.
+    """
+    cols = _trait_columns(traits)
+    keys = dict(COMPONENTS)
+    return {name: _component_score(name, _encode_pref(name, prefs[keys[name]]), cols, sizes)
+            for name in active_components(prefs, sizes)}
+
+_TOLERANCE_COMPONENTS = ('shedding', 'drooling', 'barking')
+
+def canonical_prefs(prefs, has_sizes=False):
+    """
+    Collapse prefs onto their scoring equivalence class as a hashable tuple (COMPONENTS
+    order). Prefs with equal canonical forms score every breed identically: tolerances
+    only matter as <=2 vs >2, training time as three bands, and size_pref is ignored
+    when the catalog has no Size column.
+    """
+    out = []
+    for name, key in COMPONENTS:
+        v = prefs.get(key)
+        if v is None or (name == 'size' and not has_sizes):
+            out.append(None)
+        elif name in _TOLERANCE_COMPONENTS:
+            out.append(1 if v <= 2 else 3)
+        elif name == 'training_time':
+            out.append(4 if v >= 4 else (3 if v >= 3 else 1))
+        elif name == 'home':
+            out.append('apartment' if v == 'apartment' else 'house')
+        elif name in ('children', 'allergies', 'other_dogs'):
+            out.append(bool(v))
+        else:
+            out.append(v)
+    return tuple(out)
+
+def combine_scores(components, weights=None, n=None):
+    """Weighted mean of component scores, accumulated in COMPONENTS order."""
+    if weights is None:
+        weights = DEFAULT_WEIGHTS
+    if n is None:
+        n = len(next(iter(components.values()))) if components else 0
+    s = np.zeros(n)
+    wsum = 0.0
+    for name, _ in COMPONENTS:
+        if name in components:
+            s += components[name] * weights[name]
+            wsum += weights[name]
+    return s/(wsum+1e-9)
+
+def score_matrix(traits, prefs, weights=None, sizes=None):
+    """Normalized match score for every row of a trait matrix."""
+    return combine_scores(component_scores(traits, prefs, sizes), weights, n=len(traits))
+
+# profiles x breeds cells scored per chunk in batch mode (~32 MB per float64 array)
+BATCH_CELLS = 4_000_000
+
+def top_k_indices(scores, k):
+    """
+    Row-wise top-k of a (rows x n) score array without a full sort: O(n) selection per row
+    plus O(k log k) ordering. Returns (indices, scores), best first; ties keep the lower index.
+    """
+    scores = np.atleast_2d(scores)
+    rows, n = scores.shape
+    k = max(0, min(k, n))
+    if k == 0:
+        return np.empty((rows, 0), dtype=np.intp), np.empty((rows, 0))
+    # k-th largest score per row; everything above it is in, ties at it go by index
+    thr = np.partition(scores, n - k, axis=1)[:, n - k][:, None]
+    above = scores > thr
+    at = scores == thr
+    need = k - above.sum(axis=1, keepdims=True)
+    keep = above | (at & (np.cumsum(at, axis=1) <= need))
+    idx = np.nonzero(keep)[1].reshape(rows, k)
+    vals = np.take_along_axis(scores, idx, axis=1)
+    order = np.argsort(-vals, axis=1, kind='stable')
+    return np.take_along_axis(idx, order, axis=1), np.take_along_axis(vals, order, axis=1)
+
+def _profile_columns(profiles):
+    """Columnar view {prefs key: object array} of a list of prefs dicts, a DataFrame or a dict of columns."""
+    if _is_frame(profiles):
+        return len(profiles), {c: profiles[c].to_numpy(dtype=object) for c in profiles.columns}
+    if isinstance(profiles, dict):
+        cols = {c: np.asarray(v, dtype=object) for c, v in profiles.items()}
+        return (len(next(iter(cols.values()))) if cols else 0), cols
+    profiles = list(profiles)
+    keys = {key for _, key in COMPONENTS}
+    return len(profiles), {key: np.array([p.get(key) for p in profiles], dtype=object) for key in keys}
+
+def _encode_profile_column(name, values):
+    """Encode a column of raw prefs values; returns (values, present mask)."""
+    present = ~_isna(values)
+    if name == 'home':
+        return values == 'apartment', present
+    if name in ('children', 'allergies', 'other_dogs'):
+        return np.array([bool(v) and ok for v, ok in zip(values, present)], dtype=bool), present
+    if name == 'size':
+        return values, present
+    return np.where(present, values, 3).astype(np.float64), present
+
+def batch_score_matrix(traits, profiles, weights=None, sizes=None):
+    """
+    Scores for a block of profiles against every breed: a (n_profiles x n_breeds) array.
+    Each row equals score_matrix() for that profile.
+    """
+    if weights is None:
+        weights = DEFAULT_WEIGHTS
+    p, raw = _profile_columns(profiles)
+    cols = _trait_columns(traits)
+    s = np.zeros((p, len(traits)))
+    wsum = np.zeros(p)
+    for name, key in COMPONENTS:
+        if key not in raw or (name == 'size' and sizes is None):
+            continue
+        values, present = _encode_profile_column(name, raw[key])
+        if not present.any():
+            continue
+        comp = _component_score(name, values[:, None], cols, sizes)
+        s += np.where(present[:, None], comp * weights[name], 0.0)
+        wsum += np.where(present, weights[name], 0.0)
+    return s/(wsum[:, None]+1e-9)
+
+def _profile_chunks(profiles, size):
+    """Split profiles into chunks of at most `size`, keeping their input form."""
+    if _is_frame(profiles):
+        for start in range(0, len(profiles), size):
+            yield profiles.iloc[start:start+size]
+    elif isinstance(profiles, dict):
+        n = len(next(iter(profiles.values()))) if profiles else 0
+        for start in range(0, n, size):
+            yield {c: v[start:start+size] for c, v in profiles.items()}
+    else:
+        chunk = []
+        for prefs in profiles:
+            chunk.append(prefs)
+            if len(chunk) == size:
+                yield chunk
+                chunk = []
+        if chunk:
+            yield chunk
+
+@instrument.timed('batch_top_k')
+def batch_top_k(df, profiles, k=3, weights=None, chunk_size=None):
+    """
+    Rank many preference profiles in one call.
+
+    profiles: a sequence (or iterable) of prefs dicts, a DataFrame with one profile per row,
+    or a dict of columns keyed like prefs. Profiles are scored in chunks of `chunk_size`
+    (default: enough to keep a chunk around BATCH_CELLS cells) so memory stays bounded.
+
+    Returns (indices, scores), each (n_profiles x k): positional breed rows in `df`, best first.
+    """
+    traits, sizes = catalog_arrays(df)
+    if chunk_size is None:
+        chunk_size = max(1, BATCH_CELLS // max(1, len(traits)))
+    k = min(k, len(traits))
+    all_idx, all_scores = [], []
+    for chunk in _profile_chunks(profiles, chunk_size):
+        idx, vals = top_k_indices(batch_score_matrix(traits, chunk, weights, sizes), k)
+        instrument.count('rows_scored', idx.shape[0] * len(traits))
+        all_idx.append(idx)
+        all_scores.append(vals)
+    if not all_idx:
+        return np.empty((0, k), dtype=np.intp), np.empty((0, k))
+    return np.concatenate(all_idx), np.concatenate(all_scores)
+
+@instrument.timed('score_breeds')
 def score_breeds(df, prefs, weights=None):
     """
     prefs: dict
@@ -55,188 +399,154 @@ def score_breeds(df, prefs, weights=None):
       - other_dogs: True/False (have other dogs)
       - openness_pref: 1..5 (1=protective, 5=friendly to strangers)
       - mental_stimulation: 1..5 (1=low needs, 5=high needs)
+
+    Scores are computed for all breeds at once on the trait matrix; ties keep catalog order.
     """
-    if weights is None:
-        weights = {
-            'activity': 3.0,
-            'home': 2.0,
-            'children': 2.0,
-            'allergies': 2.5,
-            'training_time': 2.0,
-            'size': 1.0,
-            'shedding': 1.5,
-            'grooming': 1.5,
-            'drooling': 2.0,  # High CV feature - very useful for matching
-            'barking': 1.5,
-            'playfulness': 1.5,
-            'affection': 1.5,
-            'other_dogs': 2.0,
-            'openness': 1.0,
-            'mental_stimulation': 1.0
-        }
-
-    scores = []
-    for _, r in df.iterrows():
-        s = 0.0
-        wsum = 0.0
-
-        # activity
-        if prefs.get('activity_level') is not None:
-            diff = abs(prefs['activity_level'] - r['energy'])
-            s_act = max(0, 1 - diff / 4.0)
-            s += s_act * weights['activity']
-            wsum += weights['activity']
-
-        # home/apartment
-        if prefs.get('home') is not None:
-            want_apartment = (prefs['home']=='apartment')
-            apt_score = r.get('good_for_apartment', 3)/5.0
-            s_home = apt_score if want_apartment else (1 - apt_score + 0.5)  # houses prefer higher-yard breeds
-            s += s_home * weights['home']
-            wsum += weights['home']
-
-        # children
-        if prefs.get('children') is not None:
-            if prefs['children']:
-                s_child = r.get('good_with_kids',3)/5.0
-            else:
-                s_child = 1.0
-            s += s_child * weights['children']
-            wsum += weights['children']
-
-        # allergies
-        if prefs.get('allergies') is not None:
-            if prefs['allergies']:
-                s_allergy = 1.0 if r.get('hypoallergenic',False) else (0.6 if r.get('shedding',3)<=2 else 0.1)
-            else:
-                s_allergy = 1.0
-            s += s_allergy * weights['allergies']
-            wsum += weights['allergies']
-
-        # training time
-        if prefs.get('time_for_training') is not None:
-            # if user has high time -> prefer high trainability
-            t = prefs['time_for_training']
-            train_score = r.get('trainability',3)/5.0
-            if t >= 4:
-                s_train = train_score
-            elif t >= 3:
-                s_train = 0.8*train_score + 0.2*(1-train_score)
-            else:
-                # user low time -> prefer moderate-low trainability (less demanding)
-                s_train = 1 - 0.6*train_score
-            s += s_train * weights['training_time']
-            wsum += weights['training_time']
-
-        # size pref
-        if prefs.get('size_pref') is not None and 'Size' in r.index:
-            size = r.get('Size','medium').lower()
-            s_size = 1.0 if prefs['size_pref']==size else 0.5
-            s += s_size * weights['size']
-            wsum += weights['size']
-
-        # shedding tolerance
-        if prefs.get('shedding_tolerance') is not None:
-            user_tolerance = prefs['shedding_tolerance']  # 1=low tolerance, 5=high tolerance
-            breed_shedding = r.get('shedding', 3)
-            # If user has low tolerance (1-2), prefer low shedding (1-2)
-            # If user has high tolerance (4-5), any shedding is fine
-            if user_tolerance <= 2:
-                s_shed = max(0, 1 - abs(breed_shedding - 1) / 4.0)
-            else:
-                s_shed = 1.0 - (breed_shedding - 1) / 4.0 * 0.3  # slight preference for lower
-            s += s_shed * weights['shedding']
-            wsum += weights['shedding']
-
-        # grooming tolerance
-        if prefs.get('grooming_tolerance') is not None:
-            user_tolerance = prefs['grooming_tolerance']  # 1=low maintenance, 5=high maintenance
-            breed_grooming = r.get('grooming', 3)
-            diff = abs(user_tolerance - breed_grooming)
-            s_groom = max(0, 1 - diff / 4.0)
-            s += s_groom * weights['grooming']
-            wsum += weights['grooming']
-
-        # drooling tolerance (high CV feature - very useful for matching)
-        if prefs.get('drooling_tolerance') is not None:
-            user_tolerance = prefs['drooling_tolerance']  # 1=low tolerance, 5=high tolerance
-            breed_drooling = r.get('drooling', 3)
-            # If user has low tolerance (1-2), prefer low drooling (1-2)
-            # If user has high tolerance (4-5), any drooling is fine
-            if user_tolerance <= 2:
-                s_drool = max(0, 1 - abs(breed_drooling - 1) / 4.0)
-            else:
-                s_drool = 1.0 - (breed_drooling - 1) / 4.0 * 0.3  # slight preference for lower
-            s += s_drool * weights['drooling']
-            wsum += weights['drooling']
-
-        # barking tolerance
-        if prefs.get('barking_tolerance') is not None:
-            user_tolerance = prefs['barking_tolerance']  # 1=quiet preferred, 5=ok with barking
-            breed_barking = r.get('barking', 3)
-            # If user wants quiet (1-2), prefer low barking (1-2)
-            # If user is ok with barking (4-5), any level is fine
-            if user_tolerance <= 2:
-                s_bark = max(0, 1 - abs(breed_barking - 1) / 4.0)
-            else:
-                s_bark = 1.0 - (breed_barking - 1) / 4.0 * 0.2
-            s += s_bark * weights['barking']
-            wsum += weights['barking']
-
-        # playfulness preference
-        if prefs.get('playfulness_pref') is not None:
-            user_pref = prefs['playfulness_pref']
-            breed_play = r.get('playfulness', 3)
-            diff = abs(user_pref - breed_play)
-            s_play = max(0, 1 - diff / 4.0)
-            s += s_play * weights['playfulness']
-            wsum += weights['playfulness']
-
-        # affection preference
-        if prefs.get('affection_pref') is not None:
-            user_pref = prefs['affection_pref']
-            breed_affection = r.get('affection', 3)
-            diff = abs(user_pref - breed_affection)
-            s_aff = max(0, 1 - diff / 4.0)
-            s += s_aff * weights['affection']
-            wsum += weights['affection']
-
-        # other dogs
-        if prefs.get('other_dogs') is not None:
-            if prefs['other_dogs']:
-                s_dogs = r.get('good_with_dogs', 3) / 5.0
-            else:
-                s_dogs = 1.0  # no preference if no other dogs
-            s += s_dogs * weights['other_dogs']
-            wsum += weights['other_dogs']
-
-        # openness to strangers
-        if prefs.get('openness_pref') is not None:
-            user_pref = prefs['openness_pref']  # 1=protective, 5=friendly
-            breed_openness = r.get('openness', 3)
-            diff = abs(user_pref - breed_openness)
-            s_open = max(0, 1 - diff / 4.0)
-            s += s_open * weights['openness']
-            wsum += weights['openness']
-
-        # mental stimulation needs
-        if prefs.get('mental_stimulation') is not None:
-            user_needs = prefs['mental_stimulation']
-            breed_needs = r.get('mental_needs', 3)
-            diff = abs(user_needs - breed_needs)
-            s_mental = max(0, 1 - diff / 4.0)
-            s += s_mental * weights['mental_stimulation']
-            wsum += weights['mental_stimulation']
-
-        # final normalized score
-        final = s/(wsum+1e-9)
-        scores.append(final)
-
-    df_scores = df.copy()
-    df_scores['score'] = scores
-    df_scores = df_scores.sort_values('score', ascending=False)
+    with instrument.span('score_breeds.score'):
+        traits, sizes = catalog_arrays(df)
+        scores = score_matrix(traits, prefs, weights, sizes)
+    instrument.count('rows_scored', len(scores))
+    with instrument.span('score_breeds.sort'):
+        df_scores = (df if _is_frame(df) else df.frame).copy()
+        df_scores['score'] = scores
+        df_scores = df_scores.sort_values('score', ascending=False, kind='stable')
     return df_scores
 
-def top_k_matches(df, prefs, k=3):
-    scored = score_breeds(df, prefs)
-    return scored.head(k)
\ No newline at end of file
+def _cell(table, row, key):
+    if _is_frame(table):
+        return table.iat[row, table.columns.get_loc(key)]
+    return table.value(row, key)
+
+def _has_column(table, key):
+    return key in table.columns if _is_frame(table) else table.has_column(key)
+
+class Match:
+    """
+    One ranked breed. Reads like a dataframe row (`m['breed']`, `m.get('shedding', 3)`,
+    `'barking' in m`) without copying the row; `score` and `components` come from the ranking.
+    The table is a breeds dataframe or a snapshot.CatalogSnapshot.
+    """
+    __slots__ = ('_df', 'index', 'score', 'components')
+
+    def __init__(self, df, index, score, components=None):
+        self._df = df
+        self.index = int(index)
+        self.score = float(score)
+        self.components = components
+
+    def __getitem__(self, key):
+        if key == 'score':
+            return self.score
+        return _cell(self._df, self.index, key)
+
+    def get(self, key, default=None):
+        if key != 'score' and not _has_column(self._df, key):
+            return default
+        return self[key]
+
+    def __contains__(self, key):
+        return key == 'score' or _has_column(self._df, key)
+
+    @property
+    def breed(self):
+        return self['breed']
+
+    def __repr__(self):
+        return f"Match({self.breed!r}, score={self.score:.4f})"
+
+class MatchResult:
+    """
+    Compact top-k result: positional breed rows, their scores and (optionally) the
+    per-component scores behind them. Iterating yields Match objects, best first.
+    `ids` are catalog ids when the rows come from a larger catalog (default: the positions).
+    """
+    def __init__(self, df, indices, scores, components=None, ids=None):
+        self.df = df
+        self.indices = np.asarray(indices, dtype=np.intp)
+        self.scores = np.asarray(scores, dtype=np.float64)
+        self.components = components
+        self.ids = self.indices if ids is None else np.asarray(ids)
+
+    def __len__(self):
+        return len(self.indices)
+
+    def __getitem__(self, i):
+        comps = None
+        if self.components is not None:
+            comps = {name: float(v[i]) for name, v in self.components.items()}
+        return Match(self.df, self.indices[i], self.scores[i], comps)
+
+    def __iter__(self):
+        for i in range(len(self)):
+            yield self[i]
+
+    @property
+    def breeds(self):
+        return [m.breed for m in self]
+
+    def page(self, start, stop):
+        """Matches start .. stop - 1 of this result (like Ranking.page)."""
+        picked = None
+        if self.components is not None:
+            picked = {name: v[start:stop] for name, v in self.components.items()}
+        return MatchResult(self.df, self.indices[start:stop], self.scores[start:stop], picked,
+                           self.ids[start:stop])
+
+    def to_frame(self):
+        """Ranked rows as a dataframe (copies only the k selected rows)."""
+        out = (self.df if _is_frame(self.df) else self.df.frame).iloc[self.indices].copy()
+        out['score'] = self.scores
+        return out
+
+@instrument.timed('top_k_matches')
+def top_k_matches(df, prefs, k=3, weights=None, breakdown=False):
+    """
+    Best k breeds for prefs as a MatchResult. Uses partial selection instead of a full
+    sort and never copies the catalog; breakdown=True keeps each component's score.
+    """
+    traits, sizes = catalog_arrays(df)
+    components = component_scores(traits, prefs, sizes)
+    scores = combine_scores(components, weights, n=len(traits))
+    instrument.count('rows_scored', len(scores))
+    idx, vals = top_k_indices(scores, k)
+    picked = None
+    if breakdown:
+        picked = {name: np.broadcast_to(v, scores.shape)[idx[0]] for name, v in components.items()}
+    return MatchResult(df, idx[0], vals[0], picked)
+
+class Ranking:
+    """
+    A full ranking produced page by page. The scores are kept and each further page is
+    selected from the rows not ranked yet, so paging never rescores and only ranks as far as
+    has been asked for. Rows come out in the order of a stable full sort (ties by row).
+    """
+    def __init__(self, df, scores):
+        self.df = df
+        self.scores = np.asarray(scores, dtype=np.float64)
+        self._order = np.empty(0, dtype=np.intp)
+        self._rest = np.arange(len(self.scores))
+
+    def __len__(self):
+        return len(self.scores)
+
+    def _extend(self, stop):
+        need = stop - len(self._order)
+        if need <= 0 or not len(self._rest):
+            return
+        idx, _ = top_k_indices(self.scores[self._rest], need)
+        keep = np.ones(len(self._rest), dtype=bool)
+        keep[idx[0]] = False
+        self._order = np.concatenate([self._order, self._rest[idx[0]]])
+        self._rest = self._rest[keep]
+
+    def page(self, start, stop):
+        """Matches ranked start .. stop - 1 (best first) as a MatchResult."""
+        stop = min(stop, len(self.scores))
+        self._extend(stop)
+        rows = self._order[start:stop]
+        return MatchResult(self.df, rows, self.scores[rows])
+
+def rank_matches(df, prefs, weights=None):
+    """Scores every breed for prefs once; page through them with Ranking.page()."""
+    traits, sizes = catalog_arrays(df)
+    return Ranking(df, score_matrix(traits, prefs, weights, sizes))
@@ -2,6 +2,21 @@
 import re
 import unicodedata
 
+# handle some known patterns and plurals (add more rules here as needed); compiled once
+_RULES = [
+    (re.compile(r'\bretrievers\b'), 'retriever'),
+    (re.compile(r'\bdogs\b'), 'dog'),
+    (re.compile(r'\bterriers\b'), 'terrier'),
+    (re.compile(r'\bpointers\b'), 'pointer'),
+    # fix parenthesis like "Retrievers (Labrador)" -> "labrador retriever"
+    (re.compile(r'retrievers?\s*\(\s*labrador\s*\)'), 'labrador retriever'),
+    (re.compile(r'retrievers?\s*\(\s*golden\s*\)'), 'golden retriever'),
+    # remove punctuation except hyphen and spaces (some folders have hyphens)
+    (re.compile(r'[^\w\s\-]'), ''),
+    # collapse whitespace
+    (re.compile(r'\s+'), ' '),
+]
+
 def normalize_for_folder(name: str) -> str:
     """
     Normalize a breed name into the folder format used in your images directory.
@@ -13,20 +28,9 @@ def normalize_for_folder(name: str) -> str:
     s = unicodedata.normalize('NFKD', str(name)).encode('ascii','ignore').decode('ascii')
     s = s.lower().strip()
 
-    # handle some known patterns and plurals (add more rules here as needed)
-    s = re.sub(r'\bretrievers\b', 'retriever', s)
-    s = re.sub(r'\bdogs\b', 'dog', s)
-    s = re.sub(r'\bterriers\b', 'terrier', s)
-    s = re.sub(r'\bpointers\b', 'pointer', s)
-    # fix parenthesis like "Retrievers (Labrador)" -> "labrador retriever"
-    s = re.sub(r'retrievers?\s*\(\s*labrador\s*\)', 'labrador retriever', s)
-    s = re.sub(r'retrievers?\s*\(\s*golden\s*\)', 'golden retriever', s)
-
-    # remove punctuation except hyphen and spaces (some folders have hyphens)
-    s = re.sub(r'[^\w\s\-]', '', s)
-
-    # collapse whitespace
-    s = re.sub(r'\s+', ' ', s).strip()
+    for pattern, repl in _RULES:
+        s = pattern.sub(repl, s)
+    s = s.strip()
 
     # ensure trailing " dog" when not present (most folders have it)
     if not s.endswith(' dog'):
@@ -0,0 +1,157 @@
+"""
+Multi-core sharded scoring.
+
+ShardedScorer copies a trait matrix (and Size as one uint8 code per row) into shared
+memory once and keeps a process pool whose workers attach to it at start-up. A query only
+ships the prefs to each worker; every worker scores its contiguous shard of rows and
+returns a local top-k, and the parent merges them. Merged results are identical to matching.top_k_matches, including
+ties going to the lower row.
+"""
+import os
+from concurrent.futures import ProcessPoolExecutor
+from multiprocessing import shared_memory
+
+import numpy as np
+
+from utils.matching import (TRAIT_COLUMNS, MatchResult, catalog_arrays, component_scores,
+                            score_matrix, top_k_indices)
+
+# per-worker views of the shared catalog, set by _attach
+_shm = None
+_traits = None
+_size_codes = None
+
+def _attach(name, shape, has_sizes):
+    global _shm, _traits, _size_codes
+    # workers share the parent's resource tracker, so attaching does not take ownership;
+    # the parent unlinks the segment in close()
+    _shm = shared_memory.SharedMemory(name=name)
+    _traits = np.ndarray(shape, dtype=np.uint8, buffer=_shm.buf)
+    _size_codes = None
+    if has_sizes:
+        # uint8 Size codes follow the trait matrix in the same segment
+        _size_codes = np.ndarray((shape[0],), dtype=np.uint8, buffer=_shm.buf, offset=shape[0] * shape[1])
+
+def _score_shard(start, stop, prefs, k, weights):
+    # size_pref arrives as a Size code (see ShardedScorer._coded), compared against the codes
+    sizes = _size_codes[start:stop] if _size_codes is not None else None
+    idx, vals = top_k_indices(score_matrix(_traits[start:stop], prefs, weights, sizes), k)
+    return idx[0] + start, vals[0]
+
+class ShardedScorer:
+    """
+    Persistent shared-memory scorer. Build with from_frame(df) or from_catalog(catalog),
+    query with top_k_matches(), and close() (or use as a context manager) when done.
+    """
+
+    def __init__(self, traits, sizes=None, workers=None, shards=None):
+        traits = np.asarray(traits, dtype=np.uint8)
+        categories, codes = None, None
+        if sizes is not None:
+            categories, codes = np.unique(np.asarray(sizes, dtype=object).astype(str), return_inverse=True)
+        self._allocate(traits.shape, categories)
+        self.traits[:] = traits
+        if codes is not None:
+            self.size_codes[:] = codes.reshape(-1)
+        self._start(workers, shards)
+
+    def _allocate(self, shape, size_categories):
+        """Shared segment for a (rows x width) trait matrix plus, with sizes, one uint8 code per row."""
+        self.rows, self.width = shape
+        self.size_categories = None
+        self._size_code = {}
+        if size_categories is not None:
+            self.size_categories = np.asarray([str(c) for c in size_categories], dtype=object)
+            self._size_code = {c: i for i, c in enumerate(self.size_categories)}
+        matrix = self.rows * self.width
+        nbytes = matrix + (self.rows if size_categories is not None else 0)
+        self._shm = shared_memory.SharedMemory(create=True, size=max(1, nbytes))
+        self.traits = np.ndarray(shape, dtype=np.uint8, buffer=self._shm.buf)
+        self.size_codes = None
+        if size_categories is not None:
+            self.size_codes = np.ndarray((self.rows,), dtype=np.uint8, buffer=self._shm.buf, offset=matrix)
+
+    def _start(self, workers, shards):
+        self.workers = workers or os.cpu_count() or 1
+        self.shards = max(1, min(shards or self.workers, self.rows or 1))
+        self._pool = ProcessPoolExecutor(
+            max_workers=self.workers, initializer=_attach,
+            initargs=(self._shm.name, self.traits.shape, self.size_codes is not None))
+        self._frame = None
+        self._catalog = None
+
+    @classmethod
+    def from_frame(cls, df, workers=None, shards=None):
+        scorer = cls(*catalog_arrays(df), workers, shards)
+        scorer._frame = df
+        return scorer
+
+    @classmethod
+    def from_catalog(cls, catalog, workers=None, shards=None):
+        """Load a utils.catalog.ColumnarCatalog into shared memory, chunk by chunk, with no full copy."""
+        scorer = cls.__new__(cls)
+        scorer._allocate((len(catalog), len(TRAIT_COLUMNS)), catalog.size_categories)
+        for start, stop in catalog.chunks():
+            for i, col in enumerate(TRAIT_COLUMNS):
+                scorer.traits[start:stop, i] = catalog.columns[col][start:stop]
+            if scorer.size_codes is not None:
+                scorer.size_codes[start:stop] = catalog.size_codes[start:stop]
+        scorer._start(workers, shards)
+        scorer._catalog = catalog
+        return scorer
+
+    def _bounds(self):
+        if self.rows == 0:
+            return []
+        step = -(-self.rows // self.shards)
+        return [(s, min(s + step, self.rows)) for s in range(0, self.rows, step)]
+
+    def _coded(self, prefs):
+        """prefs with size_pref as a Size code (-1, matching no row, for an unknown size)."""
+        if self.size_codes is None or prefs.get('size_pref') is None:
+            return prefs
+        return dict(prefs, size_pref=np.int16(self._size_code.get(prefs['size_pref'], -1)))
+
+    def top_k(self, prefs, k=3, weights=None):
+        """(rows, scores) of the best k rows, best first."""
+        coded = self._coded(prefs)
+        futures = [self._pool.submit(_score_shard, start, stop, coded, k, weights)
+                   for start, stop in self._bounds()]
+        parts = [f.result() for f in futures]
+        if not parts:
+            return np.empty(0, dtype=np.intp), np.empty(0)
+        rows = np.concatenate([p[0] for p in parts])
+        scores = np.concatenate([p[1] for p in parts])
+        # candidates in row order, so the merge breaks ties by row like the single-process path
+        order = np.argsort(rows, kind='stable')
+        rows, scores = rows[order], scores[order]
+        idx, vals = top_k_indices(scores, k)
+        return rows[idx[0]], vals[0]
+
+    def top_k_matches(self, prefs, k=3, weights=None, breakdown=False):
+        """Same result as matching.top_k_matches (or ColumnarCatalog.top_k_matches)."""
+        rows, scores = self.top_k(prefs, k, weights)
+        picked = None
+        if breakdown:
+            sizes = self.size_categories[self.size_codes[rows]] if self.size_codes is not None else None
+            components = component_scores(self.traits[rows], prefs, sizes)
+            picked = {name: np.broadcast_to(v, scores.shape).copy() for name, v in components.items()}
+        if self._catalog is not None:
+            return MatchResult(self._catalog.frame(rows), np.arange(len(rows)), scores, picked,
+                               ids=self._catalog.ids[rows])
+        return MatchResult(self._frame, rows, scores, picked)
+
+    def close(self):
+        if self._pool is not None:
+            self._pool.shutdown()
+            self._pool = None
+            self.traits = None
+            self.size_codes = None
+            self._shm.close()
+            self._shm.unlink()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
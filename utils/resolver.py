@@ -0,0 +1,223 @@
+"""
+Breed name -> image folder resolution.
+
+BreedResolver is built once over the image folder names, the FCI breed list and any
+curated mapping (data/breed_to_folder.json). Names are reduced to a match key (accents,
+case, punctuation, plurals and the trailing ' dog' removed) and looked up in exact and
+token-order-insensitive hash tables; anything else goes through a trigram index and is
+scored by trigram overlap (Dice coefficient). Resolution never touches the filesystem.
+
+    python -m utils.resolver [--threshold 0.6] [--out data/resolver_audit.json]
+
+prints (or writes) an audit of the breeds in breed_traits.csv whose folder was resolved
+with low confidence or disagrees with the curated mapping, and exits non-zero if any of
+KNOWN_FOLDERS resolves elsewhere.
+"""
+import argparse
+import csv
+import json
+import os
+import sys
+from collections import Counter, namedtuple
+from pathlib import Path
+
+from utils.normalize import normalize_for_folder
+
+ROOT = Path(__file__).resolve().parents[1]
+IMAGES_DIR = ROOT / "data" / "images"
+FCI_FILE = IMAGES_DIR / "FCI Breeds.csv"
+MAPPING_FILE = ROOT / "data" / "breed_to_folder.json"
+TRAITS_FILE = ROOT / "data" / "breed_traits.csv"
+
+# fuzzy matches below this confidence are not used
+MIN_CONFIDENCE = 0.5
+# FCI names become aliases of the folder they match at least this well
+ALIAS_CONFIDENCE = 0.8
+# a curated mapping entry loses to a usable fuzzy match more than this much closer
+MAPPING_MARGIN = 0.05
+
+# breeds whose curated mapping is known to be wrong, with the folder they must resolve to
+KNOWN_FOLDERS = {
+    'Pointers\xa0(German\xa0Shorthaired)': 'german short- haired pointing dog',
+    'Setters\xa0(Irish)': 'irish red setter dog',
+    'Spaniels\xa0(Cocker)': 'english cocker spaniel dog',
+    'Scottish\xa0Deerhounds': 'deerhound dog',
+    'Standard\xa0Schnauzers': 'schnauzer dog',
+    'Silky\xa0Terriers': 'australian silky terrier dog',
+    'Retrievers\xa0(Labrador)': 'labrador retriever dog',
+}
+
+Resolution = namedtuple('Resolution', 'folder confidence method')
+NO_MATCH = Resolution(None, 0.0, 'none')
+
+def _trigrams(key):
+    padded = f"  {key} "
+    return {padded[i:i+3] for i in range(len(padded) - 2)}
+
+def _dice(a, b):
+    return 2.0 * len(a & b) / (len(a) + len(b)) if a and b else 0.0
+
+class BreedResolver:
+    """Resolve breed names to image folders with a confidence in [0, 1]."""
+
+    def __init__(self, folders, mapping=None, aliases=()):
+        self.folders = sorted(folders)
+        self.mapping = {}
+        self._vocab = set()
+        for folder in self.folders:
+            self._vocab.update(self._base_key(folder).split())
+        self._exact = {}
+        self._tokens = {}
+        self._grams = []
+        self._index = {}
+        for i, folder in enumerate(self.folders):
+            key = self.key(folder)
+            self._exact.setdefault(key, folder)
+            self._tokens.setdefault(self._token_key(key), folder)
+            grams = _trigrams(key)
+            self._grams.append(grams)
+            for g in grams:
+                self._index.setdefault(g, []).append(i)
+        for name in aliases:
+            res = self._match(self.key(name))
+            if res.confidence >= ALIAS_CONFIDENCE:
+                self._exact.setdefault(self.key(name), res.folder)
+        folder_set = set(self.folders)
+        for name, folder in (mapping or {}).items():
+            if folder in folder_set:
+                self.mapping[name] = folder
+        self._cache = {}
+
+    @staticmethod
+    def _base_key(name):
+        key = normalize_for_folder(name)
+        return key[:-4] if key.endswith(' dog') else key
+
+    def key(self, name):
+        """Match key of a name: normalized, ' dog' dropped, plurals singularized against the folder vocabulary."""
+        tokens = []
+        for tok in self._base_key(name).split():
+            if tok not in self._vocab and tok.endswith('s') and tok[:-1] in self._vocab:
+                tok = tok[:-1]
+            tokens.append(tok)
+        return ' '.join(tokens)
+
+    @staticmethod
+    def _token_key(key):
+        return ' '.join(sorted(key.replace('-', ' ').split()))
+
+    def _match(self, key):
+        """Best folder for a match key, ignoring the curated mapping."""
+        folder = self._exact.get(key)
+        if folder is not None:
+            return Resolution(folder, 1.0, 'exact')
+        folder = self._tokens.get(self._token_key(key))
+        if folder is not None:
+            return Resolution(folder, 0.95, 'tokens')
+        grams = _trigrams(key)
+        hits = Counter()
+        for g in grams:
+            for i in self._index.get(g, ()):
+                hits[i] += 1
+        best, best_score = None, 0.0
+        for i, shared in hits.items():
+            score = 2.0 * shared / (len(grams) + len(self._grams[i]))
+            if score > best_score or (score == best_score and best is not None and self.folders[i] < best):
+                best, best_score = self.folders[i], score
+        if best is None:
+            return NO_MATCH
+        return Resolution(best, round(best_score, 4), 'fuzzy')
+
+    def resolve(self, name):
+        """
+        Resolution(folder, confidence, method) for a breed name. Exact and token matches
+        win; otherwise a curated mapping entry is used (its confidence is the name's
+        trigram similarity to the mapped folder) unless the best fuzzy match is usable and
+        more than MAPPING_MARGIN closer; otherwise the best fuzzy match, or no folder when
+        that is below MIN_CONFIDENCE.
+        """
+        res = self._cache.get(name)
+        if res is not None:
+            return res
+        key = self.key(name)
+        res = self._match(key)
+        mapped = self.mapping.get(name) if res.method == 'fuzzy' else None
+        if mapped is not None:
+            confidence = round(_dice(_trigrams(key), _trigrams(self.key(mapped))), 4)
+            if res.confidence < MIN_CONFIDENCE or res.confidence - confidence <= MAPPING_MARGIN:
+                res = Resolution(mapped, confidence, 'mapping')
+        elif res.method == 'fuzzy' and res.confidence < MIN_CONFIDENCE:
+            res = Resolution(None, res.confidence, 'none')
+        self._cache[name] = res
+        return res
+
+    def folder(self, name):
+        return self.resolve(name).folder
+
+    def audit(self, names, threshold=0.6):
+        """Resolutions below `threshold` confidence or disagreeing with the curated mapping."""
+        rows = []
+        for name in names:
+            res = self.resolve(name)
+            mapped = self.mapping.get(name)
+            best = self._match(self.key(name))
+            low = res.confidence < threshold
+            disagrees = mapped is not None and mapped != res.folder
+            if low or disagrees:
+                rows.append({'breed': name, 'folder': res.folder, 'confidence': res.confidence,
+                             'method': res.method, 'mapping': mapped,
+                             'best_match': best.folder, 'best_confidence': best.confidence,
+                             'low_confidence': low, 'mapping_overridden': disagrees})
+        return sorted(rows, key=lambda r: r['confidence'])
+
+def image_folders(images_dir=IMAGES_DIR):
+    return [e.name for e in os.scandir(images_dir) if e.is_dir()]
+
+def fci_names(path=FCI_FILE):
+    if not Path(path).exists():
+        return []
+    with open(path, encoding='utf8', newline='') as f:
+        return [row['name'] for row in csv.DictReader(f) if row.get('name')]
+
+def load_mapping(path=MAPPING_FILE):
+    path = Path(path)
+    return json.loads(path.read_text(encoding='utf8')) if path.exists() else {}
+
+def build_resolver(folders=None, mapping=None, images_dir=IMAGES_DIR):
+    """Resolver over the given folder names (default: the image tree), the FCI names and the mapping."""
+    if folders is None:
+        folders = image_folders(images_dir)
+    if mapping is None:
+        mapping = load_mapping()
+    return BreedResolver(folders, mapping, aliases=fci_names())
+
+def check_known(resolver, known=KNOWN_FOLDERS):
+    """(breed, expected, resolved) for each known breed whose folder exists but is not the one resolved."""
+    folders = set(resolver.folders)
+    return [(name, folder, resolver.folder(name)) for name, folder in known.items()
+            if folder in folders and resolver.folder(name) != folder]
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument('--threshold', type=float, default=0.6)
+    parser.add_argument('--out', default=None, help='write the audit as JSON instead of printing it')
+    args = parser.parse_args()
+    with open(TRAITS_FILE, encoding='utf8', newline='') as f:
+        breeds = [row['Breed'] for row in csv.DictReader(f)]
+    resolver = build_resolver()
+    rows = resolver.audit(breeds, args.threshold)
+    if args.out:
+        Path(args.out).write_text(json.dumps(rows, indent=1, ensure_ascii=False), encoding='utf8')
+    for r in rows:
+        flags = ', '.join(f for f in ('low_confidence', 'mapping_overridden') if r[f])
+        print(f"{r['confidence']:.2f}  {r['breed']!r} -> {r['folder']!r} ({r['method']}; {flags}; "
+              f"mapping={r['mapping']!r}, best={r['best_match']!r} {r['best_confidence']:.2f})")
+    print(f"{len(rows)} of {len(breeds)} breeds flagged")
+    wrong = check_known(resolver)
+    for name, expected, got in wrong:
+        print(f"WRONG  {name!r} -> {got!r}, expected {expected!r}")
+    if wrong:
+        sys.exit(1)
+
+if __name__ == '__main__':
+    main()
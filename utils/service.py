@@ -0,0 +1,308 @@
+"""
+Local JSON matching service.
+
+A small asyncio HTTP/1.1 server around utils.matching (standard library only):
+
+    POST /match        {"prefs": {...}, "k": 3}            -> ranked breeds and scores
+    POST /social_post  {"prefs": {...}, "breed": optional} -> generate_social_post text
+    GET  /metrics                                          -> counters and latency summary
+    GET  /healthz
+
+Match requests arriving within a short window are gathered and scored together with
+matching.batch_top_k on a worker thread, straight from the compiled snapshot's trait
+matrix. Connections are kept alive, and requests are rejected with 503 once too many are
+pending. With utils.instrument enabled, /metrics also reports its spans and counters.
+
+    python -m utils.service [--host 127.0.0.1] [--port 8765] [--window-ms 2] [--no-batch]
+"""
+import argparse
+import asyncio
+import json
+import math
+import time
+from collections import Counter, deque
+
+import numpy as np
+
+from utils import instrument
+from utils.matching import COMPONENTS, MatchResult, batch_top_k, score_matrix, top_k_matches
+from utils.snapshot import current_snapshot
+from utils.social_post import generate_social_post
+
+MAX_K = 50
+MAX_BODY = 64 * 1024
+IDLE_TIMEOUT = 15.0
+_BOOL_PREFS = ('children', 'allergies', 'other_dogs')
+_TEXT_PREFS = ('home', 'size_pref')
+
+class HTTPError(Exception):
+    def __init__(self, status, message):
+        super().__init__(message)
+        self.status = status
+
+def clean_prefs(prefs):
+    """
+    Checked copy of a request's prefs: the scoring keys only, yes/no fields as booleans,
+    levels as finite numbers (numeric strings accepted). Raises HTTPError 400 otherwise.
+    """
+    out = {}
+    for _, key in COMPONENTS:
+        value = prefs.get(key)
+        if value is None:
+            continue
+        if key in _BOOL_PREFS:
+            if not isinstance(value, (bool, int)):
+                raise HTTPError(400, f"'{key}' must be a boolean")
+            value = bool(value)
+        elif key in _TEXT_PREFS:
+            if not isinstance(value, str):
+                raise HTTPError(400, f"'{key}' must be a string")
+        else:
+            if isinstance(value, str):
+                try:
+                    value = float(value)
+                except ValueError:
+                    raise HTTPError(400, f"'{key}' must be a number")
+            if isinstance(value, bool) or not isinstance(value, (int, float)) or not math.isfinite(value):
+                raise HTTPError(400, f"'{key}' must be a number")
+        out[key] = value
+    return out
+
+class Metrics:
+    """In-process counters plus a window of recent request latencies."""
+
+    def __init__(self, window=10000):
+        self.counters = Counter()
+        self.batch_sizes = Counter()
+        self.latencies = deque(maxlen=window)
+        self.started = time.time()
+
+    def snapshot(self, pending):
+        lat = np.array(self.latencies) * 1000 if self.latencies else np.zeros(1)
+        return {
+            'uptime_s': round(time.time() - self.started, 1),
+            'counters': dict(self.counters),
+            'pending': pending,
+            'batch_sizes': {str(k): v for k, v in sorted(self.batch_sizes.items())},
+            'latency_ms': {'p50': round(float(np.percentile(lat, 50)), 3),
+                           'p95': round(float(np.percentile(lat, 95)), 3),
+                           'p99': round(float(np.percentile(lat, 99)), 3),
+                           'max': round(float(lat.max()), 3)},
+        }
+
+class MicroBatcher:
+    """Gathers match requests for up to `window` seconds (or max_batch) and scores them together."""
+
+    def __init__(self, window=0.002, max_batch=256, metrics=None):
+        self.window = window
+        self.max_batch = max_batch
+        self.metrics = metrics or Metrics()
+        self._queue = asyncio.Queue()
+        self._task = None
+
+    def start(self):
+        self._task = asyncio.get_running_loop().create_task(self._run())
+
+    async def submit(self, prefs, k):
+        fut = asyncio.get_running_loop().create_future()
+        await self._queue.put((prefs, k, fut))
+        return await fut
+
+    async def _run(self):
+        loop = asyncio.get_running_loop()
+        while True:
+            batch = [await self._queue.get()]
+            deadline = loop.time() + self.window
+            while len(batch) < self.max_batch:
+                timeout = deadline - loop.time()
+                if timeout <= 0:
+                    break
+                try:
+                    batch.append(await asyncio.wait_for(self._queue.get(), timeout))
+                except asyncio.TimeoutError:
+                    break
+            self.metrics.batch_sizes[len(batch)] += 1
+            try:
+                catalog = current_snapshot()
+            except Exception as e:
+                # e.g. a failed rebuild: fail this batch, keep serving the next ones
+                for _, _, fut in batch:
+                    if not fut.done():
+                        fut.set_exception(e)
+                continue
+            k = max(item[1] for item in batch)
+            try:
+                idx, scores = await loop.run_in_executor(
+                    None, batch_top_k, catalog, [item[0] for item in batch], k)
+            except Exception:
+                # score one by one so a bad request only fails itself
+                for prefs, k_i, fut in batch:
+                    try:
+                        result = await loop.run_in_executor(None, top_k_matches, catalog, prefs, k_i)
+                    except Exception as e:
+                        if not fut.done():
+                            fut.set_exception(e)
+                    else:
+                        if not fut.done():
+                            fut.set_result(result)
+                continue
+            for i, (_, k_i, fut) in enumerate(batch):
+                if not fut.done():
+                    fut.set_result(MatchResult(catalog, idx[i, :k_i], scores[i, :k_i]))
+
+class MatchService:
+    def __init__(self, window=0.002, max_batch=256, max_pending=1024, batching=True):
+        self.metrics = Metrics()
+        self.batcher = MicroBatcher(window, max_batch, self.metrics) if batching else None
+        self.max_pending = max_pending
+        self.pending = 0
+
+    async def match(self, prefs, k):
+        if self.batcher is not None:
+            return await self.batcher.submit(prefs, k)
+        catalog = current_snapshot()
+        return await asyncio.get_running_loop().run_in_executor(
+            None, top_k_matches, catalog, prefs, k)
+
+    async def handle(self, method, path, body):
+        """Route one request; returns (status, JSON-able payload)."""
+        if method == 'GET' and path == '/healthz':
+            return 200, {'ok': True, 'catalog_version': current_snapshot().version}
+        if method == 'GET' and path == '/metrics':
+            payload = self.metrics.snapshot(self.pending)
+            if instrument.enabled():
+                payload['instrumentation'] = instrument.snapshot()
+            return 200, payload
+        if method != 'POST' or path not in ('/match', '/social_post'):
+            raise HTTPError(404, f"no route for {method} {path}")
+        try:
+            req = json.loads(body or b'{}')
+        except ValueError:
+            raise HTTPError(400, "body is not valid JSON")
+        prefs = req.get('prefs') if isinstance(req, dict) else None
+        if not isinstance(prefs, dict):
+            raise HTTPError(400, "'prefs' must be an object")
+        prefs = clean_prefs(prefs)
+        if path == '/match':
+            k = req.get('k', 3)
+            if isinstance(k, bool) or not isinstance(k, int) or not 1 <= k <= MAX_K:
+                raise HTTPError(400, f"'k' must be an integer in 1..{MAX_K}")
+            result = await self.match(prefs, k)
+            return 200, {'matches': [{'breed': m.breed, 'score': m.score, 'id': int(m.index)}
+                                     for m in result]}
+        breed = req.get('breed')
+        if breed is None:
+            result = await self.match(prefs, 1)
+            if not len(result):
+                raise HTTPError(404, "no breeds in catalog")
+            match = result[0]
+        else:
+            catalog = current_snapshot()
+            row = catalog.row(breed) if isinstance(breed, str) else None
+            if row is None:
+                raise HTTPError(404, f"unknown breed {breed!r}")
+            sizes = catalog.sizes[row:row + 1] if catalog.sizes is not None else None
+            score = score_matrix(catalog.traits[row:row + 1], prefs, sizes=sizes)[0]
+            match = MatchResult(catalog, [row], [score])[0]
+        return 200, {'breed': match.breed, 'score': match.score,
+                     'post': generate_social_post(match, prefs)}
+
+    async def serve_connection(self, reader, writer):
+        try:
+            while True:
+                try:
+                    request_line = await asyncio.wait_for(reader.readline(), IDLE_TIMEOUT)
+                except asyncio.TimeoutError:
+                    break
+                if not request_line.strip():
+                    break
+                started = time.perf_counter()
+                method, path, version = (request_line.decode('latin-1').split() + ['', '', ''])[:3]
+                headers = {}
+                while True:
+                    line = await reader.readline()
+                    if line in (b'\r\n', b'\n', b''):
+                        break
+                    name, _, value = line.decode('latin-1').partition(':')
+                    headers[name.strip().lower()] = value.strip()
+                keep_alive = (headers.get('connection', '').lower() != 'close'
+                              and (version == 'HTTP/1.1' or headers.get('connection', '').lower() == 'keep-alive'))
+                try:
+                    length = int(headers.get('content-length') or 0)
+                except ValueError:
+                    length = -1
+                if length < 0:
+                    status, payload, keep_alive = 400, {'error': 'invalid Content-Length'}, False
+                elif length > MAX_BODY:
+                    status, payload, keep_alive = 413, {'error': 'request body too large'}, False
+                else:
+                    body = await reader.readexactly(length) if length else b''
+                    status, payload = await self._dispatch(method, path.split('?', 1)[0], body)
+                data = json.dumps(payload, ensure_ascii=False).encode('utf8')
+                head = [f"HTTP/1.1 {status} {_REASONS.get(status, '')}",
+                        'Content-Type: application/json; charset=utf-8',
+                        f"Content-Length: {len(data)}",
+                        f"Connection: {'keep-alive' if keep_alive else 'close'}"]
+                if status == 503:
+                    head.append('Retry-After: 1')
+                writer.write(('\r\n'.join(head) + '\r\n\r\n').encode('latin-1') + data)
+                await writer.drain()
+                self.metrics.counters[f"status_{status}"] += 1
+                self.metrics.latencies.append(time.perf_counter() - started)
+                if not keep_alive:
+                    break
+        except (ConnectionError, asyncio.IncompleteReadError):
+            pass
+        finally:
+            writer.close()
+
+    async def _dispatch(self, method, path, body):
+        if self.pending >= self.max_pending and path != '/metrics':
+            self.metrics.counters['rejected'] += 1
+            return 503, {'error': 'server busy'}
+        self.pending += 1
+        self.metrics.counters['requests'] += 1
+        try:
+            route = path if path in _ROUTES else 'other'  # bounded set of span names
+            with instrument.span('service ' + route):
+                return await self.handle(method, path, body)
+        except HTTPError as e:
+            return e.status, {'error': str(e)}
+        except Exception as e:
+            self.metrics.counters['errors'] += 1
+            return 500, {'error': f"{type(e).__name__}: {e}"}
+        finally:
+            self.pending -= 1
+
+_ROUTES = ('/match', '/social_post', '/metrics', '/healthz')
+_REASONS = {200: 'OK', 400: 'Bad Request', 404: 'Not Found', 413: 'Payload Too Large',
+            500: 'Internal Server Error', 503: 'Service Unavailable'}
+
+async def serve(host='127.0.0.1', port=8765, **options):
+    """Run the service until cancelled."""
+    service = MatchService(**options)
+    current_snapshot()  # load the catalog before accepting traffic
+    if service.batcher is not None:
+        service.batcher.start()
+    server = await asyncio.start_server(service.serve_connection, host, port)
+    async with server:
+        await server.serve_forever()
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument('--host', default='127.0.0.1')
+    parser.add_argument('--port', type=int, default=8765)
+    parser.add_argument('--window-ms', type=float, default=2.0, help='micro-batching window')
+    parser.add_argument('--max-batch', type=int, default=256)
+    parser.add_argument('--max-pending', type=int, default=1024, help='requests in flight before 503s')
+    parser.add_argument('--no-batch', action='store_true', help='score each request on its own')
+    args = parser.parse_args()
+    print(f"serving on http://{args.host}:{args.port}")
+    try:
+        asyncio.run(serve(args.host, args.port, window=args.window_ms / 1000, max_batch=args.max_batch,
+                          max_pending=args.max_pending, batching=not args.no_batch))
+    except KeyboardInterrupt:
+        pass
+
+if __name__ == '__main__':
+    main()
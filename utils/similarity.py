@@ -0,0 +1,175 @@
+"""
+"Breeds like this one": nearest neighbours over trait vectors.
+
+SimilarityIndex scales the integer trait vectors (matching.TRAIT_COLUMNS) by per-trait
+weights, collapses identical vectors (individual dogs share a few thousand distinct
+trait profiles at most) and builds a k-d tree over the distinct points, so queries visit
+a logarithmic number of nodes rather than every row. Distances are weighted Euclidean
+(metric='l2') or weighted Manhattan (metric='l1'); ties go to the lower row.
+"""
+import heapq
+
+import numpy as np
+
+from utils.matching import TRAIT_COLUMNS, trait_matrix
+
+LEAF_SIZE = 16
+# distances are float sums of sqrt(w)-scaled traits: equal ones can differ in the last
+# bits, so they are compared at this many decimals (and radii widened to match)
+TIE_DECIMALS = 9
+# default per-trait weights; good_for_apartment is constant in breed_traits.csv
+DEFAULT_TRAIT_WEIGHTS = {c: 1.0 for c in TRAIT_COLUMNS}
+DEFAULT_TRAIT_WEIGHTS['good_for_apartment'] = 0.0
+DEFAULT_TRAIT_WEIGHTS['hypoallergenic'] = 2.0
+
+class _KDTree:
+    """
+    Static k-d tree; nodes are (start, stop, dim, split, left, right) over a permutation
+    of the points, with each node's bounding box in lo/hi for pruning.
+    """
+
+    def __init__(self, points, metric):
+        self.points = points
+        self.metric = metric
+        self.order = np.arange(len(points))
+        self.nodes = []
+        self._lo = []
+        self._hi = []
+        if len(points):
+            self._build(0, len(points))
+        self.lo = np.array(self._lo)
+        self.hi = np.array(self._hi)
+
+    def _build(self, start, stop):
+        node = len(self.nodes)
+        self.nodes.append(None)
+        idx = self.order[start:stop]
+        self._lo.append(self.points[idx].min(axis=0))
+        self._hi.append(self.points[idx].max(axis=0))
+        if stop - start <= LEAF_SIZE:
+            self.nodes[node] = (start, stop, -1, 0.0, -1, -1)
+            return node
+        pts = self.points[idx]
+        dim = int(np.argmax(pts.max(axis=0) - pts.min(axis=0)))
+        if pts[:, dim].max() == pts[:, dim].min():
+            self.nodes[node] = (start, stop, -1, 0.0, -1, -1)
+            return node
+        idx = idx[np.argsort(pts[:, dim], kind='stable')]
+        self.order[start:stop] = idx
+        mid = start + (stop - start) // 2
+        split = float(self.points[idx[mid - start], dim])
+        # keep equal values on the right so both halves are non-empty
+        vals = self.points[idx, dim]
+        mid = start + int(np.searchsorted(vals, split, side='left'))
+        if mid == start:
+            mid = start + int(np.searchsorted(vals, split, side='right'))
+        left = self._build(start, mid)
+        right = self._build(mid, stop)
+        self.nodes[node] = (start, stop, dim, split, left, right)
+        return node
+
+    def _dist(self, q, pts):
+        d = np.abs(pts - q)
+        return d.sum(axis=1) if self.metric == 'l1' else np.sqrt((d * d).sum(axis=1))
+
+    def box_distance(self, q, node):
+        """Distance from q to the bounding box of a node (0 inside it)."""
+        d = np.maximum(np.maximum(self.lo[node] - q, q - self.hi[node]), 0.0)
+        return d.sum() if self.metric == 'l1' else np.sqrt((d * d).sum())
+
+    def knn_radius(self, q, k):
+        """Distance of the k-th nearest point (inf when there are fewer than k)."""
+        heap = []  # max-heap of the best k distances (negated)
+        self._knn(0, q, k, heap)
+        return -heap[0] if len(heap) == k else np.inf
+
+    def _knn(self, node, q, k, heap):
+        start, stop, dim, split, left, right = self.nodes[node]
+        if dim < 0:
+            for d in self._dist(q, self.points[self.order[start:stop]]):
+                if len(heap) < k:
+                    heapq.heappush(heap, -d)
+                elif d < -heap[0]:
+                    heapq.heapreplace(heap, -d)
+            return
+        near, far = (left, right) if q[dim] < split else (right, left)
+        for child in (near, far):
+            if len(heap) < k or self.box_distance(q, child) <= -heap[0]:
+                self._knn(child, q, k, heap)
+
+    def within(self, q, radius):
+        """Indices and distances of all points within `radius` of q."""
+        out_idx, out_d = [], []
+        stack = [0] if self.nodes else []
+        while stack:
+            start, stop, dim, split, left, right = self.nodes[stack.pop()]
+            if dim < 0:
+                idx = self.order[start:stop]
+                d = self._dist(q, self.points[idx])
+                keep = d <= radius
+                out_idx.append(idx[keep])
+                out_d.append(d[keep])
+                continue
+            for child in (left, right):
+                if self.box_distance(q, child) <= radius:
+                    stack.append(child)
+        if not out_idx:
+            return np.empty(0, dtype=np.intp), np.empty(0)
+        return np.concatenate(out_idx), np.concatenate(out_d)
+
+class SimilarityIndex:
+    """k-nearest-row queries over a trait matrix under a weighted distance."""
+
+    def __init__(self, traits, weights=None, metric='l2'):
+        if metric not in ('l1', 'l2'):
+            raise ValueError("metric must be 'l1' or 'l2'")
+        weights = weights or DEFAULT_TRAIT_WEIGHTS
+        w = np.array([weights.get(c, 0.0) for c in TRAIT_COLUMNS], dtype=np.float64)
+        self.metric = metric
+        self.scale = w if metric == 'l1' else np.sqrt(w)
+        self.rows = len(traits)
+        points, inverse = np.unique(np.asarray(traits, dtype=np.float64) * self.scale,
+                                    axis=0, return_inverse=True)
+        inverse = inverse.reshape(-1)
+        # rows of each distinct point, in row order
+        order = np.argsort(inverse, kind='stable')
+        bounds = np.searchsorted(inverse[order], np.arange(len(points) + 1))
+        self._members = [order[bounds[i]:bounds[i + 1]] for i in range(len(points))]
+        self._point_of = inverse
+        self._tree = _KDTree(points, metric)
+
+    @classmethod
+    def from_frame(cls, df, weights=None, metric='l2'):
+        return cls(trait_matrix(df), weights, metric)
+
+    def query(self, vector, k=5, exclude=None):
+        """
+        Rows nearest to a raw trait vector (TRAIT_COLUMNS order): (rows, distances), closest
+        first, ties by row. `exclude` is a row to leave out (the query breed itself).
+        """
+        q = np.asarray(vector, dtype=np.float64) * self.scale
+        need = k + (exclude is not None)
+        # k-th nearest distinct point bounds the answer (every point holds at least one row)
+        radius = self._tree.knn_radius(q, min(need, len(self._members)))
+        points, dists = self._tree.within(q, radius + 10.0 ** -TIE_DECIMALS)
+        # members are in row order and tie on distance: only the first `need` of a point can place
+        members = [self._members[p][:need] for p in points]
+        rows = np.concatenate(members) if members else np.empty(0, dtype=np.intp)
+        row_d = np.concatenate([np.full(len(m), d) for m, d in zip(members, dists)]) if members else np.empty(0)
+        if exclude is not None:
+            keep = rows != exclude
+            rows, row_d = rows[keep], row_d[keep]
+        order = np.lexsort((rows, np.round(row_d, TIE_DECIMALS)))[:k]
+        return rows[order], row_d[order]
+
+    def neighbours_of(self, row, traits, k=5):
+        """Nearest other rows to `row` of `traits` (the matrix the index was built from)."""
+        return self.query(traits[row], k, exclude=row)
+
+    def all_neighbours(self, traits, k=5):
+        """(rows x k) int32 neighbour lists for every row (-1 padding for tiny catalogs)."""
+        out = np.full((self.rows, k), -1, dtype=np.int32)
+        for row in range(self.rows):
+            nbrs, _ = self.neighbours_of(row, traits, k)
+            out[row, :len(nbrs)] = nbrs
+        return out
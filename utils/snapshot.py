@@ -0,0 +1,413 @@
+"""
+Compiled catalog snapshot.
+
+Breed traits (as parsed by matching.load_breeds, including the derived hypoallergenic
+flag), the breed -> folder mapping and each breed's image (folder resolved by
+utils.resolver, primary image from the image manifest) are compiled into one versioned binary file:
+
+    b'DOGSNAP1' | header length (u32) | header (JSON) | column data
+
+Integer trait columns are stored as uint8, string columns as interned categories plus
+codes, and the dense scoring matrix (matching.trait_matrix) and each breed's nearest
+neighbours by traits (utils.similarity) are stored precomputed. Loading is a read plus
+np.frombuffer per column; no CSV parsing. The snapshot records the size,
+mtime and hash of its sources and is rebuilt when they change.
+
+current_snapshot() serves one shared, read-only snapshot per process (SharedCatalog):
+a watcher thread recompiles it when the sources change and publishes the new one with a
+reference swap, so requests already holding the old snapshot finish on it.
+
+    python -m utils.snapshot [--out data/catalog.snapshot]
+"""
+import argparse
+import hashlib
+import json
+import os
+import struct
+import sys
+import tempfile
+import threading
+from pathlib import Path
+
+import numpy as np
+
+ROOT = Path(__file__).resolve().parents[1]
+SNAPSHOT_FILE = ROOT / "data" / "catalog.snapshot"
+TRAITS_FILE = ROOT / "data" / "breed_traits.csv"
+MAPPING_FILE = ROOT / "data" / "breed_to_folder.json"
+SNAPSHOT_VERSION = 5
+RELOAD_INTERVAL = 2.0
+SIMILAR_K = 5
+MAGIC = b'DOGSNAP1'
+_HEADER_LEN = struct.Struct('<I')
+
+def _file_hash(path):
+    return hashlib.blake2b(Path(path).read_bytes(), digest_size=16).hexdigest()
+
+def _source_stat(path):
+    """
+    (size, mtime_ns) of a source file, None when missing. Directories (the image tree)
+    add a digest of their subfolders' mtimes, which change when images are added,
+    removed or renamed.
+    """
+    try:
+        st = os.stat(path)
+    except OSError:
+        return None
+    if not os.path.isdir(path):
+        return [st.st_size, st.st_mtime_ns]
+    h = hashlib.blake2b(digest_size=8)
+    for e in sorted(os.scandir(path), key=lambda e: e.name):
+        if e.is_dir():
+            h.update(f"{e.name}\0{e.stat().st_mtime_ns}\0".encode('utf8', 'surrogateescape'))
+    return [st.st_size, st.st_mtime_ns, h.hexdigest()]
+
+class CatalogSnapshot:
+    """
+    A loaded snapshot: `breeds` (interned names), `columns` (name -> array), `traits`
+    (uint8 scoring matrix), `neighbours` (rows x SIMILAR_K nearest rows by traits),
+    `mapping`, `folders`/`images` (breed -> image folder / primary image name, resolved by
+    utils.resolver), `folder_confidence`, `version` (content hash) and `sources` (what it
+    was compiled from). Shared between threads and sessions: treat it, including `frame`,
+    as read-only. The matching functions take it in place of the dataframe and score its
+    precomputed `traits`, so serving never needs pandas.
+    """
+
+    def __init__(self, header, columns, traits, neighbours, path=None):
+        self.path = path
+        self.version = header['version']
+        self.sources = header['sources']
+        self.column_order = header['column_order']
+        self.breeds = [sys.intern(b) for b in header['breeds']]
+        self.mapping = header['mapping']
+        self.folders = header['folders']
+        self.folder_confidence = header['folder_confidence']
+        self.images = header['images']
+        self.columns = columns
+        self.traits = traits
+        self.neighbours = neighbours
+        self._rows = {b: i for i, b in enumerate(self.breeds)}
+        self._sizes = None
+        self._frame = None
+        self._lock = threading.Lock()
+
+    def __len__(self):
+        return len(self.breeds)
+
+    @property
+    def frame(self):
+        """The catalog as a dataframe shaped like load_breeds() output; built once."""
+        if self._frame is None:
+            with self._lock:
+                if self._frame is None:
+                    import pandas as pd
+                    data = {}
+                    for name in self.column_order:
+                        if name == 'breed':
+                            data[name] = self.breeds
+                        else:
+                            col = self.columns[name]
+                            data[name] = col if col.dtype == bool or col.dtype == object else col.astype(np.int64)
+                    self._frame = pd.DataFrame(data)
+        return self._frame
+
+    @property
+    def sizes(self):
+        """Lower-cased `Size` values (matching.size_column of `frame`), or None without that column."""
+        if self._sizes is None and 'Size' in self.columns:
+            self._sizes = np.array([str(v).lower() for v in self.columns['Size']], dtype=object)
+        return self._sizes
+
+    def has_column(self, name):
+        return name == 'breed' or name in self.columns
+
+    def value(self, row, name):
+        """One cell, as `frame` would give it (integer columns as int64)."""
+        if name == 'breed':
+            return self.breeds[row]
+        col = self.columns[name]
+        value = col[row]
+        return value if col.dtype == bool or col.dtype == object else np.int64(value)
+
+    def row(self, breed):
+        """Row of a breed name, or None when it is not in the catalog."""
+        return self._rows.get(breed)
+
+    def similar(self, breed, k=SIMILAR_K):
+        """Names of up to k breeds nearest to `breed` by traits (precomputed, no scoring)."""
+        row = self._rows.get(breed)
+        if row is None:
+            return []
+        return [self.breeds[n] for n in self.neighbours[row, :k] if n >= 0]
+
+    def image_path(self, breed, images_dir):
+        """Path of a breed's primary image under images_dir, or None."""
+        name = self.images.get(breed)
+        return Path(images_dir) / self.folders[breed] / name if name else None
+
+    def is_stale(self, touched=None):
+        """
+        True when a recorded source changed (size/mtime differ and, for files, so does the
+        hash). `touched` is the caller's own dict of stats already hashed unchanged (source ->
+        stat); it is consulted and updated so touched-only files are not rehashed. The
+        snapshot itself is never written to.
+        """
+        for path, rec in self.sources.items():
+            stat = _source_stat(path)
+            if stat == rec['stat'] or (touched is not None and stat == touched.get(path)):
+                continue
+            if stat is None or rec.get('hash') is None or os.path.isdir(path):
+                return True
+            if _file_hash(path) != rec['hash']:
+                return True
+            if touched is not None:
+                touched[path] = stat
+        return False
+
+    def source_stats(self):
+        """Current stats of the recorded sources (to see whether they are still changing)."""
+        return [_source_stat(path) for path in self.sources]
+
+def build_snapshot(traits_file=TRAITS_FILE, mapping_file=MAPPING_FILE, images_dir=None,
+                   out=SNAPSHOT_FILE):
+    """Compile the catalog sources into a snapshot file and return it loaded."""
+    from pandas.api import types
+
+    from utils.image_manifest import IMAGES_DIR, MANIFEST_FILE, load_manifest
+    from utils.matching import load_breeds, trait_matrix
+    from utils.resolver import FCI_FILE, build_resolver
+    from utils.similarity import SimilarityIndex
+
+    images_dir = Path(images_dir or IMAGES_DIR)
+    df = load_breeds(str(traits_file))
+    mapping = json.loads(Path(mapping_file).read_text(encoding='utf8')) if Path(mapping_file).exists() else {}
+    manifest = load_manifest(images_dir, MANIFEST_FILE if images_dir == IMAGES_DIR else None)
+
+    sources = {}
+    for path in (traits_file, mapping_file, FCI_FILE, manifest.path):
+        if path and Path(path).exists():
+            sources[str(path)] = {'stat': _source_stat(path), 'hash': _file_hash(path)}
+    sources[str(images_dir)] = {'stat': _source_stat(images_dir), 'hash': None}
+
+    breeds = [str(b) for b in df['breed']]
+    resolver = build_resolver(manifest.folders, mapping)
+    folders, images, confidence = {}, {}, {}
+    for breed in breeds:
+        folder, confidence[breed], _ = resolver.resolve(breed)
+        if folder:
+            folders[breed] = folder
+            primary = manifest.record(folder)
+            images[breed] = primary['name'] if primary else None
+
+    specs, blobs, offset = [], [], 0
+    def add(name, arr, **extra):
+        nonlocal offset
+        arr = np.ascontiguousarray(arr)
+        specs.append(dict(name=name, dtype=arr.dtype.str, shape=list(arr.shape), offset=offset, **extra))
+        blobs.append(arr.tobytes())
+        offset += arr.nbytes
+
+    for name in df.columns:
+        if name == 'breed':
+            continue
+        col = df[name]
+        if types.is_bool_dtype(col):
+            add(name, col.to_numpy(dtype=bool))
+        elif types.is_integer_dtype(col) and col.min() >= 0 and col.max() <= 255:
+            add(name, col.to_numpy(dtype=np.uint8))
+        elif types.is_numeric_dtype(col):
+            add(name, col.to_numpy(dtype=np.float64))
+        else:
+            values = col.fillna('').astype(str)
+            categories = sorted(set(values))
+            codes = {c: i for i, c in enumerate(categories)}
+            add(name, np.array([codes[v] for v in values], dtype=np.uint16), categories=categories)
+    traits = trait_matrix(df)
+    add('__traits__', traits)
+    add('__neighbours__', SimilarityIndex(traits).all_neighbours(traits, SIMILAR_K))
+
+    h = hashlib.blake2b(digest_size=16)
+    for blob in blobs:
+        h.update(blob)
+    h.update(json.dumps([breeds, mapping, folders, images], sort_keys=True).encode('utf8'))
+    header = {'format': SNAPSHOT_VERSION, 'version': h.hexdigest(), 'sources': sources,
+              'column_order': list(df.columns), 'breeds': breeds, 'mapping': mapping,
+              'folders': folders, 'folder_confidence': confidence, 'images': images,
+              'columns': specs}
+    raw = json.dumps(header, ensure_ascii=False).encode('utf8')
+
+    out = Path(out)
+    tmp = out.with_name(out.name + '.tmp')
+    with open(tmp, 'wb') as f:
+        f.write(MAGIC)
+        f.write(_HEADER_LEN.pack(len(raw)))
+        f.write(raw)
+        for blob in blobs:
+            f.write(blob)
+    os.replace(tmp, out)
+    return read_snapshot(out)
+
+def read_snapshot(path=SNAPSHOT_FILE):
+    """Load a snapshot file; raises ValueError for foreign or outdated formats."""
+    data = Path(path).read_bytes()
+    if data[:len(MAGIC)] != MAGIC:
+        raise ValueError(f"{path} is not a catalog snapshot")
+    start = len(MAGIC) + _HEADER_LEN.size
+    if len(data) < start:
+        raise ValueError(f"{path} is truncated")
+    (length,) = _HEADER_LEN.unpack_from(data, len(MAGIC))
+    if len(data) < start + length:
+        raise ValueError(f"{path} is truncated")
+    header = json.loads(data[start:start + length].decode('utf8'))
+    if header.get('format') != SNAPSHOT_VERSION:
+        raise ValueError(f"{path} has snapshot format {header.get('format')}, expected {SNAPSHOT_VERSION}")
+    body = start + length
+    columns, traits, neighbours = {}, None, None
+    for spec in header['columns']:
+        dtype = np.dtype(spec['dtype'])
+        count = int(np.prod(spec['shape']))
+        arr = np.frombuffer(data, dtype=dtype, count=count, offset=body + spec['offset']).reshape(spec['shape'])
+        if 'categories' in spec:
+            categories = np.array([sys.intern(c) for c in spec['categories']], dtype=object)
+            arr = categories[arr]
+        if spec['name'] == '__traits__':
+            traits = arr
+        elif spec['name'] == '__neighbours__':
+            neighbours = arr
+        else:
+            columns[spec['name']] = arr
+    return CatalogSnapshot(header, columns, traits, neighbours, path)
+
+def _fallback_path(path):
+    """Where a snapshot for `path` is compiled when its own directory is read-only."""
+    tag = hashlib.blake2b(str(Path(path).resolve()).encode('utf8'), digest_size=8).hexdigest()
+    return Path(tempfile.gettempdir()) / f"{Path(path).name}-{tag}"
+
+def _try_read(path):
+    try:
+        return read_snapshot(path)
+    except (OSError, ValueError):
+        return None
+
+def load_snapshot(path=SNAPSHOT_FILE, rebuild=True):
+    """
+    Read the snapshot, (re)building it first when it is missing, outdated or stale. With a
+    read-only data directory it is compiled to (and later read from) a per-path file in
+    the temp directory instead.
+    """
+    snapshot = _try_read(path)
+    if rebuild and (snapshot is None or snapshot.is_stale()):
+        fallback = _fallback_path(path)
+        cached = _try_read(fallback)
+        if cached is not None and not cached.is_stale():
+            return cached
+        try:
+            snapshot = build_snapshot(out=path)
+        except OSError:
+            snapshot = build_snapshot(out=fallback)
+    return snapshot
+
+class SharedCatalog:
+    """
+    A published snapshot shared by every thread, read-copy-update style. get() is a plain
+    attribute read; callers keep the snapshot they got for the whole request. A daemon
+    thread checks the sources every `interval` seconds and, once a change has settled (same
+    stats on two checks, so half-written files are not compiled), loads or rebuilds the
+    snapshot off to the side and publishes it by swapping the reference. Old snapshots are
+    freed when their last reader drops them; a failed rebuild keeps the current one.
+    """
+
+    def __init__(self, path=SNAPSHOT_FILE, interval=RELOAD_INTERVAL):
+        self.path = path
+        self.interval = interval
+        self.reloads = 0
+        self.last_error = None
+        self._current = None
+        self._touched = {}  # stats of the current snapshot's sources touched without changes
+        self._lock = threading.Lock()  # serialises loads and _touched; never taken by get() once published
+        self._stop = threading.Event()
+        self._watcher = None
+
+    def get(self):
+        snap = self._current
+        if snap is None:
+            with self._lock:
+                if self._current is None:
+                    self._current = load_snapshot(self.path)
+                snap = self._current
+            self.start()
+        return snap
+
+    def reload(self):
+        """Publish a fresh snapshot if the current one is stale; returns it, else None."""
+        with self._lock:
+            old = self._current
+            if old is not None and not old.is_stale(self._touched):
+                return None
+            new = load_snapshot(self.path)
+            self._current = new
+            self._touched = {}
+            self.reloads += 1
+            return new
+
+    def start(self):
+        if self.interval and self._watcher is None:
+            with self._lock:
+                if self._watcher is None:
+                    self._watcher = threading.Thread(target=self._watch, name='catalog-watcher',
+                                                     daemon=True)
+                    self._watcher.start()
+
+    def stop(self):
+        self._stop.set()
+        if self._watcher is not None:
+            self._watcher.join()
+            self._watcher = None
+
+    def _watch(self):
+        pending = None
+        while not self._stop.wait(self.interval):
+            try:
+                with self._lock:
+                    snap = self._current
+                    stale = snap.is_stale(self._touched)
+                if not stale:
+                    pending = None
+                    continue
+                stats = snap.source_stats()
+                if stats != pending:
+                    pending = stats  # still changing: wait for it to settle
+                    continue
+                self.reload()
+                pending, self.last_error = None, None
+            except Exception as e:
+                if str(e) != str(self.last_error):
+                    print(f"catalog reload failed, keeping version {snap.version}: {e}", file=sys.stderr)
+                self.last_error = e
+
+_shared = {}
+_shared_lock = threading.Lock()
+
+def shared_catalog(path=SNAPSHOT_FILE):
+    """The process-wide SharedCatalog for a snapshot path."""
+    key = str(path)
+    shared = _shared.get(key)
+    if shared is None:
+        with _shared_lock:
+            shared = _shared.setdefault(key, SharedCatalog(path))
+    return shared
+
+def current_snapshot(path=SNAPSHOT_FILE):
+    """The currently published process-wide snapshot (loaded on first use)."""
+    return shared_catalog(path).get()
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument('--out', default=str(SNAPSHOT_FILE))
+    args = parser.parse_args()
+    snap = build_snapshot(out=args.out)
+    print(f"{len(snap)} breeds, {len(snap.traits[0])} scoring traits, version {snap.version} "
+          f"-> {args.out} ({os.path.getsize(args.out)} bytes)")
+
+if __name__ == '__main__':
+    main()
@@ -1,14 +1,30 @@
 """
 Generate social media posts for dog breed matches.
 """
+import random
 
-def generate_social_post(row, prefs=None):
+from utils import instrument
+
+# post templates, formatted with the breed name
+HEADLINES = [
+    "🐕 Meet your perfect match: {breed}!",
+    "✨ Your ideal companion: {breed}",
+    "🎯 Found my dream dog: {breed}!",
+    "💕 Perfect match: {breed}",
+]
+HASHTAGS = "#DogMatchmaker #FindYourPerfectDog #DogBreed #PetMatch #DogLovers"
+_HASHTAG_DROP = str.maketrans('', '', ' ()')
+
+@instrument.timed('generate_social_post')
+def generate_social_post(row, prefs=None, rng=None):
     """
     Generate a short, engaging social media post for a breed match.
     
     Args:
-        row: DataFrame row with breed information
+        row: DataFrame row or utils.matching.Match with breed information
         prefs: Optional preferences dict for personalized messaging
+        rng: Optional random.Random picking the headline (default: the random module),
+            for reproducible posts
     
     Returns:
         str: Social media-ready post text
@@ -25,14 +41,7 @@ def generate_social_post(row, prefs=None):
     affection = row.get('affection', 3)
     
     # Build engaging headline
-    headlines = [
-        f"🐕 Meet your perfect match: {breed_name}!",
-        f"✨ Your ideal companion: {breed_name}",
-        f"🎯 Found my dream dog: {breed_name}!",
-        f"💕 Perfect match: {breed_name}",
-    ]
-    import random
-    headline = random.choice(headlines)
+    headline = (rng or random).choice(HEADLINES).format(breed=breed_name)
     
     # Build key highlights
     highlights = []
@@ -106,16 +115,8 @@ def generate_social_post(row, prefs=None):
     post_parts.append("")
     
     # Hashtags
-    breed_hashtag = breed_name.replace(" ", "").replace("(", "").replace(")", "")
-    hashtags = [
-        f"#{breed_hashtag}",
-        "#DogMatchmaker",
-        "#FindYourPerfectDog",
-        "#DogBreed",
-        "#PetMatch",
-        "#DogLovers"
-    ]
-    post_parts.append(" ".join(hashtags))
+    breed_hashtag = breed_name.translate(_HASHTAG_DROP)
+    post_parts.append(f"#{breed_hashtag} {HASHTAGS}")
     
     return "\n".join(post_parts)
 
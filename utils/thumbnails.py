@@ -0,0 +1,205 @@
+"""
+Pre-rendered thumbnails of the breed images.
+
+Every source image is resized to a few fixed widths and re-encoded as JPEG under
+data/thumbnails/<width>/<breed folder>/<image name>.jpg. Builds run on a process pool
+and skip sources that are unchanged (same size and mtime, or same content hash) since
+the last build, as recorded in data/thumbnails/index.json.
+
+    python -m utils.thumbnails [--all-images] [--workers N]
+"""
+import argparse
+import hashlib
+import json
+import os
+import time
+from concurrent.futures import ProcessPoolExecutor, as_completed
+from pathlib import Path
+
+from utils.image_manifest import IMAGES_DIR, ImageManifest, image_candidates, load_manifest
+
+ROOT = Path(__file__).resolve().parents[1]
+THUMBS_DIR = ROOT / "data" / "thumbnails"
+THUMB_WIDTHS = (240, 480, 960)
+CARD_WIDTH = 480
+JPEG_QUALITY = 85
+INDEX_VERSION = 2
+
+def thumbnail_path(folder, name, width, thumbs_dir=THUMBS_DIR):
+    """Thumbnail of `name` in `folder`; keeps the source extension so x.jpg and x.png never collide."""
+    return Path(thumbs_dir) / str(width) / folder / (name + '.jpg')
+
+def serving_path(source, width=CARD_WIDTH, thumbs_dir=THUMBS_DIR):
+    """Thumbnail for a source image at `width` if it has been built, else the source itself."""
+    if source is None:
+        return None
+    source = Path(source)
+    thumb = thumbnail_path(source.parent.name, source.name, width, thumbs_dir)
+    return thumb if thumb.exists() else source
+
+def file_hash(path):
+    h = hashlib.blake2b(digest_size=16)
+    with open(path, 'rb') as f:
+        for block in iter(lambda: f.read(1 << 20), b''):
+            h.update(block)
+    return h.hexdigest()
+
+def render_thumbnails(source, outputs, quality=JPEG_QUALITY):
+    """
+    Resize one image to every (width, dest) in outputs. Runs in pool workers.
+    Returns (source, bytes written, error message or None).
+    """
+    from PIL import Image  # the app imports this module for serving_path only
+    written = 0
+    try:
+        with Image.open(source) as img:
+            img.load()
+            if 'A' in img.getbands() or 'transparency' in img.info:
+                # JPEG has no alpha: flatten transparent pixels onto white, not black
+                rgba = img.convert('RGBA')
+                img = Image.new('RGB', rgba.size, 'white')
+                img.paste(rgba, mask=rgba.getchannel('A'))
+            elif img.mode not in ('RGB', 'L'):
+                img = img.convert('RGB')
+            for width, dest in outputs:
+                thumb = img.copy()
+                # never upscale: thumbnail() only shrinks
+                thumb.thumbnail((width, width * 10), Image.LANCZOS)
+                os.makedirs(os.path.dirname(dest), exist_ok=True)
+                tmp = dest + '.tmp'
+                thumb.save(tmp, 'JPEG', quality=quality, optimize=True)
+                os.replace(tmp, dest)
+                written += os.path.getsize(dest)
+        return source, written, None
+    except Exception as e:
+        return source, written, f"{type(e).__name__}: {e}"
+
+class ThumbnailStore:
+    """Build state of a thumbnails directory: source -> size, mtime and content hash."""
+
+    def __init__(self, thumbs_dir=THUMBS_DIR, widths=THUMB_WIDTHS):
+        self.thumbs_dir = Path(thumbs_dir)
+        self.widths = tuple(widths)
+        self.index_file = self.thumbs_dir / 'index.json'
+        self.sources = {}
+        if self.index_file.exists():
+            try:
+                data = json.loads(self.index_file.read_text(encoding='utf8'))
+            except ValueError:
+                data = {}
+            if data.get('version') == INDEX_VERSION and tuple(data.get('widths', ())) == self.widths:
+                self.sources = data.get('sources', {})
+
+    def save(self):
+        self.thumbs_dir.mkdir(parents=True, exist_ok=True)
+        data = {'version': INDEX_VERSION, 'widths': list(self.widths), 'sources': self.sources}
+        tmp = self.index_file.with_name(self.index_file.name + '.tmp')
+        tmp.write_text(json.dumps(data, ensure_ascii=False, sort_keys=True), encoding='utf8')
+        os.replace(tmp, self.index_file)
+
+    def outputs(self, folder, name):
+        return [(w, str(thumbnail_path(folder, name, w, self.thumbs_dir))) for w in self.widths]
+
+    def is_current(self, key, path, st):
+        """True when the recorded build of `path` still matches it and all outputs exist."""
+        rec = self.sources.get(key)
+        if rec is None:
+            return False
+        folder, name = key.split('/', 1)
+        if not all(os.path.exists(dest) for _, dest in self.outputs(folder, name)):
+            return False
+        if rec['size'] == st.st_size and rec['mtime_ns'] == st.st_mtime_ns:
+            return True
+        if rec['size'] == st.st_size and rec['hash'] == file_hash(path):
+            rec['mtime_ns'] = st.st_mtime_ns  # touched but unchanged
+            return True
+        return False
+
+    def build(self, sources, workers=None, quality=JPEG_QUALITY):
+        """
+        Render thumbnails for (folder, name, path) sources that changed since the last build.
+        Returns a report dict with counts, throughput and failures.
+        """
+        started = time.perf_counter()
+        todo, skipped, built = [], 0, 0
+        failures, bytes_in, bytes_out = {}, 0, 0
+        for folder, name, path in sources:
+            key = f"{folder}/{name}"
+            try:
+                st = os.stat(path)
+                if self.is_current(key, path, st):
+                    skipped += 1
+                    continue
+                digest = file_hash(path)  # of the bytes about to be rendered
+            except OSError as e:  # e.g. removed since it was listed
+                failures[key] = f"{type(e).__name__}: {e}"
+                self.sources.pop(key, None)
+                continue
+            todo.append((key, path, st, digest))
+        if todo:
+            with ProcessPoolExecutor(max_workers=workers) as pool:
+                futures = {}
+                for key, path, st, digest in todo:
+                    folder, name = key.split('/', 1)
+                    fut = pool.submit(render_thumbnails, path, self.outputs(folder, name), quality)
+                    futures[fut] = (key, st, digest)
+                for fut in as_completed(futures):
+                    key, st, digest = futures[fut]
+                    _, written, error = fut.result()
+                    if error:
+                        failures[key] = error
+                        self.sources.pop(key, None)
+                        continue
+                    built += 1
+                    bytes_in += st.st_size
+                    bytes_out += written
+                    self.sources[key] = {'size': st.st_size, 'mtime_ns': st.st_mtime_ns,
+                                         'hash': digest}
+        self.save()
+        elapsed = time.perf_counter() - started
+        return {
+            'built': built,
+            'skipped': skipped,
+            'failed': len(failures),
+            'failures': failures,
+            'seconds': round(elapsed, 3),
+            'images_per_second': round(built / elapsed, 1) if elapsed else 0.0,
+            'bytes_in': bytes_in,
+            'bytes_out': bytes_out,
+        }
+
+def primary_sources(manifest):
+    """(folder, name, path) of every folder's primary image in an ImageManifest."""
+    for folder in sorted(manifest.folders):
+        path = manifest.primary(folder)
+        if path is not None:
+            yield folder, path.name, str(path)
+
+def all_sources(images_dir=IMAGES_DIR):
+    """(folder, name, path) of every image file under images_dir."""
+    for e in sorted(os.scandir(images_dir), key=lambda e: e.name):
+        if e.is_dir():
+            for name in image_candidates(e.path):
+                yield e.name, name, os.path.join(e.path, name)
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument('--images-dir', default=str(IMAGES_DIR))
+    parser.add_argument('--out', default=str(THUMBS_DIR))
+    parser.add_argument('--all-images', action='store_true',
+                        help='thumbnail every image, not just each folder\'s primary image')
+    parser.add_argument('--workers', type=int, default=None)
+    args = parser.parse_args()
+    if args.all_images:
+        sources = all_sources(args.images_dir)
+    elif Path(args.images_dir).resolve() == IMAGES_DIR.resolve():
+        sources = primary_sources(load_manifest())
+    else:
+        manifest = ImageManifest(args.images_dir, path=None)
+        manifest.refresh()
+        sources = primary_sources(manifest)
+    report = ThumbnailStore(args.out).build(list(sources), workers=args.workers)
+    print(json.dumps(report, indent=2, ensure_ascii=False))
+
+if __name__ == '__main__':
+    main()